@@ -0,0 +1,887 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for model_usage.py on synthetic codexbar cost payloads.
+
+Usage:
+    python bench_model_usage.py aggregate --rows 100000
+    python bench_model_usage.py providers --rows 20000 --delay 0.5
+    python bench_model_usage.py watch --rows 5000 --ticks 5
+    python bench_model_usage.py serve --rows 2000 --requests 1000
+    python bench_model_usage.py filter --rows 100000 --queries 50
+    python bench_model_usage.py memory --rows 333334
+    python bench_model_usage.py forecast --rows 1500 --lookback 30 90 365
+    python bench_model_usage.py diff --rows 10000 100000 --changes 50
+    python bench_model_usage.py startup --rows 2000 --record startup.jsonl
+    python bench_model_usage.py generate --days 365 --malformed-rate 0.01 -o payload.json
+    python bench_model_usage.py suite --check
+    python bench_model_usage.py suite --update
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import gc
+import hashlib
+import io
+import http.client
+import json
+import os
+import platform
+import random
+import statistics
+import socket
+import stat
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+BASELINE_PATH = SCRIPT_DIR / "bench_baseline.json"
+sys.path.insert(0, str(SCRIPT_DIR))
+
+import model_usage  # noqa: E402
+import model_usage_extras  # noqa: E402
+
+MODELS = [
+    "gpt-5",
+    "gpt-5-codex",
+    "gpt-5-mini",
+    "o3",
+    "claude-opus-4",
+    "claude-sonnet-4",
+    "claude-haiku-4",
+]
+
+
+def make_daily_rows(rows: int, models_per_day: int = 3, seed: int = 0) -> List[Dict[str, Any]]:
+    rng = random.Random(seed)
+    start = date.today() - timedelta(days=rows - 1)
+    daily: List[Dict[str, Any]] = []
+    for offset in range(rows):
+        picked = rng.sample(MODELS, models_per_day)
+        daily.append(
+            {
+                "date": (start + timedelta(days=offset)).isoformat(),
+                "modelsUsed": picked,
+                "modelBreakdowns": [
+                    {"modelName": model, "cost": round(rng.random() * 20, 4)} for model in picked
+                ],
+            }
+        )
+    # Shuffle so sorting is not free for the multi-pass baseline.
+    rng.shuffle(daily)
+    return daily
+
+
+# Fixed so generated payloads, and therefore report digests, do not depend on today.
+PAYLOAD_END = date(2026, 1, 31)
+
+MALFORMED_KINDS = (
+    "not-an-object",
+    "no-date",
+    "bad-date",
+    "breakdowns-not-a-list",
+    "bad-breakdown",
+    "models-used-only",
+)
+
+
+def make_payload(
+    providers: Iterable[str] = model_usage.PROVIDERS,
+    days: int = 365,
+    models_per_day: int = 3,
+    malformed_rate: float = 0.0,
+    seed: int = 0,
+    end: date = PAYLOAD_END,
+) -> List[Dict[str, Any]]:
+    """Deterministic codexbar cost payload: one date-sorted daily row per provider and day.
+
+    About ``malformed_rate`` of the rows are replaced by one of MALFORMED_KINDS,
+    which the CLI must skip or tolerate exactly like real-world junk.
+    """
+    rng = random.Random(seed)
+    start = end - timedelta(days=days - 1)
+    payload: List[Dict[str, Any]] = []
+    for provider in providers:
+        daily: List[Any] = []
+        for offset in range(days):
+            day = (start + timedelta(days=offset)).isoformat()
+            picked = rng.sample(MODELS, models_per_day)
+            breakdowns: Any = [{"modelName": model, "cost": round(rng.random() * 20, 4)} for model in picked]
+            row: Any = {
+                "date": day,
+                "totalCost": round(sum(item["cost"] for item in breakdowns), 4),
+                "modelsUsed": picked,
+                "modelBreakdowns": breakdowns,
+            }
+            if malformed_rate and rng.random() < malformed_rate:
+                kind = rng.choice(MALFORMED_KINDS)
+                if kind == "not-an-object":
+                    row = rng.choice([None, "garbage", 42, [day]])
+                elif kind == "no-date":
+                    del row["date"]
+                elif kind == "bad-date":
+                    row["date"] = rng.choice(["yesterday", day.replace("-", "/"), "2026-13-45", 20260101])
+                elif kind == "breakdowns-not-a-list":
+                    row["modelBreakdowns"] = rng.choice([None, "n/a", {"modelName": picked[0], "cost": 1.0}])
+                elif kind == "bad-breakdown":
+                    breakdowns[0] = rng.choice(
+                        [
+                            "oops",
+                            {"modelName": picked[0], "cost": "1.25"},
+                            {"modelName": None, "cost": 2.0},
+                            {"cost": 3.0},
+                        ]
+                    )
+                else:
+                    del row["modelBreakdowns"]
+            daily.append(row)
+        payload.append({"provider": provider, "daily": daily})
+    return payload
+
+
+def make_tie_payload(days: int = 30, end: date = PAYLOAD_END) -> List[Dict[str, Any]]:
+    """Two models with equal daily costs, listed out of name order, so every report has to break the tie."""
+    start = end - timedelta(days=days - 1)
+    daily = [
+        {
+            "date": (start + timedelta(days=offset)).isoformat(),
+            "modelsUsed": ["zeta", "alpha"],
+            "modelBreakdowns": [{"modelName": "zeta", "cost": 2.5}, {"modelName": "alpha", "cost": 2.5}],
+        }
+        for offset in range(days)
+    ]
+    return [{"provider": "codex", "daily": daily}]
+
+
+def make_chunk_edge_payload(days: int = 30, seed: int = 0) -> str:
+    """Payload text whose first number is cut right after its "." by --stream's first chunk boundary."""
+    payload = make_payload(days=days, seed=seed)
+    head = '[{"provider": "codex", "note": "'
+    cut = '", "sessionCostUSD": 12.'
+    pad = model_usage_extras.STREAM_CHUNK_SIZE - len(head) - len(cut)
+    first = f'{head}{"x" * pad}{cut}5, "daily": {json.dumps(payload[0]["daily"])}}}'
+    return ", ".join([first, *(json.dumps(item) for item in payload[1:])]) + "]"
+
+
+# Verbatim copies of the pre-aggregate_usage implementations, kept as the baseline.
+class ModelCost(NamedTuple):
+    model: str
+    cost: float
+
+
+def legacy_aggregate_costs(entries: Iterable[Dict[str, Any]]) -> Dict[str, float]:
+    totals: Dict[str, float] = {}
+    for entry in entries:
+        breakdowns = entry.get("modelBreakdowns")
+        if not breakdowns:
+            continue
+        if not isinstance(breakdowns, list):
+            continue
+        for item in breakdowns:
+            if not isinstance(item, dict):
+                continue
+            model = item.get("modelName")
+            cost = item.get("cost")
+            if not isinstance(model, str):
+                continue
+            if not isinstance(cost, (int, float)):
+                continue
+            totals[model] = totals.get(model, 0.0) + float(cost)
+    return totals
+
+
+def legacy_pick_current_model(entries: List[Dict[str, Any]]) -> Tuple[Optional[str], Optional[str]]:
+    if not entries:
+        return None, None
+    sorted_entries = sorted(
+        entries,
+        key=lambda entry: entry.get("date") or "",
+    )
+    for entry in reversed(sorted_entries):
+        breakdowns = entry.get("modelBreakdowns")
+        if isinstance(breakdowns, list) and breakdowns:
+            scored: List[ModelCost] = []
+            for item in breakdowns:
+                if not isinstance(item, dict):
+                    continue
+                model = item.get("modelName")
+                cost = item.get("cost")
+                if isinstance(model, str) and isinstance(cost, (int, float)):
+                    scored.append(ModelCost(model=model, cost=float(cost)))
+            if scored:
+                scored.sort(key=lambda item: item.cost, reverse=True)
+                return scored[0].model, entry.get("date") if isinstance(entry.get("date"), str) else None
+        models_used = entry.get("modelsUsed")
+        if isinstance(models_used, list) and models_used:
+            last = models_used[-1]
+            if isinstance(last, str):
+                return last, entry.get("date") if isinstance(entry.get("date"), str) else None
+    return None, None
+
+
+def legacy_latest_day_cost(entries: List[Dict[str, Any]], model: str) -> Tuple[Optional[str], Optional[float]]:
+    if not entries:
+        return None, None
+    sorted_entries = sorted(
+        entries,
+        key=lambda entry: entry.get("date") or "",
+    )
+    for entry in reversed(sorted_entries):
+        breakdowns = entry.get("modelBreakdowns")
+        if not isinstance(breakdowns, list):
+            continue
+        for item in breakdowns:
+            if not isinstance(item, dict):
+                continue
+            if item.get("modelName") == model:
+                cost = item.get("cost") if isinstance(item.get("cost"), (int, float)) else None
+                day = entry.get("date") if isinstance(entry.get("date"), str) else None
+                return day, float(cost) if cost is not None else None
+    return None, None
+
+
+def legacy_filter_by_days(entries: List[Dict[str, Any]], days: Optional[int]) -> List[Dict[str, Any]]:
+    if not days:
+        return entries
+    cutoff = date.today() - timedelta(days=days - 1)
+    filtered: List[Dict[str, Any]] = []
+    for entry in entries:
+        day = entry.get("date")
+        if not isinstance(day, str):
+            continue
+        parsed = model_usage.parse_date(day)
+        if parsed and parsed >= cutoff:
+            filtered.append(entry)
+    return filtered
+
+
+def multi_pass_current(entries: List[Dict[str, Any]]) -> Tuple[Any, ...]:
+    """The sort-twice, walk-three-times pipeline that aggregate_usage replaced."""
+    model, latest_date = legacy_pick_current_model(entries)
+    totals = legacy_aggregate_costs(entries)
+    latest = legacy_latest_day_cost(entries, model) if model else (None, None)
+    return model, latest_date, totals.get(model), latest
+
+
+def single_pass_current(entries: List[Dict[str, Any]]) -> Tuple[Any, ...]:
+    usage = model_usage.aggregate_usage(entries)
+    model, latest_date = usage.current_model()
+    latest = usage.latest_cost(model) if model else (None, None)
+    return model, latest_date, usage.totals.get(model), latest
+
+
+def best_of(fn: Callable[[], Any], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+# With grow > 0, the daily arrays start `grow` rows short and gain `grow` rows per call.
+FAKE_CODEXBAR = """#!{python}
+import json, os, sys, time
+time.sleep({delay})
+provider = sys.argv[sys.argv.index("--provider") + 1] if "--provider" in sys.argv else None
+with open({payload!r}, "r", encoding="utf-8") as handle:
+    payload = json.load(handle)
+if provider:
+    payload = [entry for entry in payload if entry.get("provider") == provider]
+if {grow}:
+    calls_path = {payload!r} + "." + str(provider) + ".calls"
+    calls = int(open(calls_path).read()) if os.path.exists(calls_path) else 0
+    with open(calls_path, "w") as handle:
+        handle.write(str(calls + 1))
+    for entry in payload:
+        entry["daily"] = sorted(entry["daily"], key=lambda row: row["date"])
+        entry["daily"] = entry["daily"][: len(entry["daily"]) - {grow} * max(0, 20 - calls)]
+sys.stdout.write(json.dumps(payload))
+"""
+
+
+def install_fake_codexbar(directory: Path, payload: List[Dict[str, Any]], delay: float, grow: int = 0) -> None:
+    payload_path = directory / "payload.json"
+    payload_path.write_text(json.dumps(payload), encoding="utf-8")
+    script = directory / "codexbar"
+    script.write_text(
+        FAKE_CODEXBAR.format(python=sys.executable, delay=delay, payload=str(payload_path), grow=grow),
+        encoding="utf-8",
+    )
+    script.chmod(script.stat().st_mode | stat.S_IEXEC)
+
+
+def run_cli(args: List[str], env: Dict[str, str]) -> str:
+    return subprocess.check_output([sys.executable, str(SCRIPT_DIR / "model_usage.py"), *args], env=env, text=True)
+
+
+def bench_aggregate(args: argparse.Namespace) -> int:
+    entries = make_daily_rows(args.rows, args.models_per_day)
+    expected = multi_pass_current(entries)
+    got = single_pass_current(entries)
+    if expected != got:
+        print(f"Mismatch: multi-pass={expected} single-pass={got}", file=sys.stderr)
+        return 1
+
+    multi = best_of(lambda: multi_pass_current(entries), args.repeat)
+    single = best_of(lambda: single_pass_current(entries), args.repeat)
+    print(f"rows={args.rows} breakdowns={args.rows * args.models_per_day}")
+    print(f"multi-pass current:  {multi * 1000:9.1f} ms")
+    print(f"single-pass current: {single * 1000:9.1f} ms  ({multi / single:.2f}x)")
+    return 0
+
+
+def bench_providers(args: argparse.Namespace) -> int:
+    """Time one `--provider all` run against one run per provider, back to back."""
+    payload = [
+        {"provider": provider, "daily": make_daily_rows(args.rows, args.models_per_day, seed=seed)}
+        for seed, provider in enumerate(model_usage.PROVIDERS)
+    ]
+    with tempfile.TemporaryDirectory() as tmp:
+        install_fake_codexbar(Path(tmp), payload, args.delay)
+        env = dict(os.environ, PATH=f"{tmp}{os.pathsep}{os.environ.get('PATH', '')}")
+        common = ["--mode", "all", "--format", "json"]
+
+        def sequential() -> List[Dict[str, Any]]:
+            return [json.loads(run_cli(["--provider", p, *common], env)) for p in model_usage.PROVIDERS]
+
+        def combined() -> List[Dict[str, Any]]:
+            return json.loads(run_cli(["--provider", "all", *common], env))["providers"]
+
+        if sequential() != combined():
+            print("Mismatch between sequential and --provider all reports.", file=sys.stderr)
+            return 1
+        seq = best_of(sequential, args.repeat)
+        par = best_of(combined, args.repeat)
+    print(f"providers={len(payload)} rows/provider={args.rows} codexbar delay={args.delay}s")
+    print(f"sequential runs:   {seq * 1000:9.1f} ms")
+    print(f"--provider all:    {par * 1000:9.1f} ms  ({seq / par:.2f}x)")
+    return 0
+
+
+def bench_watch(args: argparse.Namespace) -> int:
+    """Run --watch against a fake codexbar whose history grows on every call."""
+    payload = [{"provider": "codex", "daily": make_daily_rows(args.rows, args.models_per_day)}]
+    with tempfile.TemporaryDirectory() as tmp:
+        install_fake_codexbar(Path(tmp), payload, delay=0.0, grow=1)
+        env = dict(os.environ, PATH=f"{tmp}{os.pathsep}{os.environ.get('PATH', '')}")
+        watch = ["--watch", "0", "--watch-ticks", str(args.ticks), "--mode", "all"]
+        start = time.perf_counter()
+        lines = run_cli(watch, env).splitlines()
+        elapsed = time.perf_counter() - start
+    first = json.loads(lines[0])["changes"] if lines else {}
+    print(f"rows={args.rows} ticks={args.ticks} wall={elapsed * 1000:.1f} ms")
+    print(f"first tick: full report with {len(first.get('models', []))} models")
+    for line in lines[1:]:
+        changes = json.loads(line)["changes"]
+        print(f"delta: {len(json.dumps(changes))} bytes, models changed: {len(changes.get('models', []))}")
+    return 0 if len(lines) == args.ticks else 1
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path: str) -> None:
+        super().__init__("localhost")
+        self._socket_path = path
+
+    def connect(self) -> None:
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self._socket_path)
+
+
+def bench_serve(args: argparse.Namespace) -> int:
+    """Per-query latency of `serve` over a Unix socket vs a cold CLI process."""
+    payload = [{"provider": "codex", "daily": make_daily_rows(args.rows, args.models_per_day)}]
+    with tempfile.TemporaryDirectory() as tmp:
+        payload_path = Path(tmp) / "payload.json"
+        payload_path.write_text(json.dumps(payload), encoding="utf-8")
+        socket_path = str(Path(tmp) / "usage.sock")
+        server = subprocess.Popen(
+            [sys.executable, str(SCRIPT_DIR / "model_usage.py"), "serve", "--input", str(payload_path)]
+            + ["--socket", socket_path, "--refresh", "0"],
+            stderr=subprocess.PIPE,
+            text=True,
+        )
+        try:
+            assert server.stderr is not None
+            server.stderr.readline()  # "Serving model usage on ..."
+            conn = UnixHTTPConnection(socket_path)
+            queries = [("current", "", []), ("all", "", ["--mode", "all"]), ("all", "?days=30", ["--mode", "all", "--days", "30"])]
+            for route, query, cli in queries:
+                conn.request("GET", f"/{route}{query}")
+                served = json.loads(conn.getresponse().read())
+                direct = json.loads(run_cli(["--input", str(payload_path), "--format", "json", *cli], dict(os.environ)))
+                if served != direct:
+                    print(f"Mismatch for /{route}{query}: {served} != {direct}", file=sys.stderr)
+                    return 1
+            # Out-of-range windows are answered with 400, not a dropped connection.
+            for query in ("/all?days=0", "/all?days=99999999", "/forecast?days=99999999", "/forecast?until=9999-12-31"):
+                conn.request("GET", query)
+                resp = conn.getresponse()
+                resp.read()
+                if resp.status != 400:
+                    print(f"Expected 400 for {query}, got {resp.status}", file=sys.stderr)
+                    return 1
+
+            start = time.perf_counter()
+            for i in range(args.requests):
+                route, query, _ = queries[i % len(queries)]
+                conn.request("GET", f"/{route}{query}")
+                conn.getresponse().read()
+            served_ms = (time.perf_counter() - start) * 1000 / args.requests
+            conn.close()
+        finally:
+            server.terminate()
+            server.wait()
+        cold = best_of(lambda: run_cli(["--input", str(payload_path), "--format", "json"], dict(os.environ)), args.repeat)
+    print(f"rows={args.rows} requests={args.requests}")
+    print(f"cold CLI process:  {cold * 1000:9.3f} ms/query")
+    print(f"serve (keep-alive): {served_ms:8.3f} ms/query  ({cold * 1000 / served_ms:.0f}x)")
+    return 0
+
+
+def bench_filter(args: argparse.Namespace) -> int:
+    """Repeated --days windows: strptime scans vs ordinal scans vs DayIndex bisect."""
+    entries = make_daily_rows(args.rows, args.models_per_day)
+    windows = [1 + (i * 37) % max(1, args.rows) for i in range(args.queries)]
+    for days in windows[:5]:
+        expected = legacy_filter_by_days(entries, days)
+        if model_usage.filter_by_days(entries, days) != expected:
+            print(f"Mismatch for --days {days}", file=sys.stderr)
+            return 1
+        if model_usage_extras.DayIndex.for_entries(entries).select(entries, model_usage.day_window(days)) != expected:
+            print(f"DayIndex mismatch for --days {days}", file=sys.stderr)
+            return 1
+
+    def legacy() -> None:
+        for days in windows:
+            legacy_filter_by_days(entries, days)
+
+    def scan() -> None:
+        for days in windows:
+            model_usage.filter_by_days(entries, days)
+
+    def indexed() -> None:
+        index = model_usage_extras.DayIndex.for_entries(entries)
+        for days in windows:
+            index.select(entries, model_usage.day_window(days))
+
+    old = best_of(legacy, args.repeat)
+    new = best_of(scan, args.repeat)
+    bisected = best_of(indexed, args.repeat)
+    print(f"rows={args.rows} queries={args.queries} (shuffled payload; DayIndex build included)")
+    print(f"strptime scan:   {old * 1000:9.1f} ms")
+    print(f"ordinal scan:    {new * 1000:9.1f} ms  ({old / new:.2f}x)")
+    print(f"DayIndex bisect: {bisected * 1000:9.1f} ms  ({old / bisected:.2f}x)")
+    return 0
+
+
+def bench_memory(args: argparse.Namespace) -> int:
+    """Resident bytes per daily row: json-loaded dicts vs UsageStore columns."""
+    raw = json.dumps(make_daily_rows(args.rows, args.models_per_day))
+    gc.collect()
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    entries = json.loads(raw)
+    dict_bytes = tracemalloc.get_traced_memory()[0] - base
+    expected = model_usage.aggregate_usage(entries).totals
+    store = model_usage_extras.UsageStore.from_entries(entries)
+    del entries
+    gc.collect()
+    store_bytes = tracemalloc.get_traced_memory()[0] - base
+    tracemalloc.stop()
+    if store.aggregate().totals != expected:
+        print("UsageStore totals mismatch", file=sys.stderr)
+        return 1
+    breakdowns = len(store.item_cost)
+    print(f"rows={args.rows} breakdowns={breakdowns}")
+    print(f"dict rows:  {dict_bytes / 2**20:8.1f} MiB  {dict_bytes / args.rows:7.1f} B/row  {dict_bytes / breakdowns:6.1f} B/breakdown")
+    print(
+        f"UsageStore: {store_bytes / 2**20:8.1f} MiB  {store_bytes / args.rows:7.1f} B/row  "
+        f"{store_bytes / breakdowns:6.1f} B/breakdown  ({dict_bytes / store_bytes:.1f}x smaller)"
+    )
+    return 0
+
+
+def bench_forecast(args: argparse.Namespace) -> int:
+    """--forecast over a multi-year UsageStore: NumPy vs stdlib fit, window aggregation included."""
+    store = model_usage_extras.UsageStore.from_entries(make_daily_rows(args.rows, args.models_per_day))
+    as_of = date.today()
+    print(f"rows={args.rows} ({args.rows / 365:.1f} years) numpy={'yes' if model_usage_extras.optional_numpy() else 'no'}")
+    for lookback in args.lookback:
+        window = model_usage_extras.forecast_window(as_of, lookback)
+
+        def run() -> Dict[str, Any]:
+            columns = model_usage_extras.CostColumns()
+            store.aggregate(window, columns)
+            return model_usage_extras.forecast_costs(columns, as_of, lookback)
+
+        fast = best_of(run, args.repeat)
+        expected = run()
+        saved = model_usage_extras._numpy
+        model_usage_extras._numpy = None
+        try:
+            slow = best_of(run, args.repeat)
+            fallback = run()
+        finally:
+            model_usage_extras._numpy = saved
+        for model, item in expected.items():
+            if any(abs(a - b) > 1e-9 for a, b in zip(item, fallback[model])):
+                print(f"Mismatch for {model} at lookback {lookback}", file=sys.stderr)
+                return 1
+        print(f"lookback {lookback:4d}: numpy {fast * 1000:7.2f} ms  stdlib {slow * 1000:7.2f} ms  ({slow / fast:.1f}x)")
+    return 0
+
+
+def bench_diff(args: argparse.Namespace) -> int:
+    """Peak memory of `diff` between snapshots: flat in history size, linear in changed rows."""
+    for rows in args.rows:
+        daily = sorted(make_daily_rows(rows, args.models_per_day), key=lambda row: row["date"])
+        rng = random.Random(1)
+        head = [dict(row) for row in daily]
+        for position in rng.sample(range(rows), args.changes):
+            head[position]["modelBreakdowns"] = [dict(item, cost=item["cost"] + 1) for item in head[position]["modelBreakdowns"]]
+        last = date.fromisoformat(daily[-1]["date"])
+        for offset in range(1, args.changes + 1):
+            day = (last + timedelta(days=offset)).isoformat()
+            head.append({"date": day, "modelsUsed": ["gpt-5"], "modelBreakdowns": [{"modelName": "gpt-5", "cost": 1.0}]})
+        with tempfile.TemporaryDirectory() as tmp:
+            base_path = Path(tmp) / "base.json"
+            head_path = Path(tmp) / "head.json"
+            base_path.write_text(json.dumps([{"provider": "codex", "daily": daily}]), encoding="utf-8")
+            head_path.write_text(json.dumps([{"provider": "codex", "daily": head}]), encoding="utf-8")
+            del daily, head
+            gc.collect()
+            tracemalloc.start()
+            start = time.perf_counter()
+            changes, _, _ = model_usage_extras.diff_rows(
+                model_usage_extras.iter_snapshot_rows(str(base_path), "codex"),
+                model_usage_extras.iter_snapshot_rows(str(head_path), "codex"),
+            )
+            elapsed = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            size = base_path.stat().st_size + head_path.stat().st_size
+        if len(changes) != 2 * args.changes:
+            print(f"Expected {2 * args.changes} changes, got {len(changes)}", file=sys.stderr)
+            return 1
+        print(
+            f"rows={rows:>8} changes={len(changes):>5} files={size / 2**20:7.1f} MiB  "
+            f"peak={peak / 2**20:6.2f} MiB  time (traced)={elapsed * 1000:8.1f} ms"
+        )
+    return 0
+
+
+def import_times() -> List[Tuple[str, int, int]]:
+    """(module, self us, cumulative us) from `python -X importtime -c 'import model_usage'`."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import model_usage"],
+        cwd=SCRIPT_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    rows = []
+    for line in proc.stderr.splitlines():
+        parts = line.split("|")
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        rows.append((parts[2].strip(), int(parts[0].split(":")[1]), int(parts[1])))
+    return rows
+
+
+def bench_startup(args: argparse.Namespace) -> int:
+    """Cold-start latency: import breakdown plus end-to-end CLI runs per installed JSON backend."""
+    imports = import_times()
+    module_us = next(cumulative for name, _, cumulative in imports if name == "model_usage")
+    print(f"import model_usage: {module_us / 1000:7.1f} ms cumulative (-X importtime)")
+    for name, own, cumulative in sorted(imports, key=lambda row: row[1], reverse=True)[: args.top]:
+        print(f"  {name:<32} self {own / 1000:6.1f} ms  cumulative {cumulative / 1000:6.1f} ms")
+
+    backends = [name for name in model_usage.JSON_BACKENDS if model_usage.load_json_backend(name)[0] == name]
+    payload = [{"provider": "codex", "daily": make_daily_rows(args.rows, args.models_per_day)}]
+    record: Dict[str, Any] = {"ts": time.time(), "python": sys.version.split()[0], "rows": args.rows, "import_ms": module_us / 1000}
+    with tempfile.TemporaryDirectory() as tmp:
+        fixture = args.fixture or str(Path(tmp) / "payload.json")
+        if not args.fixture:
+            Path(fixture).write_text(json.dumps(payload), encoding="utf-8")
+        python_only = best_of(lambda: subprocess.run([sys.executable, "-c", "pass"], check=True), args.repeat)
+        print(f"python -c pass: {python_only * 1000:7.1f} ms")
+        record["python_ms"] = python_only * 1000
+        runs = [("current", ["--input", fixture]), ("all-json", ["--input", fixture, "--mode", "all", "--format", "json"])]
+        outputs: Dict[str, str] = {}
+        for backend in ["auto", *backends]:
+            env = dict(os.environ, MODEL_USAGE_JSON=backend)
+            for label, cli in runs:
+                samples = []
+                for _ in range(args.repeat):
+                    start = time.perf_counter()
+                    output = run_cli(cli, env)
+                    samples.append(time.perf_counter() - start)
+                if outputs.setdefault(label, output) != output:
+                    print(f"Output mismatch for {label} with {backend}", file=sys.stderr)
+                    return 1
+                best = min(samples) * 1000
+                print(f"{backend:<8} {label:<9} min {best:7.1f} ms  median {statistics.median(samples) * 1000:7.1f} ms")
+                record[f"{backend}_{label}_ms"] = best
+    if args.record:
+        with open(args.record, "a", encoding="utf-8") as handle:
+            handle.write(json.dumps(record) + "\n")
+    return 0
+
+
+SUITE_SIZES = (1_000, 100_000, 1_000_000)
+SUITE_PATHS = {"default": [], "stream": ["--stream"], "index": ["--index"]}
+
+
+def suite_modes(end: date, inputs: Dict[str, Path]) -> Dict[str, Tuple[Path, List[str], int]]:
+    """Mode name -> (input payload, CLI arguments, expected exit status).
+
+    ``inputs`` holds the suite payload under "payload" and the fixed edge-case
+    payloads under "empty-provider", "chunk-edge" and "tie".
+    """
+    since = (end - timedelta(days=29)).isoformat()
+    modes = {
+        "current": [],
+        "current-model": ["--model", MODELS[0]],
+        "all": ["--mode", "all"],
+        "window": ["--mode", "all", "--since", since, "--until", end.isoformat()],
+        "group-day": ["--group-by", "day"],
+        "group-week": ["--group-by", "week"],
+        "group-month": ["--group-by", "month"],
+        "forecast": ["--forecast", "14", "--until", end.isoformat()],
+        "providers-current": ["--provider", "all"],
+        "providers-all": ["--provider", "all", "--mode", "all"],
+    }
+    suite: Dict[str, Tuple[Path, List[str], int]] = {name: (inputs["payload"], argv, 0) for name, argv in modes.items()}
+    suite["providers-empty"] = (inputs["empty-provider"], ["--provider", "all", "--mode", "all"], 2)
+    suite["chunk-edge"] = (inputs["chunk-edge"], ["--provider", "all", "--mode", "all"], 0)
+    suite["tie-all"] = (inputs["tie"], ["--mode", "all"], 0)
+    suite["tie-group"] = (inputs["tie"], ["--group-by", "week"], 0)
+    suite["tie-forecast"] = (inputs["tie"], ["--forecast", "14", "--until", end.isoformat()], 0)
+    return suite
+
+
+def canonical_digest(value: Any) -> str:
+    """sha256 of a report with floats rounded to 1e-6, so NumPy and stdlib sums hash alike."""
+
+    def normalize(item: Any) -> Any:
+        if isinstance(item, float):
+            return round(item, 6) + 0.0
+        if isinstance(item, dict):
+            return {key: normalize(inner) for key, inner in item.items()}
+        if isinstance(item, list):
+            return [normalize(inner) for inner in item]
+        return item
+
+    raw = json.dumps(normalize(value), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+
+
+def run_main(argv: List[str]) -> Tuple[int, str]:
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out), contextlib.redirect_stderr(io.StringIO()):
+        status = model_usage.main(argv)
+    return status, out.getvalue()
+
+
+def run_suite(args: argparse.Namespace) -> Dict[str, Dict[str, Dict[str, Any]]]:
+    """Every mode x path at each size: best-of wall time and the digest of the JSON output."""
+    results: Dict[str, Dict[str, Dict[str, Any]]] = {}
+    providers = list(model_usage.PROVIDERS)
+    for size in args.sizes:
+        days = max(1, size // (len(providers) * args.models_per_day))
+        payload = make_payload(providers, days, args.models_per_day, args.malformed_rate, args.seed)
+        entries = model_usage.parse_daily_entries(payload[0])
+        cells: Dict[str, Dict[str, Any]] = {}
+        results[str(size)] = cells
+        # filter_by_days counts back from today; pick N so the window is the payload's last 30 days.
+        recent_days = (date.today() - PAYLOAD_END).days + 30
+        functions: Dict[str, Callable[[], Any]] = {
+            "aggregate_costs": lambda entries=entries: model_usage.aggregate_costs(entries),
+            "pick_current_model": lambda entries=entries: model_usage.pick_current_model(entries),
+            "latest_day_cost": lambda entries=entries: model_usage.latest_day_cost(entries, MODELS[0]),
+            "filter_by_days": lambda entries=entries: len(model_usage.filter_by_days(entries, recent_days)),
+        }
+        for name, fn in functions.items():
+            cells[f"fn/{name}"] = {"ms": best_of(fn, args.repeat) * 1000, "digest": canonical_digest(fn())}
+        with tempfile.TemporaryDirectory() as tmp:
+            payload_path = Path(tmp) / "payload.json"
+            payload_path.write_text(json.dumps(payload), encoding="utf-8")
+            # Same payload with the last provider's daily list emptied; --provider all
+            # reports the others and exits 2 on every path.
+            empty_path = Path(tmp) / "empty-provider.json"
+            payload[-1] = {"provider": payload[-1]["provider"], "daily": []}
+            empty_path.write_text(json.dumps(payload), encoding="utf-8")
+            edge_path = Path(tmp) / "chunk-edge.json"
+            edge_path.write_text(make_chunk_edge_payload(seed=args.seed), encoding="utf-8")
+            tie_path = Path(tmp) / "tie.json"
+            tie_path.write_text(json.dumps(make_tie_payload()), encoding="utf-8")
+            del payload, entries
+            inputs = {"payload": payload_path, "empty-provider": empty_path, "chunk-edge": edge_path, "tie": tie_path}
+            modes = suite_modes(PAYLOAD_END, inputs)
+            for mode, (mode_path, mode_args, expected_status) in modes.items():
+                digests = set()
+                for path_name, path_args in SUITE_PATHS.items():
+                    if path_name == "index":
+                        path_args = [*path_args, "--index-path", str(Path(tmp) / f"{mode}.sqlite3")]
+                    argv = ["--input", str(mode_path), "--format", "json", *mode_args, *path_args]
+                    outputs: List[str] = []
+
+                    def run() -> None:
+                        status, output = run_main(argv)
+                        if status != expected_status:
+                            raise RuntimeError(f"model_usage.py {' '.join(argv)} exited {status}")
+                        outputs.append(output)
+
+                    if path_name == "index":
+                        # Time queries against a built index, not the first ingest.
+                        run()
+                    elapsed = best_of(run, args.repeat)
+                    digest = canonical_digest(json.loads(outputs[-1]))
+                    digests.add(digest)
+                    cells[f"{mode}/{path_name}"] = {"ms": elapsed * 1000, "digest": digest}
+                    print(f"size={size:>9} {mode:<18} {path_name:<8} {elapsed * 1000:10.1f} ms  {digest}", file=sys.stderr)
+                if len(digests) != 1:
+                    raise RuntimeError(f"{mode} output differs between {', '.join(SUITE_PATHS)} at size {size}")
+    return results
+
+
+def bench_suite(args: argparse.Namespace) -> int:
+    """Regression suite: JSON output must match bench_baseline.json; timings are compared when asked."""
+    results = run_suite(args)
+    if args.update:
+        baseline = {
+            "generator": {
+                "providers": list(model_usage.PROVIDERS),
+                "modelsPerDay": args.models_per_day,
+                "malformedRate": args.malformed_rate,
+                "seed": args.seed,
+                "end": PAYLOAD_END.isoformat(),
+            },
+            "machine": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+            "results": results,
+        }
+        BASELINE_PATH.write_text(json.dumps(baseline, indent=2, sort_keys=True) + "\n", encoding="utf-8")
+        print(f"Wrote {BASELINE_PATH.name}")
+        return 0
+
+    baseline_results = json.loads(BASELINE_PATH.read_text(encoding="utf-8"))["results"] if args.check else {}
+    failures = 0
+    for size, cells in results.items():
+        for name, cell in cells.items():
+            expected = baseline_results.get(size, {}).get(name)
+            note = ""
+            if expected is not None:
+                ratio = cell["ms"] / expected["ms"] if expected["ms"] else 1.0
+                note = f"  {ratio:5.2f}x baseline"
+                if cell["digest"] != expected["digest"]:
+                    note += "  OUTPUT CHANGED"
+                    failures += 1
+                elif args.max_slowdown and ratio > args.max_slowdown:
+                    note += "  SLOWER"
+                    failures += 1
+            print(f"size={size:>9} {name:<27} {cell['ms']:10.1f} ms{note}")
+    if failures:
+        print(f"{failures} regression(s) against {BASELINE_PATH.name}", file=sys.stderr)
+        return 1
+    return 0
+
+
+def bench_generate(args: argparse.Namespace) -> int:
+    payload = make_payload(args.providers, args.days, args.models_per_day, args.malformed_rate, args.seed, args.end)
+    raw = json.dumps(payload, indent=2 if args.pretty else None)
+    if args.output in (None, "-"):
+        sys.stdout.write(raw + "\n")
+    else:
+        Path(args.output).write_text(raw + "\n", encoding="utf-8")
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark model_usage.py.")
+    sub = parser.add_subparsers(dest="bench", required=True)
+    aggregate = sub.add_parser("aggregate", help="Single-pass aggregation vs the old multi-pass pipeline.")
+    aggregate.add_argument("--rows", type=int, default=100_000, help="Synthetic daily rows.")
+    providers = sub.add_parser("providers", help="--provider all vs one run per provider (fake codexbar).")
+    providers.add_argument("--rows", type=int, default=20_000, help="Synthetic daily rows per provider.")
+    providers.add_argument("--delay", type=float, default=0.5, help="Fake codexbar startup latency (s).")
+    watch = sub.add_parser("watch", help="--watch deltas against a growing fake codexbar payload.")
+    watch.add_argument("--rows", type=int, default=5_000, help="Synthetic daily rows.")
+    watch.add_argument("--ticks", type=int, default=5)
+    serve = sub.add_parser("serve", help="Query latency of `serve` vs cold CLI processes.")
+    serve.add_argument("--rows", type=int, default=2_000, help="Synthetic daily rows.")
+    serve.add_argument("--requests", type=int, default=1_000)
+    filter_ = sub.add_parser("filter", help="filter_by_days windows vs DayIndex bisect.")
+    filter_.add_argument("--rows", type=int, default=100_000, help="Synthetic daily rows.")
+    filter_.add_argument("--queries", type=int, default=50, help="--days windows per run.")
+    memory = sub.add_parser("memory", help="Bytes per row: dict rows vs UsageStore.")
+    memory.add_argument("--rows", type=int, default=333_334, help="Synthetic daily rows (x3 breakdowns ~ 1M).")
+    startup = sub.add_parser("startup", help="Import time and end-to-end cold starts per JSON backend.")
+    startup.add_argument("--rows", type=int, default=2_000, help="Synthetic daily rows in the fixture.")
+    startup.add_argument("--fixture", help="Use this codexbar JSON file instead of a synthetic one.")
+    startup.add_argument("--top", type=int, default=8, help="Slowest imports to list.")
+    startup.add_argument("--record", help="Append a JSON line with the results to this file.")
+    forecast = sub.add_parser("forecast", help="--forecast fit on a multi-year store: NumPy vs stdlib.")
+    forecast.add_argument("--rows", type=int, default=1_500, help="Synthetic daily rows (one per day).")
+    forecast.add_argument("--lookback", type=int, nargs="+", default=[30, 90, 365], help="--forecast DAYS values.")
+    diff = sub.add_parser("diff", help="Peak memory and time of `diff` between two snapshots.")
+    diff.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000], help="Synthetic daily rows per snapshot.")
+    diff.add_argument("--changes", type=int, default=50, help="Rows revised and rows appended in the head snapshot.")
+    generate = sub.add_parser("generate", help="Write a deterministic synthetic codexbar cost payload.")
+    generate.add_argument("--providers", nargs="+", default=list(model_usage.PROVIDERS))
+    generate.add_argument("--days", type=int, default=365, help="Daily rows per provider.")
+    generate.add_argument("--end", type=model_usage.parse_iso_date, default=PAYLOAD_END, help="Last day (YYYY-MM-DD).")
+    generate.add_argument("--pretty", action="store_true")
+    generate.add_argument("-o", "--output", help="Output file (default: stdout).")
+    suite = sub.add_parser("suite", help="Every mode at 1k/100k/1M breakdown rows against bench_baseline.json.")
+    suite.add_argument("--sizes", type=int, nargs="+", default=list(SUITE_SIZES), help="Breakdown rows per payload.")
+    suite.add_argument("--check", action="store_true", help="Fail when output digests differ from the baseline.")
+    suite.add_argument("--update", action="store_true", help="Rewrite bench_baseline.json from this run.")
+    suite.add_argument(
+        "--max-slowdown",
+        type=float,
+        default=0.0,
+        help="With --check, also fail when a timing exceeds this multiple of the baseline (same machine only).",
+    )
+    for bench in (generate, suite):
+        bench.add_argument("--malformed-rate", type=float, default=0.01, help="Fraction of junk daily rows.")
+        bench.add_argument("--seed", type=int, default=0)
+    for bench in (aggregate, providers, watch, serve, filter_, memory, startup, forecast, diff, generate, suite):
+        bench.add_argument("--models-per-day", type=int, default=3)
+        bench.add_argument("--repeat", type=int, default=3)
+    # After --repeat exists: set_defaults only overrides arguments already added.
+    suite.set_defaults(repeat=1)
+    args = parser.parse_args()
+
+    if args.bench == "providers":
+        return bench_providers(args)
+    if args.bench == "watch":
+        return bench_watch(args)
+    if args.bench == "serve":
+        return bench_serve(args)
+    if args.bench == "filter":
+        return bench_filter(args)
+    if args.bench == "memory":
+        return bench_memory(args)
+    if args.bench == "startup":
+        return bench_startup(args)
+    if args.bench == "forecast":
+        return bench_forecast(args)
+    if args.bench == "diff":
+        return bench_diff(args)
+    if args.bench == "generate":
+        return bench_generate(args)
+    if args.bench == "suite":
+        return bench_suite(args)
+    return bench_aggregate(args)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -10,61 +10,169 @@ from __future__ import annotations
 import argparse
 import json
 import os
-import subprocess
 import sys
-from dataclasses import dataclass
+from contextlib import contextmanager
 from datetime import date, datetime, timedelta
-from typing import Any, Dict, Iterable, List, Optional, Tuple
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+if TYPE_CHECKING:
+    from model_usage_extras import CostColumns, StageTimer
+
+# This file runs as __main__, which Python compiles from source on every start,
+# so it only holds the default report path. --stream, --index, --group-by,
+# --forecast, --watch, --timings, serve and diff live in model_usage_extras.py
+# (bytecode-cached, loaded by extras() on first use). Everything else
+# (subprocess, sqlite3, numpy, orjson/msgspec, ...) is imported by the code
+# paths that need it: this script runs from shell prompts and status bars,
+# where startup time dominates.
+
+PROVIDERS = ("codex", "claude")
+MULTI_PROVIDER_OBJECT = "Expected codexbar cost JSON array for multiple providers."
+
+GROUP_BY_CHOICES = ("day", "week", "month")
+
+# Whole-document parsers in preference order; MODEL_USAGE_JSON picks one explicitly.
+JSON_BACKENDS = ("orjson", "msgspec", "json")
+# Below this size importing orjson/msgspec costs more than it saves (bench_model_usage.py startup).
+FAST_JSON_MIN_BYTES = 2 * 1024 * 1024
+
+_UNSET: Any = object()
+_json_backend: Any = _UNSET
+
+# Set by --timings or MODEL_USAGE_TIMINGS=1; stage() is a no-op otherwise.
+_timer: Optional[StageTimer] = None
+
+
+def extras() -> Any:
+    """model_usage_extras, imported on first use."""
+    # It imports this module by name; when this file runs as a script, point that
+    # name at the running module so both share one _timer and one set of classes.
+    sys.modules.setdefault("model_usage", sys.modules[__name__])
+    import model_usage_extras
+
+    return model_usage_extras
+
+
+class NoUsageData(RuntimeError):
+    pass
+
+
+class ProviderNotFound(RuntimeError):
+    pass
 
 
 def eprint(msg: str) -> None:
     print(msg, file=sys.stderr)
 
 
+def load_json_backend(preferred: Optional[str] = None) -> Tuple[str, Callable[[Any], Any]]:
+    """Return (name, loads) for the fastest installed parser; stdlib json is the fallback.
+
+    ``loads`` accepts str or bytes and raises ValueError on malformed input.
+    """
+    choice = preferred or os.environ.get("MODEL_USAGE_JSON") or "auto"
+    for name in JSON_BACKENDS[:-1] if choice == "auto" else (choice,):
+        if name == "orjson":
+            try:
+                import orjson
+            except ImportError:
+                continue
+            # orjson.JSONDecodeError subclasses json.JSONDecodeError (a ValueError).
+            return name, orjson.loads
+        if name == "msgspec":
+            try:
+                import msgspec.json
+            except ImportError:
+                continue
+            decode = msgspec.json.decode
+
+            def msgspec_loads(raw: Any) -> Any:
+                try:
+                    return decode(raw)
+                except msgspec.DecodeError as exc:
+                    raise ValueError(str(exc)) from None
+
+            return name, msgspec_loads
+    return "json", json.loads
+
+
+def parse_json(raw: Any) -> Any:
+    global _json_backend
+    if _json_backend is _UNSET:
+        preferred = os.environ.get("MODEL_USAGE_JSON") or "auto"
+        if preferred == "auto" and len(raw) < FAST_JSON_MIN_BYTES:
+            return json.loads(raw)
+        _json_backend = load_json_backend(preferred)
+    return _json_backend[1](raw)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    if _timer is None:
+        yield
+        return
+    with _timer.measure(name):
+        yield
+
+
 def run_codexbar_cost(provider: str) -> List[Dict[str, Any]]:
+    import subprocess
+
     cmd = ["codexbar", "cost", "--format", "json", "--provider", provider]
     try:
-        output = subprocess.check_output(cmd, text=True)
+        with stage("fetch"):
+            output = subprocess.check_output(cmd)
     except FileNotFoundError:
         raise RuntimeError("codexbar not found on PATH. Install CodexBar CLI first.")
     except subprocess.CalledProcessError as exc:
         raise RuntimeError(f"codexbar cost failed (exit {exc.returncode}).")
     try:
-        payload = json.loads(output)
-    except json.JSONDecodeError as exc:
+        with stage("parse"):
+            payload = parse_json(output)
+    except ValueError as exc:
         raise RuntimeError(f"Failed to parse codexbar JSON output: {exc}")
     if not isinstance(payload, list):
         raise RuntimeError("Expected codexbar cost JSON array.")
     return payload
 
 
-def load_payload(input_path: Optional[str], provider: str) -> Dict[str, Any]:
-    if input_path:
+def read_input(input_path: str) -> Any:
+    with stage("fetch"):
         if input_path == "-":
-            raw = sys.stdin.read()
+            raw = sys.stdin.buffer.read()
         else:
-            with open(input_path, "r", encoding="utf-8") as handle:
+            with open(input_path, "rb") as handle:
                 raw = handle.read()
-        data = json.loads(raw)
-    else:
-        data = run_codexbar_cost(provider)
+    with stage("parse"):
+        return parse_json(raw)
 
+
+def load_payload(input_path: Optional[str], provider: str) -> Dict[str, Any]:
+    data = read_input(input_path) if input_path else run_codexbar_cost(provider)
+    return select_provider(data, provider)
+
+
+def select_provider(data: Any, provider: str) -> Dict[str, Any]:
     if isinstance(data, dict):
+        # A single provider object only answers for the provider it names.
+        named = data.get("provider")
+        if isinstance(named, str) and named != provider:
+            raise ProviderNotFound(f"Provider '{provider}' not found in codexbar payload.")
         return data
 
     if isinstance(data, list):
         for entry in data:
             if isinstance(entry, dict) and entry.get("provider") == provider:
                 return entry
-        raise RuntimeError(f"Provider '{provider}' not found in codexbar payload.")
+        raise ProviderNotFound(f"Provider '{provider}' not found in codexbar payload.")
 
     raise RuntimeError("Unsupported JSON input format.")
 
 
-@dataclass
-class ModelCost:
-    model: str
-    cost: float
+def select_providers(data: Any, providers: Sequence[str]) -> Dict[str, Dict[str, Any]]:
+    if isinstance(data, dict) and len(providers) > 1 and not isinstance(data.get("provider"), str):
+        raise RuntimeError(MULTI_PROVIDER_OBJECT)
+    return {provider: select_provider(data, provider) for provider in providers}
 
 
 def parse_daily_entries(payload: Dict[str, Any]) -> List[Dict[str, Any]]:
@@ -83,69 +191,195 @@ def parse_date(value: str) -> Optional[date]:
         return None
 
 
+def parse_day_ordinal(value: str) -> Optional[int]:
+    """Day ordinal of a YYYY-MM-DD string; accepts what parse_date does, without strptime."""
+    if (
+        len(value) == 10
+        and value[4] == "-"
+        and value[7] == "-"
+        and value.isascii()
+        and value[:4].isdigit()
+        and value[5:7].isdigit()
+        and value[8:].isdigit()
+    ):
+        try:
+            return date(int(value[:4]), int(value[5:7]), int(value[8:])).toordinal()
+        except ValueError:
+            return None
+    # Rare non-padded forms such as "2025-1-5".
+    parsed = parse_date(value)
+    return parsed.toordinal() if parsed else None
+
+
+def parse_iso_date(value: str) -> date:
+    parsed = parse_date(value)
+    if parsed is None:
+        raise argparse.ArgumentTypeError(f"expected YYYY-MM-DD, got '{value}'")
+    return parsed
+
+
+DayWindow = Tuple[int, int]
+
+
+def day_window(days: Optional[int], since: Optional[date] = None, until: Optional[date] = None) -> Optional[DayWindow]:
+    """Inclusive day-ordinal bounds for --days/--since/--until; None when unbounded."""
+    if not days and since is None and until is None:
+        return None
+    low = date.min.toordinal()
+    high = date.max.toordinal()
+    if days:
+        low = (date.today() - timedelta(days=days - 1)).toordinal()
+    if since is not None:
+        low = max(low, since.toordinal())
+    if until is not None:
+        high = until.toordinal()
+    return low, high
+
+
 def filter_by_days(entries: List[Dict[str, Any]], days: Optional[int]) -> List[Dict[str, Any]]:
     if not days:
         return entries
-    cutoff = date.today() - timedelta(days=days - 1)
-    filtered: List[Dict[str, Any]] = []
+    return list(iter_filter_by_days(entries, days))
+
+
+def iter_filter_by_days(entries: Iterable[Dict[str, Any]], days: Optional[int]) -> Iterator[Dict[str, Any]]:
+    return iter_filter_by_window(entries, day_window(days))
+
+
+def iter_filter_by_window(entries: Iterable[Dict[str, Any]], window: Optional[DayWindow]) -> Iterator[Dict[str, Any]]:
+    if window is None:
+        yield from entries
+        return
+    low, high = window
     for entry in entries:
         day = entry.get("date")
         if not isinstance(day, str):
             continue
-        parsed = parse_date(day)
-        if parsed and parsed >= cutoff:
-            filtered.append(entry)
-    return filtered
+        ordinal = parse_day_ordinal(day)
+        if ordinal is not None and low <= ordinal <= high:
+            yield entry
 
 
-def aggregate_costs(entries: Iterable[Dict[str, Any]]) -> Dict[str, float]:
-    totals: Dict[str, float] = {}
-    for entry in entries:
-        breakdowns = entry.get("modelBreakdowns")
-        if not breakdowns:
-            continue
-        if not isinstance(breakdowns, list):
-            continue
-        for item in breakdowns:
-            if not isinstance(item, dict):
-                continue
-            model = item.get("modelName")
-            cost = item.get("cost")
-            if not isinstance(model, str):
-                continue
-            if not isinstance(cost, (int, float)):
-                continue
-            totals[model] = totals.get(model, 0.0) + float(cost)
-    return totals
+class ModelUsage:
+    """Per-model accumulator filled by aggregate_usage."""
 
+    __slots__ = ("total", "has_cost", "latest_key", "latest_date", "latest_cost", "row")
 
-def pick_current_model(entries: List[Dict[str, Any]]) -> Tuple[Optional[str], Optional[str]]:
-    if not entries:
-        return None, None
-    sorted_entries = sorted(
-        entries,
-        key=lambda entry: entry.get("date") or "",
-    )
-    for entry in reversed(sorted_entries):
+    def __init__(self) -> None:
+        self.row = 0
+        self.total = 0.0
+        self.has_cost = False
+        self.latest_key = ""
+        self.latest_date: Optional[str] = None
+        self.latest_cost: Optional[float] = None
+
+
+class UsageAggregate:
+    """Result of one pass over daily rows; every report mode reads from it."""
+
+    __slots__ = ("entry_count", "models", "daily_top", "columns")
+
+    def __init__(self, columns: Optional[CostColumns] = None) -> None:
+        self.entry_count = 0
+        # Dated (model, day, cost) rows, collected only for --group-by.
+        self.columns = columns
+        self.models: Dict[str, ModelUsage] = {}
+        # Date key ("" for undated rows) -> (model, date) picked for that day.
+        self.daily_top: Dict[str, Tuple[str, Optional[str]]] = {}
+
+    @property
+    def totals(self) -> Dict[str, float]:
+        return {model: usage.total for model, usage in self.models.items() if usage.has_cost}
+
+    def current_model(self) -> Tuple[Optional[str], Optional[str]]:
+        if not self.daily_top:
+            return None, None
+        return self.daily_top[max(self.daily_top)]
+
+    def latest_cost(self, model: str) -> Tuple[Optional[str], Optional[float]]:
+        usage = self.models.get(model)
+        if usage is None:
+            return None, None
+        return usage.latest_date, usage.latest_cost
+
+
+def aggregate_usage(entries: Iterable[Dict[str, Any]], columns: Optional[CostColumns] = None) -> UsageAggregate:
+    """Walk daily rows once, without sorting.
+
+    Later rows win ties on the same date, matching the stable date sort the
+    report logic is defined against. When ``columns`` is given, every costed
+    breakdown on a dated row is also appended to it for series grouping.
+    """
+    result = UsageAggregate(columns)
+    models = result.models
+    daily_top = result.daily_top
+    row = 0
+    for entry in entries:
+        row += 1
+        raw_day = entry.get("date")
+        day = raw_day if isinstance(raw_day, str) else None
+        key = day or ""
+        ordinal = 0
+        if columns is not None and day:
+            ordinal = parse_day_ordinal(day) or 0
+        top_model: Optional[str] = None
+        top_cost = 0.0
         breakdowns = entry.get("modelBreakdowns")
-        if isinstance(breakdowns, list) and breakdowns:
-            scored: List[ModelCost] = []
+        if isinstance(breakdowns, list):
             for item in breakdowns:
                 if not isinstance(item, dict):
                     continue
                 model = item.get("modelName")
+                if not isinstance(model, str):
+                    continue
                 cost = item.get("cost")
-                if isinstance(model, str) and isinstance(cost, (int, float)):
-                    scored.append(ModelCost(model=model, cost=float(cost)))
-            if scored:
-                scored.sort(key=lambda item: item.cost, reverse=True)
-                return scored[0].model, entry.get("date") if isinstance(entry.get("date"), str) else None
-        models_used = entry.get("modelsUsed")
-        if isinstance(models_used, list) and models_used:
-            last = models_used[-1]
-            if isinstance(last, str):
-                return last, entry.get("date") if isinstance(entry.get("date"), str) else None
-    return None, None
+                if type(cost) is float:
+                    value: Optional[float] = cost
+                elif isinstance(cost, (int, float)):
+                    value = float(cost)
+                else:
+                    value = None
+                usage = models.get(model)
+                if usage is None:
+                    usage = models[model] = ModelUsage()
+                # Only the first breakdown per model in a row counts as its latest cost.
+                if usage.row != row:
+                    usage.row = row
+                    if key >= usage.latest_key:
+                        usage.latest_key = key
+                        usage.latest_date = day
+                        usage.latest_cost = value
+                if value is None:
+                    continue
+                usage.total += value
+                usage.has_cost = True
+                if ordinal:
+                    columns.add(model, ordinal, value)
+                if top_model is None or value > top_cost:
+                    top_model = model
+                    top_cost = value
+        if top_model is None:
+            models_used = entry.get("modelsUsed")
+            if isinstance(models_used, list) and models_used and isinstance(models_used[-1], str):
+                top_model = models_used[-1]
+        if top_model is not None:
+            daily_top[key] = (top_model, day)
+    result.entry_count = row
+    return result
+
+
+# One-shot helpers: a single aggregate_usage pass. UsageStore only pays off when
+# the rows are kept and queried again (serve).
+def aggregate_costs(entries: Iterable[Dict[str, Any]]) -> Dict[str, float]:
+    return aggregate_usage(entries).totals
+
+
+def pick_current_model(entries: List[Dict[str, Any]]) -> Tuple[Optional[str], Optional[str]]:
+    return aggregate_usage(entries).current_model()
+
+
+def latest_day_cost(entries: List[Dict[str, Any]], model: str) -> Tuple[Optional[str], Optional[float]]:
+    return aggregate_usage(entries).latest_cost(model)
 
 
 def usd(value: Optional[float]) -> str:
@@ -154,27 +388,6 @@ def usd(value: Optional[float]) -> str:
     return f"${value:,.2f}"
 
 
-def latest_day_cost(entries: List[Dict[str, Any]], model: str) -> Tuple[Optional[str], Optional[float]]:
-    if not entries:
-        return None, None
-    sorted_entries = sorted(
-        entries,
-        key=lambda entry: entry.get("date") or "",
-    )
-    for entry in reversed(sorted_entries):
-        breakdowns = entry.get("modelBreakdowns")
-        if not isinstance(breakdowns, list):
-            continue
-        for item in breakdowns:
-            if not isinstance(item, dict):
-                continue
-            if item.get("modelName") == model:
-                cost = item.get("cost") if isinstance(item.get("cost"), (int, float)) else None
-                day = entry.get("date") if isinstance(entry.get("date"), str) else None
-                return day, float(cost) if cost is not None else None
-    return None, None
-
-
 def render_text_current(
     provider: str,
     model: str,
@@ -194,9 +407,14 @@ def render_text_current(
     return "\n".join(lines)
 
 
+def sorted_totals(totals: Dict[str, float]) -> List[Tuple[str, float]]:
+    """Highest cost first; equal totals by model name, whatever order the rows came in."""
+    return sorted(totals.items(), key=lambda item: (-item[1], item[0]))
+
+
 def render_text_all(provider: str, totals: Dict[str, float]) -> str:
     lines = [f"Provider: {provider}", "Models:"]
-    for model, cost in sorted(totals.items(), key=lambda item: item[1], reverse=True):
+    for model, cost in sorted_totals(totals):
         lines.append(f"- {model}: {usd(cost)}")
     return "\n".join(lines)
 
@@ -228,82 +446,328 @@ def build_json_all(provider: str, totals: Dict[str, float]) -> Dict[str, Any]:
         "mode": "all",
         "models": [
             {"model": model, "totalCostUSD": cost}
-            for model, cost in sorted(totals.items(), key=lambda item: item[1], reverse=True)
+            for model, cost in sorted_totals(totals)
         ],
     }
 
 
-def main() -> int:
-    parser = argparse.ArgumentParser(description="Summarize CodexBar model usage from local cost logs.")
-    parser.add_argument("--provider", choices=["codex", "claude"], default="codex")
+def build_json_providers(mode: str, reports: List[Dict[str, Any]], totals: Dict[str, float]) -> Dict[str, Any]:
+    return {
+        "mode": mode,
+        "providers": reports,
+        "combined": {
+            "totalCostUSD": sum(totals.values()),
+            "models": build_json_all(provider="all", totals=totals)["models"],
+        },
+    }
+
+
+def render_text_providers(reports: List[Dict[str, Any]], totals: Dict[str, float]) -> str:
+    blocks = [render_report(report) for report in reports]
+    label = "projected month, all models" if reports[0]["mode"] == "forecast" else "all models"
+    blocks.append(f"Combined, {label} ({len(reports)} providers): {usd(sum(totals.values()))}")
+    return "\n\n".join(blocks)
+
+
+def render_report(report: Dict[str, Any]) -> str:
+    if report["mode"] == "forecast":
+        return extras().render_text_forecast(
+            provider=report["provider"],
+            as_of=report["asOf"],
+            month_end_date=report["monthEnd"],
+            lookback=report["lookbackDays"],
+            models=report["models"],
+        )
+    if report["mode"] == "series":
+        series = {
+            item["model"]: [(point["period"], point["costUSD"]) for point in item["series"]] for item in report["models"]
+        }
+        return extras().render_text_series(provider=report["provider"], group_by=report["groupBy"], series=series)
+    if report["mode"] == "all":
+        totals = {item["model"]: item["totalCostUSD"] for item in report["models"]}
+        return render_text_all(provider=report["provider"], totals=totals)
+    return render_text_current(
+        provider=report["provider"],
+        model=report["model"],
+        latest_date=report["latestModelDate"],
+        total_cost=report["totalCostUSD"],
+        latest_cost=report["latestDayCostUSD"],
+        latest_cost_date=report["latestDayCostDate"],
+        entry_count=report["dailyRowCount"],
+    )
+
+
+def report_window(args: argparse.Namespace) -> Optional[DayWindow]:
+    if args.forecast:
+        return extras().forecast_window(args.until or date.today(), args.forecast)
+    return day_window(args.days, args.since, args.until)
+
+
+def build_report(args: argparse.Namespace, provider: str, usage: UsageAggregate) -> Dict[str, Any]:
+    if args.forecast:
+        as_of = args.until or date.today()
+        forecasts = extras().forecast_costs(usage.columns or extras().CostColumns(), as_of, args.forecast)
+        if args.model:
+            forecasts = {model: item for model, item in forecasts.items() if model == args.model}
+        if not forecasts:
+            raise NoUsageData("No dated model breakdowns found for the forecast window.")
+        return extras().build_json_forecast(provider=provider, as_of=as_of, lookback=args.forecast, forecasts=forecasts)
+
+    if args.group_by:
+        series = extras().group_series(usage.columns or extras().CostColumns(), args.group_by)
+        if not series:
+            raise NoUsageData("No dated model breakdowns found in codexbar cost payload.")
+        return extras().build_json_series(provider=provider, group_by=args.group_by, series=series)
+
+    if args.mode == "all":
+        totals = usage.totals
+        if not totals:
+            raise NoUsageData("No model breakdowns found in codexbar cost payload.")
+        return build_json_all(provider=provider, totals=totals)
+
+    model = args.model
+    latest_date = None
+    if not model:
+        model, latest_date = usage.current_model()
+    if not model:
+        raise NoUsageData("No model data found in codexbar cost payload.")
+    latest_cost_date, latest_cost = usage.latest_cost(model)
+    return build_json_current(
+        provider=provider,
+        model=model,
+        latest_date=latest_date,
+        total_cost=usage.totals.get(model),
+        latest_cost=latest_cost,
+        latest_cost_date=latest_cost_date,
+        entry_count=usage.entry_count,
+    )
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ["serve"]:
+        return extras().serve_main(argv[1:])
+    if argv[:1] == ["diff"]:
+        return extras().diff_main(argv[1:])
+
+    parser = argparse.ArgumentParser(
+        description="Summarize CodexBar model usage from local cost logs.",
+        epilog=(
+            "Run 'model_usage.py serve --help' for the local query server and "
+            "'model_usage.py diff --help' to compare two snapshots."
+        ),
+    )
+    parser.add_argument(
+        "--provider",
+        action="append",
+        choices=[*PROVIDERS, "all"],
+        help="Provider to summarize (default: codex). Repeat, or pass 'all', for a combined report.",
+    )
     parser.add_argument("--mode", choices=["current", "all"], default="current")
     parser.add_argument("--model", help="Explicit model name to report instead of auto-current.")
     parser.add_argument("--input", help="Path to codexbar cost JSON (or '-' for stdin).")
     parser.add_argument("--days", type=int, help="Limit to last N days (based on daily rows).")
+    parser.add_argument("--since", type=parse_iso_date, help="Only include daily rows on or after YYYY-MM-DD.")
+    parser.add_argument("--until", type=parse_iso_date, help="Only include daily rows on or before YYYY-MM-DD.")
+    parser.add_argument(
+        "--group-by",
+        choices=GROUP_BY_CHOICES,
+        help="Report a per-model cost series by day, ISO week or month instead of --mode.",
+    )
+    parser.add_argument(
+        "--forecast",
+        type=int,
+        metavar="DAYS",
+        help="Project spend to month end from an EWMA burn rate plus linear trend over the last DAYS days.",
+    )
     parser.add_argument("--format", choices=["text", "json"], default="text")
     parser.add_argument("--pretty", action="store_true", help="Pretty-print JSON output.")
-
-    args = parser.parse_args()
-
+    parser.add_argument(
+        "--watch",
+        type=float,
+        metavar="INTERVAL",
+        help="Stay running, refresh every INTERVAL seconds and emit changed fields as JSON lines.",
+    )
+    parser.add_argument("--watch-output", help="Append --watch JSON lines to this file instead of stdout.")
+    parser.add_argument("--watch-ticks", type=int, default=0, help="Stop --watch after N refreshes (0: run forever).")
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Stream the payload incrementally; memory stays flat regardless of history size.",
+    )
+    parser.add_argument(
+        "--index",
+        action="store_true",
+        help="Keep an on-disk cost index; only new or changed daily rows are re-ingested.",
+    )
+    parser.add_argument("--index-path", help="Index location (default: $XDG_CACHE_HOME/openclaw/model-usage).")
+    parser.add_argument(
+        "--index-only",
+        action="store_true",
+        help="Answer from the existing index without fetching codexbar data (implies --index).",
+    )
+    parser.add_argument(
+        "--rebuild-index",
+        action="store_true",
+        help="Drop the provider's indexed rows and re-ingest everything (implies --index).",
+    )
+    parser.add_argument(
+        "--timings",
+        action="store_true",
+        help="Record wall/CPU time and peak memory per stage (also MODEL_USAGE_TIMINGS=1): "
+        "to stderr, or a 'timings' key with --format json.",
+    )
+    parser.add_argument("--profile", metavar="OUT.prof", help="Write a cProfile dump of the run to this file.")
+
+    args = parser.parse_args(argv)
+    if args.forecast is not None:
+        if args.forecast < 1:
+            parser.error("--forecast needs at least 1 day of history.")
+        if args.group_by or args.days or args.since:
+            parser.error("--forecast cannot be combined with --group-by, --days or --since (--until sets the as-of day).")
+    providers = resolve_providers(args.provider)
+    args.refresh_index = args.rebuild_index or not args.index_only
+    args.index = args.index or args.index_only or args.rebuild_index
+    # Taken before the payload is read, so a file rewritten meanwhile is re-ingested next run.
+    args.input_signature = extras().input_signature(args.input) if args.index and args.input else None
+    args.window = report_window(args)
+
+    if args.watch is not None:
+        return extras().run_watch(args, providers)
+
+    global _timer
+    if args.timings or os.environ.get("MODEL_USAGE_TIMINGS", "") not in ("", "0"):
+        _timer = extras().StageTimer()
     try:
-        payload = load_payload(args.input, args.provider)
+        if not args.profile:
+            return run_report(args, providers)
+        import cProfile
+
+        profiler = cProfile.Profile()
+        try:
+            return profiler.runcall(run_report, args, providers)
+        finally:
+            profiler.dump_stats(args.profile)
+    finally:
+        if _timer is not None:
+            # In-process callers would otherwise keep paying for allocation tracing.
+            _timer.close()
+        _timer = None
+
+
+def run_report(args: argparse.Namespace, providers: List[str]) -> int:
+    try:
+        usages = collect_usages(args, providers)
     except Exception as exc:
         eprint(str(exc))
         return 1
 
-    entries = parse_daily_entries(payload)
-    entries = filter_by_days(entries, args.days)
-
-    if args.mode == "current":
-        model = args.model
-        latest_date = None
-        if not model:
-            model, latest_date = pick_current_model(entries)
-        if not model:
-            eprint("No model data found in codexbar cost payload.")
-            return 2
-        totals = aggregate_costs(entries)
-        total_cost = totals.get(model)
-        latest_cost_date, latest_cost = latest_day_cost(entries, model)
-
+    reports: List[Dict[str, Any]] = []
+    status = 0
+    with stage("aggregate"):
+        for provider in providers:
+            try:
+                reports.append(build_report(args, provider, usages[provider]))
+            except NoUsageData as exc:
+                eprint(f"{provider}: {exc}" if len(providers) > 1 else str(exc))
+                status = 2
+    if not reports:
+        return status
+
+    indent = 2 if args.pretty else None
+    with stage("render"):
+        if len(providers) == 1:
+            output: Any = reports[0]
+        else:
+            combined: Dict[str, float] = {}
+            if args.forecast:
+                for report in reports:
+                    for item in report["models"]:
+                        combined[item["model"]] = combined.get(item["model"], 0.0) + item["projectedMonthCostUSD"]
+            else:
+                for provider in providers:
+                    for model, cost in usages[provider].totals.items():
+                        combined[model] = combined.get(model, 0.0) + cost
+            output = build_json_providers(reports[0]["mode"], reports, combined)
+        if args.format == "json":
+            text = json.dumps(output, indent=indent, sort_keys=args.pretty)
+        elif len(providers) == 1:
+            text = render_report(output)
+        else:
+            text = render_text_providers(reports, combined)
+    if _timer is not None:
         if args.format == "json":
-            payload_out = build_json_current(
-                provider=args.provider,
-                model=model,
-                latest_date=latest_date,
-                total_cost=total_cost,
-                latest_cost=latest_cost,
-                latest_cost_date=latest_cost_date,
-                entry_count=len(entries),
-            )
-            indent = 2 if args.pretty else None
-            print(json.dumps(payload_out, indent=indent, sort_keys=args.pretty))
+            # Re-dumped so the render stage itself is included.
+            text = json.dumps({**output, "timings": _timer.report()}, indent=indent, sort_keys=args.pretty)
         else:
-            print(
-                render_text_current(
-                    provider=args.provider,
-                    model=model,
-                    latest_date=latest_date,
-                    total_cost=total_cost,
-                    latest_cost=latest_cost,
-                    latest_cost_date=latest_cost_date,
-                    entry_count=len(entries),
-                )
-            )
-        return 0
-
-    totals = aggregate_costs(entries)
-    if not totals:
-        eprint("No model breakdowns found in codexbar cost payload.")
-        return 2
-
-    if args.format == "json":
-        payload_out = build_json_all(provider=args.provider, totals=totals)
-        indent = 2 if args.pretty else None
-        print(json.dumps(payload_out, indent=indent, sort_keys=args.pretty))
+            eprint(extras().render_timings(_timer.report()))
+    print(text)
+    return status
+
+
+def resolve_providers(requested: Optional[List[str]]) -> List[str]:
+    if not requested:
+        return ["codex"]
+    if "all" in requested:
+        return list(PROVIDERS)
+    return list(dict.fromkeys(requested))
+
+
+def collect_usages(args: argparse.Namespace, providers: List[str]) -> Dict[str, UsageAggregate]:
+    if len(providers) == 1 or (args.profile and not args.input):
+        # cProfile only sees the calling thread, so --profile fetches providers one by one.
+        return {provider: collect_usage(args, provider) for provider in providers}
+    if args.input:
+        # One payload carries every provider: read it once and pick each out.
+        return collect_usages_from_input(args, providers)
+    from concurrent.futures import ThreadPoolExecutor
+
+    # One codexbar process per provider, fetched and parsed concurrently.
+    with ThreadPoolExecutor(max_workers=len(providers)) as pool:
+        futures = {provider: pool.submit(collect_usage, args, provider) for provider in providers}
+        return {provider: future.result() for provider, future in futures.items()}
+
+
+def collect_usage(args: argparse.Namespace, provider: str) -> UsageAggregate:
+    if args.index:
+        return extras().query_index(args, provider)
+    if args.stream:
+        return extras().stream_usage(args, provider)
+    payload = load_payload(args.input, provider)
+    with stage("parse"):
+        rows = parse_daily_entries(payload)
+    return usage_from_rows(args, provider, rows)
+
+
+def collect_usages_from_input(args: argparse.Namespace, providers: List[str]) -> Dict[str, UsageAggregate]:
+    usages: Dict[str, UsageAggregate] = {}
+    if args.index and extras().index_is_current(args, providers):
+        for provider in providers:
+            usages[provider] = extras().query_index(args, provider)
+    elif args.stream or args.index:
+        usages = extras().stream_usages(args, providers)
     else:
-        print(render_text_all(provider=args.provider, totals=totals))
-    return 0
+        payloads = select_providers(read_input(args.input), providers)
+        for provider in providers:
+            with stage("parse"):
+                rows = parse_daily_entries(payloads[provider])
+            usages[provider] = usage_from_rows(args, provider, rows)
+    return usages
+
+
+def usage_from_rows(args: argparse.Namespace, provider: str, rows: Iterable[Dict[str, Any]]) -> UsageAggregate:
+    columns = extras().CostColumns() if args.group_by or args.forecast else None
+    if not args.index:
+        if _timer is not None and isinstance(rows, list):
+            # Materialized only when timing, so filtering is measured apart from aggregation.
+            with stage("filter"):
+                rows = list(iter_filter_by_window(rows, args.window))
+            with stage("aggregate"):
+                return aggregate_usage(rows, columns)
+        # Streamed rows are fetched, parsed, filtered and aggregated in one pass.
+        with stage("aggregate" if isinstance(rows, list) else "stream"):
+            return aggregate_usage(iter_filter_by_window(rows, args.window), columns)
+    return extras().index_usage(args, provider, rows, columns)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,1636 @@
+"""
+Optional modes of model_usage.py: --stream, --index, --group-by, --forecast,
+--watch, --timings, serve and diff.
+
+Kept out of the entry script so the default report only compiles what it runs;
+model_usage.extras() imports this module on first use.
+"""
+
+from __future__ import annotations
+
+import argparse
+import bisect
+import itertools
+import json
+import os
+import re
+import sys
+import threading
+import time
+from array import array
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta, timezone
+from typing import IO, Any, Dict, Generator, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Set, Tuple
+
+from model_usage import (
+    _UNSET,
+    GROUP_BY_CHOICES,
+    MULTI_PROVIDER_OBJECT,
+    PROVIDERS,
+    DayWindow,
+    ModelUsage,
+    NoUsageData,
+    ProviderNotFound,
+    UsageAggregate,
+    build_report,
+    day_window,
+    eprint,
+    load_payload,
+    parse_daily_entries,
+    parse_day_ordinal,
+    parse_iso_date,
+    read_input,
+    report_window,
+    resolve_providers,
+    select_providers,
+    sorted_totals,
+    stage,
+    usage_from_rows,
+    usd,
+)
+
+STREAM_CHUNK_SIZE = 64 * 1024
+
+_JSON_STRUCTURAL = re.compile(r'["\[\]{}]')
+_JSON_STRING_END = re.compile(r'["\\]')
+_JSON_WHITESPACE = " \t\r\n"
+# What may still follow a number decoded at the end of the buffer ("12." or "1e" cut at a chunk edge).
+_JSON_NUMBER_TAIL = re.compile(r"[0-9.eE+-]*\Z")
+
+INDEX_SCHEMA_VERSION = 3
+
+SERVE_CACHE_LIMIT = 256
+# Largest ?days= a serve query accepts; also bounds the forecast's models x lookback grid.
+SERVE_MAX_DAYS = 36500
+
+# date(1970, 1, 1).toordinal(); converts ordinals to numpy datetime64 days.
+_EPOCH_ORDINAL = 719163
+
+_numpy: Any = _UNSET
+
+TIMING_STAGES = ("fetch", "parse", "filter", "aggregate", "stream", "index", "render")
+
+
+class StageTimer:
+    """Wall time, CPU time and tracemalloc peak per pipeline stage.
+
+    Stages must not nest. CPU time is per thread, so concurrent provider
+    fetches are attributed correctly; allocation peaks of overlapping stages
+    share one tracemalloc high-water mark.
+    """
+
+    def __init__(self) -> None:
+        import tracemalloc
+
+        self._tracemalloc = tracemalloc
+        self._lock = threading.Lock()
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+        self._peak = 0
+        self.stages: Dict[str, Dict[str, float]] = {}
+        # Only stop tracing in close() if this timer started it.
+        self._started_tracing = not tracemalloc.is_tracing()
+        if self._started_tracing:
+            tracemalloc.start()
+
+    def close(self) -> None:
+        if self._started_tracing:
+            self._tracemalloc.stop()
+            self._started_tracing = False
+
+    @contextmanager
+    def measure(self, name: str) -> Iterator[None]:
+        tracemalloc = self._tracemalloc
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        wall = time.perf_counter()
+        cpu = time.thread_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall
+            cpu = time.thread_time() - cpu
+            high_water = tracemalloc.get_traced_memory()[1]
+            peak = high_water - before
+            with self._lock:
+                self._peak = max(self._peak, high_water)
+                entry = self.stages.setdefault(name, {"calls": 0, "wallMs": 0.0, "cpuMs": 0.0, "peakBytes": 0})
+                entry["calls"] += 1
+                entry["wallMs"] += wall * 1000
+                entry["cpuMs"] += cpu * 1000
+                entry["peakBytes"] = max(entry["peakBytes"], peak)
+
+    def report(self) -> Dict[str, Dict[str, float]]:
+        order = {name: i for i, name in enumerate(TIMING_STAGES)}
+        result = {name: dict(self.stages[name]) for name in sorted(self.stages, key=lambda name: order.get(name, len(order)))}
+        result["total"] = {
+            "wallMs": (time.perf_counter() - self._wall) * 1000,
+            "cpuMs": (time.process_time() - self._cpu) * 1000,
+            "peakBytes": max(self._peak, self._tracemalloc.get_traced_memory()[1]),
+        }
+        return result
+
+
+def render_timings(timings: Dict[str, Dict[str, float]]) -> str:
+    lines = ["Timings (wall / cpu / peak memory allocated; total is the run's overall peak):"]
+    for name, entry in timings.items():
+        calls = f"  x{int(entry['calls'])}" if entry.get("calls", 1) > 1 else ""
+        lines.append(
+            f"  {name:<10}{entry['wallMs']:10.1f} ms{entry['cpuMs']:10.1f} ms{entry['peakBytes'] / 2**20:9.2f} MiB{calls}"
+        )
+    return "\n".join(lines)
+
+
+def optional_numpy() -> Any:
+    """numpy when installed, else None; imported on first use rather than at startup."""
+    global _numpy
+    if _numpy is _UNSET:
+        try:
+            import numpy
+        except ImportError:  # pragma: no cover - optional dependency
+            numpy = None
+        _numpy = numpy
+    return _numpy
+
+
+@contextmanager
+def open_codexbar_cost(provider: str) -> Iterator[IO[str]]:
+    import subprocess
+
+    cmd = ["codexbar", "cost", "--format", "json", "--provider", provider]
+    try:
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, text=True)
+    except FileNotFoundError:
+        raise RuntimeError("codexbar not found on PATH. Install CodexBar CLI first.")
+    assert proc.stdout is not None
+    try:
+        yield proc.stdout
+        # Drain whatever the reader did not need so codexbar exits cleanly.
+        while proc.stdout.read(STREAM_CHUNK_SIZE):
+            pass
+    finally:
+        proc.stdout.close()
+        returncode = proc.wait()
+    if returncode != 0:
+        raise RuntimeError(f"codexbar cost failed (exit {returncode}).")
+
+
+@contextmanager
+def open_payload_stream(input_path: Optional[str], provider: str) -> Iterator[IO[str]]:
+    if not input_path:
+        with open_codexbar_cost(provider) as handle:
+            yield handle
+    elif input_path == "-":
+        yield sys.stdin
+    else:
+        with open(input_path, "r", encoding="utf-8") as handle:
+            yield handle
+
+
+class PayloadStream:
+    """Incremental reader for codexbar cost JSON.
+
+    Walks the top-level provider array chunk by chunk. Providers that were not
+    requested are skipped without being decoded, and the selected provider's
+    ``daily`` rows are decoded and yielded one at a time.
+    """
+
+    def __init__(self, handle: IO[str], chunk_size: int = STREAM_CHUNK_SIZE) -> None:
+        self._handle = handle
+        self._chunk_size = chunk_size
+        self._decoder = json.JSONDecoder()
+        self._buf = ""
+        self._pos = 0
+        self._eof = False
+
+    def iter_daily(self, provider: str) -> Iterator[Dict[str, Any]]:
+        for _, entry in self.iter_providers([provider]):
+            yield entry
+
+    def iter_providers(self, providers: Sequence[str]) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """Yield ``(provider, daily_row)`` pairs in payload order.
+
+        Rows of one provider are contiguous, so callers can group them with
+        itertools.groupby without buffering.
+        """
+        first = self._peek()
+        if first == "{":
+            # A single provider object answers for the provider it names, or for the
+            # one requested provider when it names none, like select_provider.
+            default = providers[0] if len(providers) == 1 else None
+            found, named = yield from self._iter_provider_object(set(providers), default)
+            if not named and default is None:
+                raise RuntimeError(MULTI_PROVIDER_OBJECT)
+            missing = next((provider for provider in providers if provider != found), None)
+            if missing is not None:
+                raise ProviderNotFound(f"Provider '{missing}' not found in codexbar payload.")
+            return
+        if first != "[":
+            raise RuntimeError("Unsupported JSON input format.")
+        self._pos += 1
+        remaining = set(providers)
+        if self._peek() != "]":
+            while True:
+                if self._peek() == "{":
+                    found, _ = yield from self._iter_provider_object(remaining)
+                    if found:
+                        remaining.discard(found)
+                        if not remaining:
+                            return
+                else:
+                    self._skip_value()
+                if self._next_separator("]"):
+                    break
+        missing = next(provider for provider in providers if provider in remaining)
+        raise ProviderNotFound(f"Provider '{missing}' not found in codexbar payload.")
+
+    def _iter_provider_object(
+        self, wanted: Set[str], default: Optional[str] = None
+    ) -> Generator[Tuple[str, Dict[str, Any]], None, Tuple[Optional[str], bool]]:
+        """Yield the object's daily rows if its ``provider`` is wanted.
+
+        Without a ``provider`` key the rows count as ``default``'s. Returns the
+        matched provider and whether the object named one.
+        """
+        self._expect("{")
+        matched: Optional[str] = None
+        provider_seen = False
+        pending: List[Dict[str, Any]] = []
+        if self._peek() == "}":
+            self._pos += 1
+            return default, False
+        while True:
+            key = self._decode()
+            self._expect(":")
+            if key == "provider":
+                value = self._decode()
+                provider_seen = True
+                if matched is None and wanted is not None and isinstance(value, str) and value in wanted:
+                    matched = value
+            elif key == "daily" and (matched or not provider_seen):
+                if matched:
+                    for entry in self._iter_array_objects():
+                        yield matched, entry
+                else:
+                    # "daily" arrived before "provider"; hold it until we know.
+                    pending = list(self._iter_array_objects())
+            else:
+                self._skip_value()
+            if self._next_separator("}"):
+                break
+        if not provider_seen:
+            matched = default
+        if matched:
+            for entry in pending:
+                yield matched, entry
+        return matched, provider_seen
+
+    def _iter_array_objects(self) -> Iterator[Dict[str, Any]]:
+        if self._peek() != "[":
+            self._skip_value()
+            return
+        self._pos += 1
+        if self._peek() == "]":
+            self._pos += 1
+            return
+        while True:
+            if self._peek() == "{":
+                yield self._decode()
+            else:
+                self._skip_value()
+            if self._next_separator("]"):
+                return
+
+    def _fill(self) -> bool:
+        if self._eof:
+            return False
+        chunk = self._handle.read(self._chunk_size)
+        if not chunk:
+            self._eof = True
+            return False
+        self._buf = self._buf[self._pos :] + chunk
+        self._pos = 0
+        return True
+
+    def _more(self, pos: int) -> int:
+        self._pos = pos
+        if not self._fill():
+            raise RuntimeError("Malformed codexbar JSON: unexpected end of input.")
+        return self._pos
+
+    def _peek(self) -> str:
+        while True:
+            buf = self._buf
+            pos = self._pos
+            end = len(buf)
+            while pos < end and buf[pos] in _JSON_WHITESPACE:
+                pos += 1
+            self._pos = pos
+            if pos < end:
+                return buf[pos]
+            if not self._fill():
+                return ""
+
+    def _expect(self, char: str) -> None:
+        if self._peek() != char:
+            raise RuntimeError(f"Malformed codexbar JSON: expected '{char}'.")
+        self._pos += 1
+
+    def _next_separator(self, closer: str) -> bool:
+        char = self._peek()
+        self._pos += 1
+        if char == ",":
+            return False
+        if char == closer:
+            return True
+        raise RuntimeError(f"Malformed codexbar JSON: expected ',' or '{closer}'.")
+
+    def _decode(self) -> Any:
+        self._peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buf, self._pos)
+            except json.JSONDecodeError as exc:
+                if self._fill():
+                    continue
+                raise RuntimeError(f"Failed to parse codexbar JSON: {exc}")
+            if type(value) in (int, float) and _JSON_NUMBER_TAIL.match(self._buf, end) and self._fill():
+                # A number running to the end of the buffer may continue in the next chunk.
+                continue
+            self._pos = end
+            return value
+
+    def _skip_value(self) -> None:
+        if self._peek() not in ("[", "{"):
+            self._decode()
+            return
+        depth = 0
+        pos = self._pos
+        while True:
+            match = _JSON_STRUCTURAL.search(self._buf, pos)
+            if match is None:
+                pos = self._more(len(self._buf))
+                continue
+            pos = match.end()
+            char = match.group()
+            if char == '"':
+                pos = self._skip_string(pos)
+            elif char in "[{":
+                depth += 1
+            else:
+                depth -= 1
+                if depth == 0:
+                    self._pos = pos
+                    return
+
+    def _skip_string(self, pos: int) -> int:
+        while True:
+            match = _JSON_STRING_END.search(self._buf, pos)
+            if match is None:
+                pos = self._more(len(self._buf))
+                continue
+            if match.group() == '"':
+                return match.end()
+            pos = match.start()
+            if pos + 1 >= len(self._buf):
+                pos = self._more(pos)
+            pos += 2
+
+
+class DayIndex:
+    """Row positions keyed by day ordinal (parsed once) for repeated window queries.
+
+    Windows are located with bisect and returned in payload order, so
+    aggregation over a window matches iter_filter_by_window exactly.
+    """
+
+    __slots__ = ("ordinals", "positions", "in_order")
+
+    def __init__(self, ordinals: Iterable[int]) -> None:
+        # Ordinal 0 marks rows without a usable date; no window selects them.
+        keyed = [(ordinal, position) for position, ordinal in enumerate(ordinals) if ordinal]
+        self.in_order = all(keyed[i][0] <= keyed[i + 1][0] for i in range(len(keyed) - 1))
+        if not self.in_order:
+            keyed.sort()
+        self.ordinals = array("l", [ordinal for ordinal, _ in keyed])
+        self.positions = array("l", [position for _, position in keyed])
+
+    @classmethod
+    def for_entries(cls, entries: List[Dict[str, Any]]) -> DayIndex:
+        ordinals = []
+        for entry in entries:
+            day = entry.get("date")
+            ordinals.append((parse_day_ordinal(day) or 0) if isinstance(day, str) else 0)
+        return cls(ordinals)
+
+    def window_positions(self, window: DayWindow) -> List[int]:
+        start = bisect.bisect_left(self.ordinals, window[0])
+        end = bisect.bisect_right(self.ordinals, window[1])
+        positions = self.positions[start:end]
+        return positions.tolist() if self.in_order else sorted(positions)
+
+    def select(self, entries: List[Dict[str, Any]], window: Optional[DayWindow]) -> List[Dict[str, Any]]:
+        if window is None:
+            return entries
+        return [entries[position] for position in self.window_positions(window)]
+
+
+class CostColumns:
+    """Column-oriented (model, day ordinal, cost) rows for grouped sums."""
+
+    __slots__ = ("names", "ids", "model_ids", "ordinals", "costs")
+
+    def __init__(self) -> None:
+        self.names: List[str] = []
+        self.ids: Dict[str, int] = {}
+        self.model_ids = array("l")
+        self.ordinals = array("l")
+        self.costs = array("d")
+
+    def __len__(self) -> int:
+        return len(self.costs)
+
+    def add(self, model: str, ordinal: int, cost: float) -> None:
+        model_id = self.ids.get(model)
+        if model_id is None:
+            model_id = self.ids[model] = len(self.names)
+            self.names.append(model)
+        self.model_ids.append(model_id)
+        self.ordinals.append(ordinal)
+        self.costs.append(cost)
+
+
+def period_label(bucket: int, group_by: str) -> str:
+    if group_by == "month":
+        return f"{bucket // 12:04d}-{bucket % 12 + 1:02d}"
+    day = date.fromordinal(bucket)
+    if group_by == "week":
+        year, week, _ = day.isocalendar()
+        return f"{year:04d}-W{week:02d}"
+    return day.isoformat()
+
+
+def _bucket_keys(ordinals: Any, group_by: str) -> Any:
+    """Map day ordinals to bucket keys: the day, its ISO week's Monday, or year * 12 + month - 1."""
+    if group_by == "week":
+        # Ordinal 1 (0001-01-01) is a Monday.
+        return ordinals - (ordinals - 1) % 7
+    if group_by == "month":
+        months = (ordinals - _EPOCH_ORDINAL).astype("datetime64[D]").astype("datetime64[M]")
+        return months.astype("int64") + 1970 * 12
+    return ordinals
+
+
+def group_series(columns: CostColumns, group_by: str) -> Dict[str, List[Tuple[str, float]]]:
+    """Sum costs per model and period; returns model -> [(period, cost)] in period order."""
+    if not len(columns):
+        return {}
+    numpy = optional_numpy()
+    if numpy is not None:
+        ordinals = numpy.frombuffer(columns.ordinals, dtype=numpy.dtype(f"i{columns.ordinals.itemsize}"))
+        model_ids = numpy.frombuffer(columns.model_ids, dtype=numpy.dtype(f"i{columns.model_ids.itemsize}"))
+        costs = numpy.frombuffer(columns.costs, dtype=numpy.float64)
+        buckets, inverse = numpy.unique(_bucket_keys(ordinals.astype(numpy.int64), group_by), return_inverse=True)
+        cells = model_ids.astype(numpy.int64) * len(buckets) + inverse.reshape(-1)
+        size = len(columns.names) * len(buckets)
+        sums = numpy.bincount(cells, weights=costs, minlength=size).reshape(len(columns.names), len(buckets))
+        present = numpy.bincount(cells, minlength=size).reshape(sums.shape) > 0
+        labels = [period_label(int(bucket), group_by) for bucket in buckets]
+        return {
+            name: [(labels[col], float(sums[model_id, col])) for col in numpy.flatnonzero(present[model_id])]
+            for model_id, name in enumerate(columns.names)
+        }
+
+    cache: Dict[int, int] = {}
+    totals: Dict[Tuple[int, int], float] = {}
+    for model_id, ordinal, cost in zip(columns.model_ids, columns.ordinals, columns.costs):
+        bucket = cache.get(ordinal)
+        if bucket is None:
+            if group_by == "week":
+                bucket = ordinal - (ordinal - 1) % 7
+            elif group_by == "month":
+                day = date.fromordinal(ordinal)
+                bucket = day.year * 12 + day.month - 1
+            else:
+                bucket = ordinal
+            cache[ordinal] = bucket
+        cell = (model_id, bucket)
+        totals[cell] = totals.get(cell, 0.0) + cost
+    series: Dict[str, List[Tuple[str, float]]] = {name: [] for name in columns.names}
+    for (model_id, bucket), cost in sorted(totals.items()):
+        series[columns.names[model_id]].append((period_label(bucket, group_by), cost))
+    return series
+
+
+class Forecast(NamedTuple):
+    month_to_date: float
+    burn: float
+    trend: float
+    remaining: float
+
+
+def month_end(day: date) -> date:
+    following = date(day.year + day.month // 12, day.month % 12 + 1, 1)
+    return following - timedelta(days=1)
+
+
+def forecast_window(as_of: date, lookback: int) -> DayWindow:
+    """Rows a forecast reads: the lookback days and the month so far, both ending at as_of."""
+    end = as_of.toordinal()
+    return min(end - lookback + 1, as_of.replace(day=1).toordinal()), end
+
+
+def forecast_costs(columns: CostColumns, as_of: date, lookback: int) -> Dict[str, Forecast]:
+    """Per-model burn rate and month-end projection from the dated costs in ``columns``.
+
+    The burn rate is an EWMA (span = lookback) of daily spend over the last
+    ``lookback`` days up to as_of, with missing days counting as zero; the
+    trend is the least-squares slope over the same days. Each remaining day
+    of the month is projected as burn + trend * k, floored at zero.
+    """
+    end = as_of.toordinal()
+    start = end - lookback + 1
+    month_start = as_of.replace(day=1).toordinal()
+    remaining_days = month_end(as_of).toordinal() - end
+    alpha = 2.0 / (lookback + 1)
+    count = len(columns.names)
+    numpy = optional_numpy()
+    if numpy is not None:
+        ordinals = numpy.frombuffer(columns.ordinals, dtype=numpy.dtype(f"i{columns.ordinals.itemsize}")).astype(numpy.int64)
+        model_ids = numpy.frombuffer(columns.model_ids, dtype=numpy.dtype(f"i{columns.model_ids.itemsize}")).astype(numpy.int64)
+        costs = numpy.frombuffer(columns.costs, dtype=numpy.float64)
+        inside = (ordinals >= start) & (ordinals <= end)
+        cells = model_ids[inside] * lookback + (ordinals[inside] - start)
+        daily = numpy.bincount(cells, weights=costs[inside], minlength=count * lookback).reshape(count, lookback)
+        this_month = (ordinals >= month_start) & (ordinals <= end)
+        month_to_date = numpy.bincount(model_ids[this_month], weights=costs[this_month], minlength=count)
+        weights = (1.0 - alpha) ** numpy.arange(lookback - 1, -1, -1)
+        burn = daily @ weights / weights.sum()
+        offsets = numpy.arange(lookback) - (lookback - 1) / 2
+        spread = float(offsets @ offsets)
+        trend = daily @ offsets / spread if spread else numpy.zeros(count)
+        steps = numpy.arange(1, remaining_days + 1)
+        remaining = numpy.clip(burn[:, None] + trend[:, None] * steps, 0.0, None).sum(axis=1)
+        return {
+            name: Forecast(float(month_to_date[i]), float(burn[i]), float(trend[i]), float(remaining[i]))
+            for i, name in enumerate(columns.names)
+        }
+
+    daily_rows = [[0.0] * lookback for _ in range(count)]
+    month_totals = [0.0] * count
+    for model_id, ordinal, cost in zip(columns.model_ids, columns.ordinals, columns.costs):
+        if ordinal > end:
+            continue
+        if ordinal >= start:
+            daily_rows[model_id][ordinal - start] += cost
+        if ordinal >= month_start:
+            month_totals[model_id] += cost
+    weight_list = [(1.0 - alpha) ** (lookback - 1 - i) for i in range(lookback)]
+    weight_sum = sum(weight_list)
+    offset_list = [i - (lookback - 1) / 2 for i in range(lookback)]
+    spread = sum(offset * offset for offset in offset_list)
+    forecasts: Dict[str, Forecast] = {}
+    for model_id, name in enumerate(columns.names):
+        row = daily_rows[model_id]
+        rate = sum(weight * cost for weight, cost in zip(weight_list, row)) / weight_sum
+        slope = sum(offset * cost for offset, cost in zip(offset_list, row)) / spread if spread else 0.0
+        left = sum((max(0.0, rate + slope * k) for k in range(1, remaining_days + 1)), 0.0)
+        forecasts[name] = Forecast(month_totals[model_id], rate, slope, left)
+    return forecasts
+
+
+class UsageStore:
+    """Compact columnar copy of daily rows for data that stays in memory.
+
+    Model names and date strings are interned to small ints; per-row dates,
+    fallback models and breakdown offsets, and per-breakdown model ids and
+    costs live in ``array`` columns instead of dicts. Date ordinals are
+    parsed once and windows are answered through a DayIndex.
+    """
+
+    __slots__ = (
+        "names",
+        "days",
+        "row_day",
+        "row_ordinal",
+        "row_fallback",
+        "row_end",
+        "item_model",
+        "item_cost",
+        "item_valid",
+        "index",
+    )
+
+    def __init__(self) -> None:
+        self.names: List[str] = []
+        self.days: List[str] = []
+        self.row_day = array("l")  # index into days; -1 when the date is not a string
+        self.row_ordinal = array("l")  # 0 when the date does not parse
+        self.row_fallback = array("l")  # last modelsUsed entry; -1 when absent
+        self.row_end = array("l")  # end offset of the row's breakdowns in item_*
+        self.item_model = array("l")
+        self.item_cost = array("d")
+        self.item_valid = array("b")  # 0 when the breakdown has no numeric cost
+        self.index = DayIndex(())
+
+    def __len__(self) -> int:
+        return len(self.row_end)
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, UsageStore):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self.__slots__ if name != "index")
+
+    @classmethod
+    def from_entries(cls, entries: Iterable[Dict[str, Any]]) -> UsageStore:
+        store = cls()
+        names = store.names
+        days = store.days
+        model_ids: Dict[str, int] = {}
+        day_ids: Dict[str, int] = {}
+        day_ordinals: List[int] = []
+        item_model = store.item_model
+        item_cost = store.item_cost
+        item_valid = store.item_valid
+
+        def intern_model(model: str) -> int:
+            model_id = model_ids.get(model)
+            if model_id is None:
+                model_id = model_ids[model] = len(names)
+                names.append(model)
+            return model_id
+
+        for entry in entries:
+            raw_day = entry.get("date")
+            if isinstance(raw_day, str):
+                day_id = day_ids.get(raw_day)
+                if day_id is None:
+                    day_id = day_ids[raw_day] = len(days)
+                    days.append(raw_day)
+                    day_ordinals.append(parse_day_ordinal(raw_day) or 0)
+                store.row_day.append(day_id)
+                store.row_ordinal.append(day_ordinals[day_id])
+            else:
+                store.row_day.append(-1)
+                store.row_ordinal.append(0)
+            models_used = entry.get("modelsUsed")
+            if isinstance(models_used, list) and models_used and isinstance(models_used[-1], str):
+                store.row_fallback.append(intern_model(models_used[-1]))
+            else:
+                store.row_fallback.append(-1)
+            breakdowns = entry.get("modelBreakdowns")
+            if isinstance(breakdowns, list):
+                for item in breakdowns:
+                    if not isinstance(item, dict):
+                        continue
+                    model = item.get("modelName")
+                    if not isinstance(model, str):
+                        continue
+                    cost = item.get("cost")
+                    valid = isinstance(cost, (int, float))
+                    item_model.append(intern_model(model))
+                    item_cost.append(float(cost) if valid else 0.0)
+                    item_valid.append(1 if valid else 0)
+            store.row_end.append(len(item_cost))
+        store.index = DayIndex(store.row_ordinal)
+        return store
+
+    def aggregate(self, window: Optional[DayWindow] = None, columns: Optional[CostColumns] = None) -> UsageAggregate:
+        """Same result as aggregate_usage over the rows iter_filter_by_window keeps."""
+        result = UsageAggregate(columns)
+        rows: Iterable[int] = range(len(self)) if window is None else self.index.window_positions(window)
+        names = self.names
+        days = self.days
+        row_day = self.row_day
+        row_ordinal = self.row_ordinal
+        row_end = self.row_end
+        item_model = self.item_model
+        item_cost = self.item_cost
+        item_valid = self.item_valid
+        count = len(names)
+        totals = [0.0] * count
+        has_cost = [False] * count
+        stamp = [-1] * count
+        latest_key: List[Optional[str]] = [None] * count
+        latest_date: List[Optional[str]] = [None] * count
+        latest_cost: List[Optional[float]] = [None] * count
+        seen: List[int] = []
+        daily_top = result.daily_top
+        entry_count = 0
+        for row in rows:
+            entry_count += 1
+            day_id = row_day[row]
+            day = days[day_id] if day_id >= 0 else None
+            key = day or ""
+            ordinal = row_ordinal[row]
+            top = -1
+            top_cost = 0.0
+            for item in range(row_end[row - 1] if row else 0, row_end[row]):
+                model_id = item_model[item]
+                value = item_cost[item] if item_valid[item] else None
+                # Only the first breakdown per model in a row counts as its latest cost.
+                if stamp[model_id] != row:
+                    stamp[model_id] = row
+                    previous = latest_key[model_id]
+                    if previous is None:
+                        seen.append(model_id)
+                    if previous is None or key >= previous:
+                        latest_key[model_id] = key
+                        latest_date[model_id] = day
+                        latest_cost[model_id] = value
+                if value is None:
+                    continue
+                totals[model_id] += value
+                has_cost[model_id] = True
+                if ordinal and columns is not None:
+                    columns.add(names[model_id], ordinal, value)
+                if top < 0 or value > top_cost:
+                    top = model_id
+                    top_cost = value
+            if top < 0:
+                top = self.row_fallback[row]
+            if top >= 0:
+                daily_top[key] = (names[top], day)
+        result.entry_count = entry_count
+        for model_id in seen:
+            usage = result.models[names[model_id]] = ModelUsage()
+            usage.total = totals[model_id]
+            usage.has_cost = has_cost[model_id]
+            usage.latest_key = latest_key[model_id] or ""
+            usage.latest_date = latest_date[model_id]
+            usage.latest_cost = latest_cost[model_id]
+        return result
+
+
+def default_index_path() -> str:
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_home, "openclaw", "model-usage", "index.sqlite3")
+
+
+def entry_hash(entry: Dict[str, Any]) -> str:
+    import hashlib
+
+    raw = json.dumps(entry, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def input_signature(input_path: Optional[str]) -> Optional[str]:
+    """Identity, size and mtime of an --input file, or None when there is no file to stat."""
+    if not input_path or input_path == "-":
+        return None
+    try:
+        info = os.stat(input_path)
+    except OSError:
+        return None
+    return f"{os.path.abspath(input_path)}:{info.st_ino}:{info.st_size}:{info.st_mtime_ns}"
+
+
+def fold_days(
+    entries: Iterable[Dict[str, Any]],
+) -> Tuple[Dict[str, Tuple[Any, ...]], Dict[Tuple[str, str], Tuple[Any, ...]]]:
+    """Pre-aggregate daily rows per date key and per (date key, model) for CostIndex.
+
+    Returns ``{day: (ordinal, rows, top_model, top_date)}`` and
+    ``{(day, model): (ordinal, cost, costed, latest_date, latest_cost)}``,
+    following aggregate_usage's rules: later rows win ties on the same date,
+    and only a model's first breakdown in a row is its latest cost.
+    """
+    days: Dict[str, List[Any]] = {}
+    costs: Dict[Tuple[str, str], List[Any]] = {}
+    for entry in entries:
+        raw_day = entry.get("date")
+        day = raw_day if isinstance(raw_day, str) else None
+        key = day or ""
+        state = days.get(key)
+        if state is None:
+            state = days[key] = [parse_day_ordinal(day) if day else None, 0, None, None]
+        state[1] += 1
+        top_model: Optional[str] = None
+        top_cost = 0.0
+        seen: Set[str] = set()
+        breakdowns = entry.get("modelBreakdowns")
+        for item in breakdowns if isinstance(breakdowns, list) else ():
+            if not isinstance(item, dict):
+                continue
+            model = item.get("modelName")
+            if not isinstance(model, str):
+                continue
+            cost = item.get("cost")
+            value = float(cost) if isinstance(cost, (int, float)) else None
+            cell = costs.get((key, model))
+            if cell is None:
+                cell = costs[key, model] = [state[0], 0.0, 0, None, None]
+            if model not in seen:
+                seen.add(model)
+                cell[3] = day
+                cell[4] = value
+            if value is None:
+                continue
+            cell[1] += value
+            cell[2] = 1
+            if top_model is None or value > top_cost:
+                top_model = model
+                top_cost = value
+        if top_model is None:
+            models_used = entry.get("modelsUsed")
+            if isinstance(models_used, list) and models_used and isinstance(models_used[-1], str):
+                top_model = models_used[-1]
+        if top_model is not None:
+            state[2] = top_model
+            state[3] = day
+    return (
+        {key: tuple(state) for key, state in days.items()},
+        {key: tuple(cell) for key, cell in costs.items()},
+    )
+
+
+class CostIndex:
+    """On-disk SQLite index of pre-aggregated costs keyed by provider, date and model.
+
+    Ingest folds the payload into one row per date (row count, top model) and
+    one row per date and model (summed cost, latest cost), then writes only the
+    rows that differ from what is stored. Queries are SQL sums over those rows.
+    The --input file's size and mtime are kept per provider, so an unchanged
+    file is not read again (``is_current``).
+    """
+
+    def __init__(self, path: str) -> None:
+        import sqlite3
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        # Concurrent provider fetches share one index file.
+        self._conn = sqlite3.connect(path, timeout=30)
+        self._ensure_schema()
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def _ensure_schema(self) -> None:
+        conn = self._conn
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if version != INDEX_SCHEMA_VERSION:
+            conn.executescript(
+                """
+                DROP TABLE IF EXISTS entries;
+                DROP TABLE IF EXISTS breakdowns;
+                DROP TABLE IF EXISTS days;
+                DROP TABLE IF EXISTS costs;
+                DROP TABLE IF EXISTS models;
+                DROP TABLE IF EXISTS sources;
+                """
+            )
+        conn.executescript(
+            f"""
+            CREATE TABLE IF NOT EXISTS days (
+                provider TEXT NOT NULL,
+                day TEXT NOT NULL,
+                ordinal INTEGER,
+                rows INTEGER NOT NULL,
+                top_model TEXT,
+                top_date TEXT,
+                PRIMARY KEY (provider, day)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS costs (
+                provider TEXT NOT NULL,
+                day TEXT NOT NULL,
+                model TEXT NOT NULL,
+                ordinal INTEGER,
+                cost REAL NOT NULL,
+                costed INTEGER NOT NULL,
+                latest_date TEXT,
+                latest_cost REAL,
+                PRIMARY KEY (provider, day, model)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS models (
+                provider TEXT NOT NULL,
+                model TEXT NOT NULL,
+                cost REAL NOT NULL,
+                costed INTEGER NOT NULL,
+                latest_day TEXT NOT NULL,
+                latest_date TEXT,
+                latest_cost REAL,
+                PRIMARY KEY (provider, model)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS sources (
+                provider TEXT PRIMARY KEY,
+                signature TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS days_ordinal ON days (provider, ordinal);
+            CREATE INDEX IF NOT EXISTS costs_ordinal ON costs (provider, ordinal);
+            PRAGMA user_version = {INDEX_SCHEMA_VERSION};
+            """
+        )
+
+    def clear(self, provider: str) -> None:
+        with self._conn:
+            for table in ("days", "costs", "models", "sources"):
+                self._conn.execute(f"DELETE FROM {table} WHERE provider = ?", (provider,))
+
+    def is_current(self, provider: str, signature: Optional[str]) -> bool:
+        """Whether ``provider`` was last ingested from the file ``signature`` describes."""
+        if signature is None:
+            return False
+        row = self._conn.execute("SELECT signature FROM sources WHERE provider = ?", (provider,)).fetchone()
+        return row is not None and row[0] == signature
+
+    def ingest(self, provider: str, entries: Iterable[Dict[str, Any]], signature: Optional[str] = None) -> int:
+        """Sync the index with ``entries``; returns the number of aggregated rows rewritten."""
+        days, costs = fold_days(entries)
+        models: Dict[str, List[Any]] = {}
+        for (key, model), (_, cost, costed, latest_date, latest_cost) in costs.items():
+            summary = models.get(model)
+            if summary is None:
+                summary = models[model] = [0.0, 0, key, latest_date, latest_cost]
+            elif key > summary[2]:
+                summary[2:] = [key, latest_date, latest_cost]
+            summary[0] += cost
+            summary[1] |= costed
+        conn = self._conn
+        with conn:
+            changed = self._sync(provider, "days", ("day",), {(key,): state for key, state in days.items()})
+            changed += self._sync(provider, "costs", ("day", "model"), costs)
+            summaries = {(model,): tuple(row) for model, row in models.items()}
+            changed += self._sync(provider, "models", ("model",), summaries)
+            if signature is None:
+                conn.execute("DELETE FROM sources WHERE provider = ?", (provider,))
+            else:
+                conn.execute("INSERT OR REPLACE INTO sources VALUES (?, ?)", (provider, signature))
+        return changed
+
+    def _sync(
+        self, provider: str, table: str, keys: Tuple[str, ...], rows: Dict[Tuple[Any, ...], Tuple[Any, ...]]
+    ) -> int:
+        """Make ``table``'s rows for ``provider`` equal ``rows``, writing only the differences."""
+        conn = self._conn
+        split = 1 + len(keys)
+        stored = {
+            row[1:split]: row[split:]
+            for row in conn.execute(f"SELECT * FROM {table} WHERE provider = ?", (provider,))
+        }
+        stale = [(provider, *key) for key in stored if key not in rows]
+        fresh = [(provider, *key, *values) for key, values in rows.items() if stored.get(key) != values]
+        match = " AND ".join(f"{key} = ?" for key in keys)
+        conn.executemany(f"DELETE FROM {table} WHERE provider = ? AND {match}", stale)
+        if fresh:
+            marks = ", ".join("?" * len(fresh[0]))
+            conn.executemany(f"INSERT OR REPLACE INTO {table} VALUES ({marks})", fresh)
+        return len(stale) + len(fresh)
+
+    def query(
+        self, provider: str, window: Optional[DayWindow], columns: Optional[CostColumns] = None
+    ) -> UsageAggregate:
+        """Answer the same questions as aggregate_usage over iter_filter_by_window rows."""
+        where = "provider = ?"
+        params: List[Any] = [provider]
+        if window is not None:
+            where += " AND ordinal BETWEEN ? AND ?"
+            params.extend(window)
+        conn = self._conn
+        result = UsageAggregate(columns)
+        count = conn.execute(f"SELECT COALESCE(SUM(rows), 0) FROM days WHERE {where}", params).fetchone()
+        result.entry_count = count[0]
+        latest = conn.execute(
+            f"""
+            SELECT day, top_date, top_model FROM days
+            WHERE {where} AND top_model IS NOT NULL
+            ORDER BY day DESC LIMIT 1
+            """,
+            params,
+        ).fetchone()
+        if latest:
+            result.daily_top[latest[0]] = (latest[2], latest[1])
+        if window is None:
+            rows = conn.execute(
+                "SELECT model, latest_day, latest_date, latest_cost, cost, costed FROM models WHERE provider = ?",
+                params,
+            )
+        else:
+            # With a single MAX() aggregate, SQLite takes the bare columns from the
+            # row holding the maximum, i.e. the model's latest date in the window.
+            rows = conn.execute(
+                f"""
+                SELECT model, MAX(day), latest_date, latest_cost, TOTAL(cost), SUM(costed) FROM costs
+                WHERE {where} GROUP BY model
+                """,
+                params,
+            )
+        models = result.models
+        for model, day, latest_date, latest_cost, total, costed in rows:
+            usage = models[model] = ModelUsage()
+            usage.latest_key = day
+            usage.latest_date = latest_date
+            usage.latest_cost = latest_cost
+            usage.total = total
+            usage.has_cost = bool(costed)
+        if columns is not None:
+            rows = conn.execute(
+                f"""
+                SELECT model, ordinal, cost FROM costs
+                WHERE {where} AND costed AND ordinal IS NOT NULL
+                """,
+                params,
+            )
+            for model, ordinal, cost in rows:
+                columns.add(model, ordinal, cost)
+        return result
+
+
+def build_json_series(provider: str, group_by: str, series: Dict[str, List[Tuple[str, float]]]) -> Dict[str, Any]:
+    totals = {model: sum(cost for _, cost in points) for model, points in series.items()}
+    return {
+        "provider": provider,
+        "mode": "series",
+        "groupBy": group_by,
+        "models": [
+            {
+                "model": model,
+                "totalCostUSD": total,
+                "series": [{"period": period, "costUSD": cost} for period, cost in series[model]],
+            }
+            for model, total in sorted_totals(totals)
+        ],
+    }
+
+
+def render_text_series(provider: str, group_by: str, series: Dict[str, List[Tuple[str, float]]]) -> str:
+    totals = {model: sum(cost for _, cost in points) for model, points in series.items()}
+    models = [model for model, _ in sorted_totals(totals)]
+    cells: Dict[str, Dict[str, float]] = {}
+    for model in models:
+        for period, cost in series[model]:
+            cells.setdefault(period, {})[model] = cost
+    header = ["Period", *models, "Total"]
+    rows = [header]
+    for period in sorted(cells):
+        row = cells[period]
+        rows.append([period, *(usd(row.get(model)) for model in models), usd(sum(row.values()))])
+    widths = [max(len(row[col]) for row in rows) for col in range(len(header))]
+    lines = [f"Provider: {provider}", f"Cost by {group_by}:"]
+    for row in rows:
+        lines.append("  ".join([row[0].ljust(widths[0]), *(cell.rjust(width) for cell, width in zip(row[1:], widths[1:]))]))
+    return "\n".join(lines)
+
+
+def build_json_forecast(provider: str, as_of: date, lookback: int, forecasts: Dict[str, Forecast]) -> Dict[str, Any]:
+    projected = {model: item.month_to_date + item.remaining for model, item in forecasts.items()}
+    return {
+        "provider": provider,
+        "mode": "forecast",
+        "asOf": as_of.isoformat(),
+        "monthEnd": month_end(as_of).isoformat(),
+        "lookbackDays": lookback,
+        "daysRemaining": month_end(as_of).toordinal() - as_of.toordinal(),
+        "monthToDateCostUSD": sum(item.month_to_date for item in forecasts.values()),
+        "projectedMonthCostUSD": sum(projected.values()),
+        "models": [
+            {
+                "model": model,
+                "monthToDateCostUSD": forecasts[model].month_to_date,
+                "dailyBurnUSD": forecasts[model].burn,
+                "trendUSDPerDay": forecasts[model].trend,
+                "projectedRemainingCostUSD": forecasts[model].remaining,
+                "projectedMonthCostUSD": projected[model],
+            }
+            for model, _ in sorted_totals(projected)
+        ],
+    }
+
+
+def render_text_forecast(
+    provider: str,
+    as_of: str,
+    month_end_date: str,
+    lookback: int,
+    models: List[Dict[str, Any]],
+) -> str:
+    rows = [["Model", "Month to date", "Burn/day", "Trend/day", "Projected month"]]
+    for item in models:
+        trend = item["trendUSDPerDay"]
+        rows.append(
+            [
+                item["model"],
+                usd(item["monthToDateCostUSD"]),
+                usd(item["dailyBurnUSD"]),
+                ("-" if trend < 0 else "+") + usd(abs(trend)),
+                usd(item["projectedMonthCostUSD"]),
+            ]
+        )
+    rows.append(
+        [
+            "Total",
+            usd(sum(item["monthToDateCostUSD"] for item in models)),
+            usd(sum(item["dailyBurnUSD"] for item in models)),
+            "",
+            usd(sum(item["projectedMonthCostUSD"] for item in models)),
+        ]
+    )
+    widths = [max(len(row[col]) for row in rows) for col in range(len(rows[0]))]
+    lines = [
+        f"Provider: {provider}",
+        f"Forecast to {month_end_date} as of {as_of} (EWMA + linear trend over {lookback} days):",
+    ]
+    for row in rows:
+        lines.append("  ".join([row[0].ljust(widths[0]), *(cell.rjust(width) for cell, width in zip(row[1:], widths[1:]))]))
+    return "\n".join(lines)
+
+
+def report_delta(previous: Optional[Dict[str, Any]], current: Dict[str, Any]) -> Dict[str, Any]:
+    """Fields of ``current`` that differ from ``previous``; model lists are diffed per model."""
+    if previous is None:
+        return current
+    delta: Dict[str, Any] = {}
+    for key, value in current.items():
+        if key == "models" and isinstance(previous.get(key), list):
+            old = {item["model"]: item for item in previous[key]}
+            new = {item["model"]: item for item in value}
+            changed = [item for model, item in new.items() if old.get(model) != item]
+            removed = [model for model in old if model not in new]
+            if changed:
+                delta["models"] = changed
+            if removed:
+                delta["removedModels"] = removed
+        elif previous.get(key) != value:
+            delta[key] = value
+    return delta
+
+
+RowChange = Tuple[str, Optional[Dict[str, Any]], Optional[Dict[str, Any]]]
+
+
+def row_costs(entry: Dict[str, Any]) -> Iterator[Tuple[str, float]]:
+    breakdowns = entry.get("modelBreakdowns")
+    if not isinstance(breakdowns, list):
+        return
+    for item in breakdowns:
+        if isinstance(item, dict):
+            model = item.get("modelName")
+            cost = item.get("cost")
+            if isinstance(model, str) and isinstance(cost, (int, float)):
+                yield model, float(cost)
+
+
+def diff_rows(
+    base: Iterable[Dict[str, Any]], head: Iterable[Dict[str, Any]]
+) -> Tuple[List[RowChange], Dict[str, float], Dict[str, float]]:
+    """Daily rows that differ between two snapshots, plus per-model totals of each side.
+
+    Both sides are read in lockstep and rows are paired by date through maps
+    of not-yet-matched (hash, row) pairs. Matching rows are dropped as soon as
+    their partner arrives, so only added, removed, changed or shifted rows
+    are held in memory. Returns ``(date, base_row, head_row)`` changes sorted
+    by date, with None for the missing side.
+    """
+    pending: Tuple[Dict[str, List[Tuple[str, Dict[str, Any]]]], ...] = ({}, {})
+    totals: Tuple[Dict[str, float], ...] = ({}, {})
+    changes: List[RowChange] = []
+    for pair in itertools.zip_longest(base, head):
+        for side, row in enumerate(pair):
+            if row is None:
+                continue
+            side_totals = totals[side]
+            for model, cost in row_costs(row):
+                side_totals[model] = side_totals.get(model, 0.0) + cost
+            day = row.get("date")
+            key = day if isinstance(day, str) else ""
+            digest = entry_hash(row)
+            waiting = pending[1 - side].get(key)
+            if not waiting:
+                pending[side].setdefault(key, []).append((digest, row))
+                continue
+            other_digest, other_row = waiting.pop(0)
+            if not waiting:
+                del pending[1 - side][key]
+            if other_digest != digest:
+                changes.append((key, other_row, row) if side else (key, row, other_row))
+    for key, rows in pending[0].items():
+        changes.extend((key, row, None) for _, row in rows)
+    for key, rows in pending[1].items():
+        changes.extend((key, None, row) for _, row in rows)
+    changes.sort(key=lambda change: change[0])
+    return changes, totals[0], totals[1]
+
+
+def iter_snapshot_rows(path: str, provider: str) -> Iterator[Dict[str, Any]]:
+    """Stream a provider's daily rows from a snapshot file; a missing provider has no rows."""
+    with open_payload_stream(path, provider) as handle:
+        try:
+            yield from PayloadStream(handle).iter_daily(provider)
+        except ProviderNotFound:
+            return
+
+
+def build_json_diff(
+    provider: str, changes: List[RowChange], base_totals: Dict[str, float], head_totals: Dict[str, float]
+) -> Dict[str, Any]:
+    models = []
+    for model in sorted(set(base_totals) | set(head_totals)):
+        old = base_totals.get(model, 0.0)
+        new = head_totals.get(model, 0.0)
+        # Reordered rows can sum to a different last bit; that is not a change.
+        if abs(new - old) > 1e-9 or (model in base_totals) != (model in head_totals):
+            models.append({"model": model, "baseTotalCostUSD": old, "headTotalCostUSD": new, "deltaUSD": new - old})
+    return {
+        "provider": provider,
+        "mode": "diff",
+        "added": [head for _, base, head in changes if base is None],
+        "removed": [base for _, base, head in changes if head is None],
+        "changed": [
+            {"date": day or None, "base": base, "head": head}
+            for day, base, head in changes
+            if base is not None and head is not None
+        ],
+        "models": sorted(models, key=lambda item: abs(item["deltaUSD"]), reverse=True),
+    }
+
+
+def render_text_diff(report: Dict[str, Any]) -> str:
+    def row_cost(row: Dict[str, Any]) -> str:
+        return usd(sum(cost for _, cost in row_costs(row)))
+
+    lines = [
+        f"Provider: {report['provider']}",
+        f"Rows: {len(report['added'])} added, {len(report['removed'])} removed, {len(report['changed'])} changed",
+    ]
+    changes = [(row.get("date"), "+", row_cost(row)) for row in report["added"]]
+    changes += [(row.get("date"), "-", row_cost(row)) for row in report["removed"]]
+    changes += [(item["date"], "~", f"{row_cost(item['base'])} -> {row_cost(item['head'])}") for item in report["changed"]]
+    for day, marker, cost in sorted(changes, key=lambda change: str(change[0] or "")):
+        lines.append(f"{marker} {day or '(no date)'}: {cost}")
+    if report["models"]:
+        lines.append("Models:")
+        for item in report["models"]:
+            delta = item["deltaUSD"]
+            sign = "-" if delta < 0 else "+"
+            lines.append(
+                f"- {item['model']}: {usd(item['baseTotalCostUSD'])} -> {usd(item['headTotalCostUSD'])} ({sign}{usd(abs(delta))})"
+            )
+    return "\n".join(lines)
+
+
+def diff_main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(
+        prog="model_usage.py diff",
+        description="Show daily rows and per-model totals that changed between two codexbar cost snapshots.",
+    )
+    parser.add_argument("--base", required=True, help="Older codexbar cost JSON (or '-' for stdin).")
+    parser.add_argument("--head", required=True, help="Newer codexbar cost JSON (or '-' for stdin).")
+    parser.add_argument(
+        "--provider",
+        action="append",
+        choices=[*PROVIDERS, "all"],
+        help="Provider to compare (default: all). Repeatable.",
+    )
+    parser.add_argument("--format", choices=["text", "json"], default="text")
+    parser.add_argument("--pretty", action="store_true", help="Pretty-print JSON output.")
+    args = parser.parse_args(argv)
+    if args.base == "-" and args.head == "-":
+        parser.error("only one of --base/--head can read stdin.")
+    providers = resolve_providers(args.provider or ["all"])
+    if "-" in (args.base, args.head) and len(providers) > 1:
+        parser.error("stdin can only be compared for a single --provider.")
+
+    reports: List[Dict[str, Any]] = []
+    try:
+        for provider in providers:
+            changes, base_totals, head_totals = diff_rows(
+                iter_snapshot_rows(args.base, provider), iter_snapshot_rows(args.head, provider)
+            )
+            report = build_json_diff(provider, changes, base_totals, head_totals)
+            if report["added"] or report["removed"] or report["changed"] or report["models"]:
+                reports.append(report)
+    except Exception as exc:
+        eprint(str(exc))
+        return 1
+
+    if args.format == "json":
+        indent = 2 if args.pretty else None
+        output = {"mode": "diff", "base": args.base, "head": args.head, "providers": reports}
+        print(json.dumps(output, indent=indent, sort_keys=args.pretty))
+    else:
+        print("\n\n".join(render_text_diff(report) for report in reports) or "No changes between snapshots.")
+    return 0
+
+
+def run_watch(args: argparse.Namespace, providers: List[str]) -> int:
+    if args.input == "-":
+        eprint("--watch cannot re-read stdin; use codexbar or an --input file.")
+        return 1
+    # Aggregated state lives in an index: each tick only rewrites aggregates that changed.
+    index = CostIndex(args.index_path or default_index_path()) if args.index else CostIndex(":memory:")
+    out = open(args.watch_output, "a", encoding="utf-8") if args.watch_output else sys.stdout
+    previous: Dict[str, Dict[str, Any]] = {}
+    tick = 0
+    try:
+        if args.rebuild_index:
+            for provider in providers:
+                index.clear(provider)
+        while True:
+            tick += 1
+            for provider in providers:
+                try:
+                    if args.refresh_index:
+                        signature = input_signature(args.input)
+                        if index.is_current(provider, signature):
+                            changed = 0
+                        else:
+                            with open_payload_stream(args.input, provider) as handle:
+                                rows = PayloadStream(handle).iter_daily(provider)
+                                changed = index.ingest(provider, rows, signature)
+                        if not changed and not (args.days or args.forecast) and provider in previous:
+                            continue
+                    columns = CostColumns() if args.group_by or args.forecast else None
+                    report = build_report(args, provider, index.query(provider, report_window(args), columns))
+                except Exception as exc:
+                    eprint(f"{provider}: {exc}")
+                    continue
+                delta = report_delta(previous.get(provider), report)
+                if not delta:
+                    continue
+                previous[provider] = report
+                line = {"ts": datetime.now(timezone.utc).isoformat(timespec="seconds"), "provider": provider}
+                line["changes"] = delta
+                out.write(json.dumps(line) + "\n")
+                out.flush()
+            if args.watch_ticks and tick >= args.watch_ticks:
+                return 0
+            time.sleep(args.watch)
+    except KeyboardInterrupt:
+        return 0
+    finally:
+        index.close()
+        if out is not sys.stdout:
+            out.close()
+
+
+class UsageService:
+    """State behind ``serve``: rows held as a UsageStore, reports cached until the data changes."""
+
+    def __init__(self, input_path: Optional[str], providers: List[str]) -> None:
+        self.input_path = input_path
+        self.providers = providers
+        self.refreshed_at: Optional[str] = None
+        self._lock = threading.Lock()
+        self._stores: Dict[str, UsageStore] = {}
+        self._cache: Dict[Tuple[Any, ...], bytes] = {}
+
+    def refresh(self) -> None:
+        if self.input_path:
+            payloads = select_providers(read_input(self.input_path), self.providers)
+            fresh = {p: UsageStore.from_entries(parse_daily_entries(payloads[p])) for p in self.providers}
+        else:
+            from concurrent.futures import ThreadPoolExecutor
+
+            with ThreadPoolExecutor(max_workers=len(self.providers)) as pool:
+                loaded = pool.map(
+                    lambda provider: UsageStore.from_entries(parse_daily_entries(load_payload(None, provider))),
+                    self.providers,
+                )
+                fresh = dict(zip(self.providers, loaded))
+        with self._lock:
+            if fresh != self._stores:
+                self._stores = fresh
+                self._cache.clear()
+            self.refreshed_at = datetime.now(timezone.utc).isoformat(timespec="seconds")
+        # Keep the default queries hot.
+        for provider in self.providers:
+            for mode in ("current", "all"):
+                try:
+                    self.answer(provider, mode)
+                except NoUsageData:
+                    pass
+
+    def answer(
+        self,
+        provider: str,
+        mode: str,
+        window: Optional[DayWindow] = None,
+        model: Optional[str] = None,
+        group_by: Optional[str] = None,
+        forecast: Optional[int] = None,
+        as_of: Optional[date] = None,
+    ) -> bytes:
+        if forecast:
+            as_of = as_of or date.today()
+            window = forecast_window(as_of, forecast)
+        key = (provider, mode, window, model, group_by, forecast, as_of)
+        with self._lock:
+            cached = self._cache.get(key)
+            store = self._stores[provider]
+        if cached is not None:
+            return cached
+        usage = store.aggregate(window, CostColumns() if group_by or forecast else None)
+        request = argparse.Namespace(mode=mode, model=model, group_by=group_by, forecast=forecast, until=as_of)
+        body = json.dumps(build_report(request, provider, usage)).encode("utf-8")
+        with self._lock:
+            if self._stores.get(provider) is store:
+                if len(self._cache) >= SERVE_CACHE_LIMIT:
+                    self._cache.clear()
+                self._cache[key] = body
+        return body
+
+
+def build_server(args: argparse.Namespace, service: UsageService) -> Tuple[Any, str]:
+    """HTTP server for ``serve``; http.server (and http.client, email) load only here."""
+    import socketserver
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from urllib.parse import parse_qs, urlsplit
+
+    class UsageRequestHandler(BaseHTTPRequestHandler):
+        """GET /current, /all, /series, /forecast and /health.
+
+        Query params: provider, days, since, until (YYYY-MM-DD), model, group_by.
+        """
+
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self) -> None:
+            url = urlsplit(self.path)
+            route = url.path.strip("/")
+            params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+            if route == "health":
+                health = {"providers": service.providers, "refreshedAt": service.refreshed_at}
+                self._send(200, json.dumps(health).encode("utf-8"))
+                return
+            if route not in ("current", "all", "series", "forecast"):
+                self._send_error(404, f"Unknown endpoint '/{route}'.")
+                return
+            provider = params.get("provider", service.providers[0])
+            if provider not in service.providers:
+                self._send_error(404, f"Provider '{provider}' is not served.")
+                return
+            group_by = params.get("group_by", "day") if route == "series" else None
+            if group_by is not None and group_by not in GROUP_BY_CHOICES:
+                self._send_error(400, f"group_by must be one of: {', '.join(GROUP_BY_CHOICES)}.")
+                return
+            try:
+                days = int(params["days"]) if params.get("days") else None
+                since = parse_iso_date(params["since"]) if params.get("since") else None
+                until = parse_iso_date(params["until"]) if params.get("until") else None
+            except (ValueError, argparse.ArgumentTypeError):
+                self._send_error(400, "days must be an integer; since/until must be YYYY-MM-DD.")
+                return
+            if days is not None and not 1 <= days <= SERVE_MAX_DAYS:
+                self._send_error(400, f"days must be between 1 and {SERVE_MAX_DAYS}.")
+                return
+            try:
+                if route == "forecast":
+                    # days is the lookback, as with --forecast DAYS; until sets the as-of day.
+                    body = service.answer(provider, route, model=params.get("model"), forecast=days or 14, as_of=until)
+                else:
+                    body = service.answer(provider, route, day_window(days, since, until), params.get("model"), group_by)
+            except NoUsageData as exc:
+                self._send_error(404, str(exc))
+                return
+            except (OverflowError, ValueError):
+                # Windows or forecast months reaching past date.min/date.max.
+                self._send_error(400, "days/since/until reach outside the supported date range.")
+                return
+            self._send(200, body)
+
+        def _send_error(self, status: int, message: str) -> None:
+            self._send(status, json.dumps({"error": message}).encode("utf-8"))
+
+        def _send(self, status: int, body: bytes) -> None:
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def address_string(self) -> str:
+            # Unix socket peers have no (host, port) address.
+            return self.client_address[0] if self.client_address else "unix"
+
+        def log_message(self, format: str, *args: Any) -> None:
+            pass
+
+    class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+
+    if args.socket:
+        if os.path.exists(args.socket):
+            os.unlink(args.socket)
+        server: socketserver.BaseServer = ThreadingUnixHTTPServer(args.socket, UsageRequestHandler)
+        os.chmod(args.socket, 0o600)
+        where = f"unix:{args.socket}"
+    else:
+        server = ThreadingHTTPServer((args.host, args.port), UsageRequestHandler)
+        where = f"http://{args.host}:{server.server_address[1]}"
+    return server, where
+
+
+def serve_main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(
+        prog="model_usage.py serve",
+        description="Serve model usage summaries from a payload loaded once and refreshed in the background.",
+    )
+    parser.add_argument(
+        "--provider",
+        action="append",
+        choices=[*PROVIDERS, "all"],
+        help="Provider to serve (default: codex). Repeat, or pass 'all'.",
+    )
+    parser.add_argument("--input", help="Path to codexbar cost JSON (or '-' for stdin, loaded once).")
+    parser.add_argument("--host", default="127.0.0.1", help="HTTP bind address (default: 127.0.0.1).")
+    parser.add_argument("--port", type=int, default=8765, help="HTTP port (default: 8765; 0 picks a free port).")
+    parser.add_argument("--socket", help="Serve HTTP over this Unix socket path instead of TCP.")
+    parser.add_argument("--refresh", type=float, default=60.0, help="Seconds between background refreshes.")
+    args = parser.parse_args(argv)
+
+    service = UsageService(args.input, resolve_providers(args.provider))
+    try:
+        service.refresh()
+    except Exception as exc:
+        eprint(str(exc))
+        return 1
+
+    server, where = build_server(args, service)
+
+    if args.input != "-" and args.refresh > 0:
+
+        def refresh_loop() -> None:
+            while True:
+                time.sleep(args.refresh)
+                try:
+                    service.refresh()
+                except Exception as exc:
+                    eprint(f"refresh failed: {exc}")
+
+        threading.Thread(target=refresh_loop, name="model-usage-refresh", daemon=True).start()
+
+    eprint(f"Serving model usage on {where}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if args.socket and os.path.exists(args.socket):
+            os.unlink(args.socket)
+    return 0
+
+
+def stream_usage(args: argparse.Namespace, provider: str) -> UsageAggregate:
+    with open_payload_stream(args.input, provider) as handle:
+        return usage_from_rows(args, provider, PayloadStream(handle).iter_daily(provider))
+
+
+def index_is_current(args: argparse.Namespace, providers: List[str]) -> bool:
+    """Whether --index can answer without reading the payload again.
+
+    True with --index-only, or when the --input file's size and mtime match the
+    ones every provider was last ingested from.
+    """
+    if not args.refresh_index:
+        return True
+    if args.rebuild_index or args.input_signature is None:
+        return False
+    index = CostIndex(args.index_path or default_index_path())
+    try:
+        return all(index.is_current(provider, args.input_signature) for provider in providers)
+    finally:
+        index.close()
+
+
+def query_index(args: argparse.Namespace, provider: str) -> UsageAggregate:
+    if not index_is_current(args, [provider]):
+        return stream_usage(args, provider)
+    index = CostIndex(args.index_path or default_index_path())
+    try:
+        with stage("aggregate"):
+            return index.query(provider, args.window, CostColumns() if args.group_by or args.forecast else None)
+    finally:
+        index.close()
+
+
+def stream_usages(args: argparse.Namespace, providers: List[str]) -> Dict[str, UsageAggregate]:
+    """One incremental pass over an --input payload for several providers (--stream, --index)."""
+    usages: Dict[str, UsageAggregate] = {}
+    with open_payload_stream(args.input, providers[0]) as handle:
+        pairs = PayloadStream(handle).iter_providers(providers)
+        for provider, group in itertools.groupby(pairs, key=lambda pair: pair[0]):
+            usages[provider] = usage_from_rows(args, provider, (entry for _, entry in group))
+    # A provider whose daily list is empty or missing yields no rows; it still
+    # gets an (empty) aggregate, and --index drops whatever it held for it.
+    for provider in providers:
+        if provider not in usages:
+            usages[provider] = usage_from_rows(args, provider, iter(()))
+    return usages
+
+
+def index_usage(
+    args: argparse.Namespace, provider: str, rows: Iterable[Dict[str, Any]], columns: Optional[CostColumns]
+) -> UsageAggregate:
+    index = CostIndex(args.index_path or default_index_path())
+    try:
+        with stage("index"):
+            if args.rebuild_index:
+                index.clear(provider)
+            index.ingest(provider, rows, args.input_signature)
+        with stage("aggregate"):
+            return index.query(provider, args.window, columns)
+    finally:
+        index.close()
@@ -0,0 +1,476 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for gen.py against the local Images API stub (stub_images_api.py).
+
+Usage:
+    python3 bench_gen.py concurrency --count 8 --latency 0.5 --levels 1 2 4 8
+    python3 bench_gen.py pool --count 16 --concurrency 4 --tls
+    python3 bench_gen.py retry --script 429,429,500,503 --retry-after 1
+    python3 bench_gen.py cache --count 8 --latency 0.5
+    python3 bench_gen.py memory --image-size 4096x4096 --levels 1 4
+    python3 bench_gen.py jobs --rows 500 5000 --concurrency 8
+    python3 bench_gen.py gallery --count 40 --image-size 1536x1024
+    python3 bench_gen.py async --count 16 --concurrency 4
+    python3 bench_gen.py downloads --count 8 --latency 0.2 --download-latency 0.4 --truncate 3
+"""
+
+import argparse
+import asyncio
+import filecmp
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import textwrap
+import time
+from pathlib import Path
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(SCRIPT_DIR))
+
+from stub_images_api import StubImagesAPI  # noqa: E402
+
+
+def run_gen(base_url: str, out_dir: Path, extra: list[str], check: bool = True) -> tuple[float, str]:
+    env = dict(os.environ, OPENAI_BASE_URL=base_url, OPENAI_API_KEY="stub")
+    cmd = [sys.executable, str(SCRIPT_DIR / "gen.py"), "--out-dir", str(out_dir), *extra]
+    start = time.perf_counter()
+    proc = subprocess.run(cmd, env=env, capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    if check and proc.returncode != 0:
+        raise RuntimeError(f"gen.py failed ({proc.returncode}): {proc.stderr.strip()}")
+    return elapsed, proc.stdout
+
+
+def progress_lines(log: str) -> list[str]:
+    return [line for line in log.splitlines() if line.startswith("[")]
+
+
+def stable_outputs(out_dir: Path) -> list[str]:
+    """Output files that must not depend on how the batch ran, relative to ``out_dir``.
+
+    Gallery pages embed the output path and manifest lines are in completion order.
+    """
+    return sorted(
+        path.relative_to(out_dir).as_posix()
+        for path in out_dir.rglob("*")
+        if path.is_file() and path.suffix != ".html" and path.name != "manifest.jsonl"
+    )
+
+
+def same_outputs(left: Path, right: Path) -> bool:
+    """Images, thumbnails and prompts.json match byte for byte."""
+    files = stable_outputs(left)
+    if files != stable_outputs(right):
+        return False
+    _, mismatch, errors = filecmp.cmpfiles(left, right, files, shallow=False)
+    return not mismatch and not errors
+
+
+def bench_concurrency(args: argparse.Namespace) -> int:
+    """Wall time of one batch per --concurrency level; output must not depend on the level."""
+    gen_args = ["--prompt", args.prompt, "--count", str(args.count), "--model", args.model]
+    with StubImagesAPI(latency=args.latency) as stub, tempfile.TemporaryDirectory() as tmp:
+        baseline_dir: Path | None = None
+        baseline_log = ""
+        baseline_time = 0.0
+        print(f"count={args.count} latency={args.latency}s model={args.model}")
+        for level in args.levels:
+            out_dir = Path(tmp) / f"c{level}"
+            elapsed, log = run_gen(stub.base_url, out_dir, [*gen_args, "--concurrency", str(level)])
+            if baseline_dir is None:
+                baseline_dir, baseline_log, baseline_time = out_dir, log, elapsed
+            elif progress_lines(log) != progress_lines(baseline_log) or not same_outputs(baseline_dir, out_dir):
+                print(f"Output for --concurrency {level} differs from --concurrency {args.levels[0]}", file=sys.stderr)
+                return 1
+            ideal = args.count * args.latency / min(level, args.count)
+            print(
+                f"--concurrency {level:<3} {elapsed:7.2f} s  speedup {baseline_time / elapsed:5.2f}x"
+                f"  (ideal {ideal:5.2f} s)"
+            )
+        print(json.dumps(stub.stats()))
+    return 0
+
+
+def make_cert(directory: Path) -> Path:
+    """Self-signed localhost certificate+key in one PEM file (needs the openssl binary)."""
+    pem = directory / "stub.pem"
+    subprocess.run(
+        [
+            "openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+            "-subj", "/CN=127.0.0.1", "-addext", "subjectAltName=IP:127.0.0.1,DNS:localhost",
+            "-keyout", str(pem), "-out", str(pem),
+        ],
+        check=True,
+        capture_output=True,
+    )
+    return pem
+
+
+def bench_pool(args: argparse.Namespace) -> int:
+    """Connections opened for a batch at several --connections-per-host limits."""
+    gen_args = ["--prompt", args.prompt, "--count", str(args.count), "--model", args.model]
+    with tempfile.TemporaryDirectory() as tmp:
+        certfile = str(make_cert(Path(tmp))) if args.tls else None
+        if certfile:
+            os.environ["SSL_CERT_FILE"] = certfile
+        print(f"count={args.count} concurrency={args.concurrency} model={args.model} tls={bool(certfile)}")
+        for limit in args.limits:
+            with StubImagesAPI(latency=args.latency, certfile=certfile) as stub:
+                out_dir = Path(tmp) / f"h{limit}"
+                extra = ["--concurrency", str(args.concurrency), "--connections-per-host", str(limit)]
+                elapsed, _ = run_gen(stub.base_url, out_dir, [*gen_args, *extra])
+                stats = stub.stats()
+            calls = stats["requests"] + stats["downloads"]
+            print(
+                f"--connections-per-host {limit:<3} {elapsed:7.2f} s  {calls} calls over"
+                f" {stats['connections']} connections"
+            )
+    return 0
+
+
+def bench_retry(args: argparse.Namespace) -> int:
+    """A batch against scripted 429/5xx answers must still write every image."""
+    script = [int(status) for status in args.script.split(",") if status.strip()]
+    gen_args = ["--prompt", args.prompt, "--count", str(args.count), "--concurrency", str(args.concurrency)]
+    if args.rate_limit:
+        gen_args += ["--rate-limit", str(args.rate_limit)]
+    print(f"count={args.count} concurrency={args.concurrency} script={script} retry-after={args.retry_after}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for retries in (0, args.max_retries):
+            with StubImagesAPI(latency=args.latency, script=script, retry_after=args.retry_after) as stub:
+                out_dir = Path(tmp) / f"r{retries}"
+                elapsed, _ = run_gen(stub.base_url, out_dir, [*gen_args, "--max-retries", str(retries)], check=False)
+                stats = stub.stats()
+            written = len(json.loads((out_dir / "prompts.json").read_text(encoding="utf-8")))
+            print(
+                f"--max-retries {retries:<3} {elapsed:7.2f} s  {written}/{args.count} images"
+                f"  {stats['failures']} scripted failures"
+            )
+        if written != args.count:
+            print(f"Only {written} of {args.count} images written with retries on", file=sys.stderr)
+            return 1
+    return 0
+
+
+def bench_cache(args: argparse.Namespace) -> int:
+    """A cold run fills --cache-dir; a warm rerun must match it without calling the API."""
+    gen_args = ["--prompt", args.prompt, "--count", str(args.count), "--model", args.model]
+    gen_args += ["--concurrency", str(args.concurrency)]
+    with StubImagesAPI(latency=args.latency) as stub, tempfile.TemporaryDirectory() as tmp:
+        gen_args += ["--cache-dir", str(Path(tmp) / "cache")]
+        print(f"count={args.count} latency={args.latency}s model={args.model}")
+        for run in ("cold", "warm"):
+            before = stub.requests
+            elapsed, _ = run_gen(stub.base_url, Path(tmp) / run, gen_args)
+            print(f"{run}  {elapsed:7.2f} s  {stub.requests - before} API requests")
+        if not same_outputs(Path(tmp) / "cold", Path(tmp) / "warm"):
+            print("Warm output differs from cold output", file=sys.stderr)
+            return 1
+    return 0
+
+
+# Prints the calling program's peak RSS in KiB. VmHWM is the program's own peak;
+# ru_maxrss on Linux also counts the forked copy of the parent (which holds the
+# stub's image) before exec.
+PEAK_RSS = """
+import resource, sys
+try:
+    with open("/proc/self/status") as status:
+        peak_kib = next(int(line.split()[1]) for line in status if line.startswith("VmHWM:"))
+except OSError:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_kib = peak // 1024 if sys.platform == "darwin" else peak
+print(peak_kib, file=sys.stderr)
+"""
+
+# Runs N concurrent gpt-image requests in a fresh interpreter, either streaming b64_json
+# into the file or with the old read-parse-b64decode-write sequence.
+MEMORY_CHILD = textwrap.dedent(
+    """
+    import base64, sys, threading
+    from pathlib import Path
+    sys.path.insert(0, sys.argv[1])
+    import gen
+    mode, out_dir, workers = sys.argv[2], Path(sys.argv[3]), int(sys.argv[4])
+    pool = gen.ConnectionPool(per_host=max(1, workers))
+
+    def one(i):
+        path = out_dir / f"{mode}-{i}.png"
+        if mode == "stream":
+            gen.request_images("stub", "p", "gpt-image-1", "1024x1024", "high", pool=pool, image_path=path)
+        else:
+            res = gen.request_images("stub", "p", "gpt-image-1", "1024x1024", "high", pool=pool)
+            path.write_bytes(base64.b64decode(res["data"][0]["b64_json"]))
+
+    threads = [threading.Thread(target=one, args=(i,)) for i in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    """
+) + PEAK_RSS
+
+# Runs gen.py's CLI (argv after the script path) in-process, then reports peak RSS.
+GEN_CHILD = (
+    textwrap.dedent(
+        """
+        import runpy, sys
+        sys.argv = sys.argv[1:]
+        try:
+            runpy.run_path(sys.argv[0], run_name="__main__")
+        except SystemExit as exit:
+            code = exit.code
+        """
+    )
+    + PEAK_RSS
+    + "sys.exit(code)\n"
+)
+
+
+def peak_rss_mib(base_url: str, mode: str, out_dir: Path, workers: int) -> float:
+    env = dict(os.environ, OPENAI_BASE_URL=base_url)
+    cmd = [sys.executable, "-c", MEMORY_CHILD, str(SCRIPT_DIR), mode, str(out_dir), str(workers)]
+    proc = subprocess.run(cmd, env=env, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"{mode} run failed ({proc.returncode}): {proc.stderr.strip()}")
+    return int(proc.stderr.split()[-1]) / 1024
+
+
+def bench_memory(args: argparse.Namespace) -> int:
+    """Peak RSS of buffered vs streamed b64_json handling for large images."""
+    with StubImagesAPI(image_size=args.image_size) as stub, tempfile.TemporaryDirectory() as tmp:
+        image_mib = len(stub.image) / (1 << 20)
+        print(f"image={args.image_size} ({image_mib:.1f} MiB png, {len(stub.image_b64) / (1 << 20):.1f} MiB b64)")
+        idle = peak_rss_mib(stub.base_url, "idle", Path(tmp), 0)
+        print(f"interpreter + gen import: {idle:7.1f} MiB")
+        for workers in args.levels:
+            buffered = peak_rss_mib(stub.base_url, "buffered", Path(tmp), workers)
+            streamed = peak_rss_mib(stub.base_url, "stream", Path(tmp), workers)
+            files = sorted(Path(tmp).glob("*.png"))
+            if any(path.read_bytes() != stub.image for path in files):
+                print("Decoded image differs from the stub's PNG", file=sys.stderr)
+                return 1
+            for path in files:
+                path.unlink()
+            print(
+                f"{workers} in flight  buffered {buffered:7.1f} MiB  streamed {streamed:7.1f} MiB"
+                f"  ({(buffered - idle) / max(streamed - idle, 0.1):.1f}x less above idle)"
+            )
+    return 0
+
+
+def bench_jobs(args: argparse.Namespace) -> int:
+    """Peak RSS of --prompts-file batches of growing size; it should track --queue-depth only."""
+    sizes = ["1024x1024", "1536x1024", "1024x1536"]
+    with StubImagesAPI() as stub, tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, OPENAI_BASE_URL=stub.base_url, OPENAI_API_KEY="stub")
+        print(f"concurrency={args.concurrency} queue-depth={args.queue_depth or 2 * args.concurrency}")
+        for rows in args.rows:
+            jobs = Path(tmp) / f"jobs-{rows}.jsonl"
+            with open(jobs, "w", encoding="utf-8") as handle:
+                for i in range(rows):
+                    handle.write(json.dumps({"prompt": f"catalogue item {i}", "size": sizes[i % len(sizes)]}) + "\n")
+            out_dir = Path(tmp) / f"out-{rows}"
+            cmd = [sys.executable, "-c", GEN_CHILD, str(SCRIPT_DIR / "gen.py"), "--prompts-file", str(jobs)]
+            cmd += ["--out-dir", str(out_dir), "--concurrency", str(args.concurrency)]
+            if args.queue_depth:
+                cmd += ["--queue-depth", str(args.queue_depth)]
+            start = time.perf_counter()
+            proc = subprocess.run(cmd, env=env, capture_output=True, text=True)
+            elapsed = time.perf_counter() - start
+            if proc.returncode != 0:
+                print(f"gen.py failed ({proc.returncode}): {proc.stderr.strip()}", file=sys.stderr)
+                return 1
+            written = len(json.loads((out_dir / "prompts.json").read_text(encoding="utf-8")))
+            peak = int(proc.stderr.split()[-1]) / 1024
+            print(f"{rows:>7} rows  {elapsed:7.2f} s  {written} images  peak RSS {peak:6.1f} MiB")
+    return 0
+
+
+def bench_gallery(args: argparse.Namespace) -> int:
+    """Bytes a browser loads for gallery page 1: thumbnails vs the full-size originals."""
+    gen_args = ["--count", str(args.count), "--concurrency", str(args.concurrency)]
+    gen_args += ["--gallery-page-size", str(args.page_size), "--thumb-width", str(args.thumb_width)]
+    with StubImagesAPI(image_size=args.image_size) as stub, tempfile.TemporaryDirectory() as tmp:
+        out_dir = Path(tmp) / "out"
+        elapsed, _ = run_gen(stub.base_url, out_dir, gen_args)
+        page = (out_dir / "index.html").read_text(encoding="utf-8")
+        items = json.loads((out_dir / "prompts.json").read_text(encoding="utf-8"))[: args.page_size]
+        thumbs = sorted((out_dir / "thumbs").glob("*")) if (out_dir / "thumbs").is_dir() else []
+        originals = sum((out_dir / item["file"]).stat().st_size for item in items)
+        shown = sum(path.stat().st_size for path in thumbs if f'src="thumbs/{path.name}"' in page)
+        pages = len(list(out_dir.glob("page-*.html"))) + 1
+        print(f"count={args.count} image={args.image_size} page-size={args.page_size} {elapsed:.2f} s, {pages} page(s)")
+        if not thumbs:
+            print("No thumbnails (install Pillow); the gallery shows originals")
+            return 0
+        print(f"page 1 images: originals {originals / 1024:9.1f} KiB  thumbnails {shown / 1024:9.1f} KiB")
+    return 0
+
+
+def bench_async(args: argparse.Namespace) -> int:
+    """gen.generate_many inside an event loop that keeps serving a 10 ms heartbeat.
+
+    A second run closes the generator after its first result; the jobs still in
+    flight must not stall the loop.
+    """
+    import gen
+
+    async def run(base_url: str, out_dir: Path, early_close: bool) -> tuple[float, float, list[int]]:
+        os.environ["OPENAI_BASE_URL"] = base_url
+        out_dir.mkdir()
+        generator = gen.ImageGenerator("stub", out_dir, pool=gen.ConnectionPool(per_host=args.concurrency))
+        jobs = [{"prompt": f"{args.prompt} #{i}", "model": args.model} for i in range(args.count)]
+        lag = 0.0
+        stop = asyncio.Event()
+
+        async def heartbeat() -> None:
+            nonlocal lag
+            loop = asyncio.get_running_loop()
+            while not stop.is_set():
+                expected = loop.time() + 0.01
+                await asyncio.sleep(0.01)
+                lag = max(lag, loop.time() - expected)
+
+        ticker = asyncio.create_task(heartbeat())
+        order = []
+        start = time.perf_counter()
+        results = gen.generate_many(jobs, generator, concurrency=args.concurrency)
+        try:
+            async for result in results:
+                if result.error:
+                    raise RuntimeError(result.error)
+                order.append(result.index)
+                if early_close:
+                    break
+            await results.aclose()
+            elapsed = time.perf_counter() - start
+            # Keep the heartbeat going while the abandoned requests finish.
+            await asyncio.sleep(args.latency * 2 if early_close else 0)
+        finally:
+            stop.set()
+            await ticker
+            await asyncio.to_thread(generator.close)
+        return elapsed, lag, order
+
+    print(f"count={args.count} concurrency={args.concurrency} latency={args.latency}s (+ up to {args.latency}s jitter)")
+    with StubImagesAPI(latency=args.latency, jitter=args.latency) as stub, tempfile.TemporaryDirectory() as tmp:
+        elapsed, lag, order = asyncio.run(run(stub.base_url, Path(tmp) / "full", early_close=False))
+        images = len(list((Path(tmp) / "full").glob("*.png")))
+        ideal = args.count * args.latency / min(args.concurrency, args.count)
+        print(f"{images} images in {elapsed:.2f} s (no-jitter ideal {ideal:.2f} s); max heartbeat lag {lag * 1000:.1f} ms")
+        print(f"completion order: {order}")
+        closed, close_lag, _ = asyncio.run(run(stub.base_url, Path(tmp) / "early", early_close=True))
+        print(f"early close after 1 result: {closed:.2f} s; max heartbeat lag {close_lag * 1000:.1f} ms")
+    if close_lag > max(0.1, args.latency):
+        print("Closing generate_many early stalled the event loop", file=sys.stderr)
+        return 1
+    return 0 if images == args.count else 1
+
+
+def bench_downloads(args: argparse.Namespace) -> int:
+    """URL images: API calls overlapping downloads, and cut-off downloads resumed with Range."""
+    gen_args = ["--prompt", args.prompt, "--count", str(args.count), "--model", "dall-e-2"]
+    gen_args += ["--concurrency", str(args.concurrency)]
+    runs = [("--queue-depth 1 (no overlap)", ["--queue-depth", "1"])]
+    runs += [(f"--download-concurrency {level}", ["--download-concurrency", str(level)]) for level in args.levels]
+    print(f"count={args.count} concurrency={args.concurrency} latency={args.latency}s download-latency={args.download_latency}s")
+    with tempfile.TemporaryDirectory() as tmp:
+        for run, (name, extra) in enumerate(runs):
+            with StubImagesAPI(latency=args.latency, download_latency=args.download_latency) as stub:
+                elapsed, _ = run_gen(stub.base_url, Path(tmp) / f"run{run}", [*gen_args, *extra])
+            print(f"{name:<32}{elapsed:7.2f} s")
+
+        with StubImagesAPI(latency=args.latency, truncate=args.truncate) as stub:
+            out_dir = Path(tmp) / "truncated"
+            elapsed, _ = run_gen(stub.base_url, out_dir, gen_args)
+            stats = stub.stats()
+            intact = sum(path.read_bytes() == stub.image for path in out_dir.glob("*.png"))
+        print(
+            f"--truncate {args.truncate:<21}{elapsed:7.2f} s  {intact}/{args.count} intact images,"
+            f" {stats['downloads']} downloads, {stats['ranges']} Range requests"
+        )
+        if intact != args.count or stats["ranges"] != args.truncate:
+            print("Truncated downloads were not resumed into intact images", file=sys.stderr)
+            return 1
+    return 0
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Benchmark gen.py against a local Images API stub.")
+    sub = ap.add_subparsers(dest="bench", required=True)
+    concurrency = sub.add_parser("concurrency", help="Batch wall time for several --concurrency levels.")
+    concurrency.add_argument("--count", type=int, default=8)
+    concurrency.add_argument("--latency", type=float, default=0.5, help="Stub seconds per generation.")
+    concurrency.add_argument("--levels", type=int, nargs="+", default=[1, 2, 4, 8])
+    concurrency.add_argument("--model", default="gpt-image-1")
+    concurrency.add_argument("--prompt", default="a lobster astronaut, 35mm film still")
+    pool = sub.add_parser("pool", help="Keep-alive connection reuse per --connections-per-host limit.")
+    pool.add_argument("--count", type=int, default=16)
+    pool.add_argument("--concurrency", type=int, default=4)
+    pool.add_argument("--latency", type=float, default=0.1, help="Stub seconds per generation.")
+    pool.add_argument("--limits", type=int, nargs="+", default=[1, 2, 4])
+    pool.add_argument("--model", default="dall-e-2", help="dall-e models also exercise URL downloads.")
+    pool.add_argument("--prompt", default="a lobster astronaut, 35mm film still")
+    pool.add_argument("--tls", action="store_true", help="Serve the stub over HTTPS with a throwaway certificate.")
+    retry = sub.add_parser("retry", help="Batch against scripted 429/5xx answers, without and with retries.")
+    retry.add_argument("--count", type=int, default=8)
+    retry.add_argument("--concurrency", type=int, default=4)
+    retry.add_argument("--latency", type=float, default=0.1, help="Stub seconds per generation.")
+    retry.add_argument("--script", default="429,429,500,503", help="Statuses for the first generation requests.")
+    retry.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds on scripted 429s.")
+    retry.add_argument("--max-retries", type=int, default=5)
+    retry.add_argument("--rate-limit", type=float, default=0, help="gen.py --rate-limit (requests per minute).")
+    retry.add_argument("--prompt", default="a lobster astronaut, 35mm film still")
+    cache = sub.add_parser("cache", help="Cold vs warm --cache-dir run of the same batch.")
+    cache.add_argument("--count", type=int, default=8)
+    cache.add_argument("--concurrency", type=int, default=1)
+    cache.add_argument("--latency", type=float, default=0.5, help="Stub seconds per generation.")
+    cache.add_argument("--model", default="gpt-image-1")
+    cache.add_argument("--prompt", default="a lobster astronaut, 35mm film still")
+    memory = sub.add_parser("memory", help="Peak RSS of buffered vs streamed b64_json decoding.")
+    memory.add_argument("--image-size", default="4096x4096", help="WIDTHxHEIGHT of the stub's noise PNG.")
+    memory.add_argument("--levels", type=int, nargs="+", default=[1, 4], help="Requests in flight.")
+    jobs = sub.add_parser("jobs", help="Peak RSS of --prompts-file batches of growing size.")
+    jobs.add_argument("--rows", type=int, nargs="+", default=[500, 5000])
+    jobs.add_argument("--concurrency", type=int, default=8)
+    jobs.add_argument("--queue-depth", type=int, default=0)
+    gallery = sub.add_parser("gallery", help="Gallery page weight with thumbnails vs originals.")
+    gallery.add_argument("--count", type=int, default=40)
+    gallery.add_argument("--concurrency", type=int, default=4)
+    gallery.add_argument("--image-size", default="1536x1024", help="WIDTHxHEIGHT of the stub's noise PNG.")
+    gallery.add_argument("--page-size", type=int, default=20)
+    gallery.add_argument("--thumb-width", type=int, default=320)
+    aio = sub.add_parser("async", help="gen.generate_many inside an asyncio program.")
+    aio.add_argument("--count", type=int, default=16)
+    aio.add_argument("--concurrency", type=int, default=4)
+    aio.add_argument("--latency", type=float, default=0.1, help="Stub seconds per generation (plus random jitter).")
+    aio.add_argument("--model", default="gpt-image-1")
+    aio.add_argument("--prompt", default="a lobster astronaut, 35mm film still")
+    downloads = sub.add_parser("downloads", help="URL image downloads overlapping API calls, and Range resume.")
+    downloads.add_argument("--count", type=int, default=8)
+    downloads.add_argument("--concurrency", type=int, default=1)
+    downloads.add_argument("--latency", type=float, default=0.2, help="Stub seconds per generation.")
+    downloads.add_argument("--download-latency", type=float, default=0.4, help="Stub seconds before each download.")
+    downloads.add_argument("--levels", type=int, nargs="+", default=[1, 4], help="--download-concurrency values.")
+    downloads.add_argument("--truncate", type=int, default=3, help="Downloads the stub cuts off halfway.")
+    downloads.add_argument("--prompt", default="a lobster astronaut, 35mm film still")
+    args = ap.parse_args()
+    benches = {
+        "concurrency": bench_concurrency,
+        "pool": bench_pool,
+        "retry": bench_retry,
+        "cache": bench_cache,
+        "memory": bench_memory,
+        "jobs": bench_jobs,
+        "gallery": bench_gallery,
+        "async": bench_async,
+        "downloads": bench_downloads,
+    }
+    return benches[args.bench](args)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
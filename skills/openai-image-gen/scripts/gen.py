@@ -1,15 +1,37 @@
 #!/usr/bin/env python3
 import argparse
-import base64
+import asyncio
+import binascii
+import csv
 import datetime as dt
+import email.utils
+import hashlib
+import html
+import http.client
 import json
+import math
 import os
 import random
 import re
+import shutil
+import ssl
+import subprocess
 import sys
-import urllib.error
-import urllib.request
+import textwrap
+import threading
+import time
+import urllib.parse
+from array import array
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
+from typing import Any, AsyncIterator, Callable, Iterable, Iterator, NamedTuple, Optional, Union
+
+DEFAULT_BASE_URL = "https://api.openai.com/v1"
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+RESPONSE_CHUNK_SIZE = 256 * 1024
+CONTENT_RANGE_RE = re.compile(r"bytes (\d+)-\d+/(\d+|\*)$")
 
 
 def slugify(text: str) -> str:
@@ -74,8 +96,313 @@ def get_model_defaults(model: str) -> tuple[str, str]:
         return ("1024x1024", "high")
 
 
-def request_images(
-    api_key: str,
+class ConnectionPool:
+    """Keep-alive http.client connections shared by API calls and image downloads.
+
+    At most ``per_host`` connections are open (or in use) per scheme/host/port;
+    further requests to that host wait for a free slot.
+    """
+
+    # Errors meaning a reused keep-alive connection was closed by the server before
+    # it read the request; the request is resent once on a fresh connection.
+    STALE_ERRORS = (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError)
+
+    def __init__(self, per_host: int = 4, timeout: float = 300) -> None:
+        self.per_host = per_host
+        self.timeout = timeout
+        self.opened = 0
+        self._lock = threading.Lock()
+        self._idle: dict[tuple, list[http.client.HTTPConnection]] = {}
+        self._slots: dict[tuple, threading.BoundedSemaphore] = {}
+        self._ssl_context: Optional[ssl.SSLContext] = None
+
+    def _connect(self, key: tuple) -> http.client.HTTPConnection:
+        scheme, host, port = key
+        with self._lock:
+            self.opened += 1
+            if scheme == "https" and self._ssl_context is None:
+                self._ssl_context = ssl.create_default_context()
+        if scheme == "https":
+            return http.client.HTTPSConnection(host, port, timeout=self.timeout, context=self._ssl_context)
+        return http.client.HTTPConnection(host, port, timeout=self.timeout)
+
+    @contextmanager
+    def open(
+        self, method: str, url: str, body: Optional[bytes] = None, headers: Optional[dict] = None
+    ) -> Iterator[http.client.HTTPResponse]:
+        """Send a request and yield the response; the connection goes back to the pool afterwards."""
+        parts = urllib.parse.urlsplit(url)
+        if parts.scheme not in ("http", "https"):
+            raise RuntimeError(f"Unsupported URL scheme: {url}")
+        key = (parts.scheme, parts.hostname or "", parts.port or (443 if parts.scheme == "https" else 80))
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+        with self._lock:
+            slot = self._slots.setdefault(key, threading.BoundedSemaphore(self.per_host))
+        with slot:
+            with self._lock:
+                idle = self._idle.setdefault(key, [])
+                conn = idle.pop() if idle else None
+            reused = conn is not None
+            if conn is None:
+                conn = self._connect(key)
+            try:
+                try:
+                    conn.request(method, path, body=body, headers=headers or {})
+                    resp = conn.getresponse()
+                except self.STALE_ERRORS:
+                    if not reused:
+                        raise
+                    conn.close()
+                    conn = self._connect(key)
+                    conn.request(method, path, body=body, headers=headers or {})
+                    resp = conn.getresponse()
+                yield resp
+            except BaseException:
+                conn.close()
+                raise
+            if resp.will_close or not resp.isclosed():
+                # Unread body or server-side close: the connection cannot be reused.
+                conn.close()
+            else:
+                with self._lock:
+                    self._idle[key].append(conn)
+
+    def request(
+        self, method: str, url: str, body: Optional[bytes] = None, headers: Optional[dict] = None
+    ) -> tuple[int, http.client.HTTPMessage, bytes]:
+        with self.open(method, url, body, headers) as resp:
+            return resp.status, resp.headers, resp.read()
+
+    def download(self, url: str, path: Path) -> tuple[int, Optional[int]]:
+        """Stream ``url`` into ``path``, continuing a partial file with a Range request.
+
+        Returns the bytes received and the full size the server announced (None if it
+        sent no length). A 200 answer to a Range request rewrites the file from the start.
+        """
+        offset = path.stat().st_size if path.exists() else 0
+        headers = {"Range": f"bytes={offset}-"} if offset else {}
+        size = 0
+        with self.open("GET", url, headers=headers) as resp:
+            if resp.status == 206 and offset:
+                match = CONTENT_RANGE_RE.match(resp.headers.get("Content-Range") or "")
+                if not match or int(match.group(1)) != offset:
+                    resp.read()
+                    raise APIError(f"unexpected Content-Range {resp.headers.get('Content-Range')!r}")
+                mode, total = "ab", int(match.group(2)) if match.group(2) != "*" else None
+            elif resp.status == 200:
+                length = resp.headers.get("Content-Length")
+                mode, total = "wb", int(length) if length and length.isdigit() else None
+            else:
+                resp.read()
+                raise APIError(f"HTTP {resp.status}", resp.status, parse_retry_after(resp.headers))
+            with open(path, mode) as handle:
+                while True:
+                    chunk = resp.read(DOWNLOAD_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    handle.write(chunk)
+                    size += len(chunk)
+        return size, total
+
+    def close(self) -> None:
+        with self._lock:
+            for conns in self._idle.values():
+                for conn in conns:
+                    conn.close()
+            self._idle.clear()
+
+
+class APIError(RuntimeError):
+    """A failed Images API call; ``retryable`` errors are worth sending again."""
+
+    RETRYABLE_STATUSES = {408, 409, 429, 500, 502, 503, 504}
+
+    def __init__(self, message: str, status: int = 0, retry_after: Optional[float] = None) -> None:
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+    @property
+    def retryable(self) -> bool:
+        # status 0 is a connection-level failure (refused, reset, timed out).
+        return self.status == 0 or self.status in self.RETRYABLE_STATUSES
+
+
+def parse_retry_after(headers: http.client.HTTPMessage) -> Optional[float]:
+    """Seconds to wait from ``retry-after-ms`` or ``Retry-After`` (seconds or an HTTP date)."""
+    millis = headers.get("retry-after-ms")
+    if millis:
+        try:
+            return max(0.0, float(millis) / 1000)
+        except ValueError:
+            pass
+    value = headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, (when - dt.datetime.now(dt.timezone.utc)).total_seconds())
+
+
+class EventLog:
+    """JSON-lines batch events, one flushed line each, for following a run live (``tail -f``)."""
+
+    def __init__(self, path: Path) -> None:
+        self._handle = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def emit(self, event: str, **fields: Any) -> None:
+        line = json.dumps({"ts": dt.datetime.now(dt.timezone.utc).isoformat(timespec="milliseconds"), "event": event, **fields})
+        with self._lock:
+            self._handle.write(line + "\n")
+            self._handle.flush()
+
+    def close(self) -> None:
+        self._handle.close()
+
+
+class RequestTrace:
+    """Timing spans (ms), byte counts and attempts for one job.
+
+    Spans: ``queue`` (submitted until a worker picks it up), ``wait`` (rate limit and
+    retry backoff), ``api`` (HTTP round trips), ``write`` (decoding and writing the
+    image), ``download`` (fetching URL images), ``cache`` (placing a cache hit) and
+    ``total``.
+    """
+
+    def __init__(self, index: int = 0, events: Optional[EventLog] = None, started: Optional[float] = None) -> None:
+        self.index = index
+        self.events = events
+        self.started = time.perf_counter() if started is None else started
+        self.ms: dict[str, float] = {}
+        self.bytes: dict[str, int] = {}
+        self.attempts = 0
+
+    def add(self, name: str, seconds: float) -> None:
+        self.ms[name] = self.ms.get(name, 0.0) + seconds * 1000
+
+    @contextmanager
+    def span(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def count(self, name: str, size: int) -> None:
+        self.bytes[name] = self.bytes.get(name, 0) + size
+
+    def retry(self, attempt: int, delay: float, error: "APIError") -> None:
+        if self.events:
+            self.events.emit("retry", index=self.index, attempt=attempt, delay=round(delay, 3), status=error.status, error=str(error))
+
+    def finish(self) -> dict:
+        """Manifest fields: ``ms`` per span (with ``total``), ``<name>_bytes`` and ``attempts``."""
+        self.ms["total"] = (time.perf_counter() - self.started) * 1000
+        record: dict = {"ms": {name: round(value, 1) for name, value in self.ms.items()}}
+        record.update({f"{name}_bytes": size for name, size in self.bytes.items()})
+        record["attempts"] = self.attempts
+        return record
+
+
+class RequestScheduler:
+    """Token-bucket rate limit plus retries with exponential backoff and full jitter.
+
+    A ``Retry-After`` pauses every worker, not just the one that was throttled, so a
+    batch slows to what the quota allows instead of piling more requests on a 429.
+    """
+
+    def __init__(
+        self,
+        rate: float = 0.0,
+        burst: int = 1,
+        max_retries: int = 5,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0,
+    ) -> None:
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retries = 0
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._resume_at = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """Block until a request may be sent."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if self.rate > 0:
+                    self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                wait = self._resume_at - now
+                if wait <= 0:
+                    if self.rate <= 0:
+                        return
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def backoff(self, attempt: int, error: APIError) -> float:
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+        if error.retry_after is not None:
+            delay = max(delay, min(error.retry_after, self.max_delay))
+            with self._lock:
+                self._resume_at = max(self._resume_at, time.monotonic() + delay)
+        return delay
+
+    def run(
+        self, send: Callable[[], dict], label: str = "", trace: Optional[RequestTrace] = None, rate_limited: bool = True
+    ) -> dict:
+        """Call ``send()`` until it succeeds, raises a non-retryable error or retries run out.
+
+        Image downloads pass ``rate_limited=False``: they share the backoff but take no
+        rate-limit token and do not count as API attempts.
+        """
+        trace = trace or RequestTrace()
+        attempt = 0
+        while True:
+            if rate_limited:
+                with trace.span("wait"):
+                    self.acquire()
+                trace.attempts += 1
+            try:
+                return send()
+            except APIError as e:
+                if not e.retryable or attempt >= self.max_retries:
+                    raise
+                delay = self.backoff(attempt, e)
+                attempt += 1
+                with self._lock:
+                    self.retries += 1
+                    # One write under the lock: print() sends the newline separately, so
+                    # lines from concurrent workers would run together.
+                    sys.stderr.write(f"Retry {attempt}/{self.max_retries}{label} in {delay:.1f}s: {e}\n")
+                trace.retry(attempt, delay, e)
+                with trace.span("wait"):
+                    time.sleep(delay)
+
+
+def api_base_url() -> str:
+    # OPENAI_BASE_URL points the script at a proxy or a local stub (see stub_images_api.py).
+    return (os.environ.get("OPENAI_BASE_URL") or DEFAULT_BASE_URL).rstrip("/")
+
+
+def image_request_args(
     prompt: str,
     model: str,
     size: str,
@@ -84,7 +411,7 @@ def request_images(
     output_format: str = "",
     style: str = "",
 ) -> dict:
-    url = "https://api.openai.com/v1/images/generations"
+    """The JSON body ``request_images`` sends for these settings."""
     args = {
         "model": model,
         "prompt": prompt,
@@ -107,44 +434,559 @@ def request_images(
 
     if model == "dall-e-3" and style:
         args["style"] = style
+    return args
+
+
+class B64FieldWriter:
+    """Streams a JSON response, decoding its first ``b64_json`` string straight to a file.
+
+    Everything else in the body is buffered and parsed as usual, with that string
+    left empty, so memory stays at one read chunk instead of the whole image several
+    times over (raw body, str, dict, b64 str, decoded bytes).
+    """
+
+    FIELD = re.compile(rb'"b64_json"\s*:\s*"')
+    # Longest tail of buffered JSON that could hold a FIELD match split across chunks.
+    TAIL = 64
 
+    def __init__(self, handle) -> None:
+        self.handle = handle
+        self.written = 0
+        self._json = bytearray()
+        self._scan_from = 0
+        self._in_field = False
+        self._done = False
+        self._pending = b""
+
+    def feed(self, data: bytes) -> None:
+        while data:
+            if self._in_field:
+                end = data.find(b'"')
+                if end < 0:
+                    self._decode(data)
+                    return
+                self._decode(data[:end])
+                self._finish_field()
+                data = data[end:]
+                continue
+            self._json += data
+            data = b""
+            if self._done:
+                return
+            match = self.FIELD.search(self._json, self._scan_from)
+            if match is None:
+                self._scan_from = max(0, len(self._json) - self.TAIL)
+                return
+            data = bytes(self._json[match.end() :])
+            del self._json[match.end() :]
+            self._in_field = True
+
+    def _decode(self, text: bytes) -> None:
+        text = self._pending + text
+        hold = b""
+        if text.endswith(b"\\"):
+            # A JSON escape split across chunks; finish it with the next chunk.
+            text, hold = text[:-1], b"\\"
+        if b"\\" in text:
+            text = text.replace(b"\\/", b"/").replace(b"\\n", b"").replace(b"\\r", b"")
+        aligned = len(text) - len(text) % 4
+        if aligned:
+            decoded = binascii.a2b_base64(text[:aligned])
+            self.handle.write(decoded)
+            self.written += len(decoded)
+        self._pending = text[aligned:] + hold
+
+    def _finish_field(self) -> None:
+        if self._pending:
+            raise RuntimeError("Truncated b64_json in OpenAI Images API response")
+        self._in_field = False
+        self._done = True
+
+    def close(self) -> dict:
+        """The parsed response; the streamed item has ``b64_bytes`` in place of ``b64_json``."""
+        if self._in_field:
+            raise RuntimeError("Unterminated b64_json in OpenAI Images API response")
+        try:
+            payload = json.loads(self._json.decode("utf-8"))
+        except ValueError as e:
+            raise RuntimeError(f"Unexpected response: {self._json[:400].decode('utf-8', errors='replace')}") from e
+        if self._done and isinstance(payload, dict) and isinstance(payload.get("data"), list):
+            for item in payload["data"]:
+                if isinstance(item, dict) and item.get("b64_json") == "":
+                    del item["b64_json"]
+                    item["b64_bytes"] = self.written
+                    break
+        return payload
+
+
+def request_images(
+    api_key: str,
+    prompt: str,
+    model: str,
+    size: str,
+    quality: str,
+    background: str = "",
+    output_format: str = "",
+    style: str = "",
+    pool: Optional[ConnectionPool] = None,
+    scheduler: Optional[RequestScheduler] = None,
+    label: str = "",
+    image_path: Optional[Path] = None,
+    trace: Optional[RequestTrace] = None,
+) -> dict:
+    """POST one generation request and return the parsed response.
+
+    With ``image_path``, a ``b64_json`` image is decoded into that file while the
+    response streams in, and its item carries ``b64_bytes`` instead of ``b64_json``.
+    """
+    url = f"{api_base_url()}/images/generations"
+    args = image_request_args(prompt, model, size, quality, background, output_format, style)
     body = json.dumps(args).encode("utf-8")
-    req = urllib.request.Request(
-        url,
-        method="POST",
-        headers={
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json",
-        },
-        data=body,
-    )
+    headers = {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json",
+    }
+    owned_pool = ConnectionPool(per_host=1) if pool is None else None
+    pool = pool or owned_pool
+    trace = trace or RequestTrace()
+
+    def fail(status: int, response_headers: http.client.HTTPMessage, payload: bytes) -> APIError:
+        return APIError(
+            f"OpenAI Images API failed ({status}): {payload.decode('utf-8', errors='replace')}",
+            status,
+            parse_retry_after(response_headers),
+        )
+
+    def send() -> dict:
+        try:
+            with trace.span("api"):
+                status, response_headers, payload = pool.request("POST", url, body, headers)
+        except (OSError, http.client.HTTPException) as e:
+            raise APIError(f"OpenAI Images API request failed: {e}") from e
+        trace.count("response", len(payload))
+        if status >= 400:
+            raise fail(status, response_headers, payload)
+        return json.loads(payload.decode("utf-8"))
+
+    def send_streaming() -> dict:
+        # Decoding and writing the image happen between reads; they are counted as
+        # "write", the rest of the round trip as "api".
+        start = time.perf_counter()
+        writing = 0.0
+        try:
+            with pool.open("POST", url, body, headers) as resp:
+                if resp.status >= 400:
+                    payload = resp.read()
+                    trace.count("response", len(payload))
+                    raise fail(resp.status, resp.headers, payload)
+                with open(image_path, "wb") as handle:
+                    writer = B64FieldWriter(handle)
+                    while True:
+                        chunk = resp.read(RESPONSE_CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        trace.count("response", len(chunk))
+                        fed = time.perf_counter()
+                        writer.feed(chunk)
+                        writing += time.perf_counter() - fed
+        except (OSError, http.client.HTTPException) as e:
+            raise APIError(f"OpenAI Images API request failed: {e}") from e
+        except binascii.Error as e:
+            raise RuntimeError(f"Invalid b64_json in OpenAI Images API response: {e}") from e
+        finally:
+            trace.add("api", time.perf_counter() - start - writing)
+            trace.add("write", writing)
+        return writer.close()
+
+    scheduler = scheduler or RequestScheduler(max_retries=0)
     try:
-        with urllib.request.urlopen(req, timeout=300) as resp:
-            return json.loads(resp.read().decode("utf-8"))
-    except urllib.error.HTTPError as e:
-        payload = e.read().decode("utf-8", errors="replace")
-        raise RuntimeError(f"OpenAI Images API failed ({e.code}): {payload}") from e
+        return scheduler.run(send_streaming if image_path else send, label, trace)
+    finally:
+        if owned_pool is not None:
+            # One-shot call: do not leave the keep-alive socket open.
+            owned_pool.close()
 
 
-def write_gallery(out_dir: Path, items: list[dict]) -> None:
-    thumbs = "\n".join(
-        [
-            f"""
-<figure>
-  <a href="{it["file"]}"><img src="{it["file"]}" loading="lazy" /></a>
-  <figcaption>{it["prompt"]}</figcaption>
-</figure>
-""".strip()
-            for it in items
-        ]
-    )
-    html = f"""<!doctype html>
+def sniff_image(head: bytes) -> Optional[str]:
+    """The image format named by a file's first bytes: png, jpeg, webp or None."""
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if head.startswith(b"\xff\xd8\xff"):
+        return "jpeg"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    return None
+
+
+def file_digest(path: Path) -> tuple[int, str]:
+    """(size in bytes, sha256 hex) of a file."""
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, "rb") as handle:
+        while True:
+            chunk = handle.read(DOWNLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            digest.update(chunk)
+    return size, digest.hexdigest()
+
+
+class Manifest:
+    """Append-only JSON-lines record of a batch, written as each image lands.
+
+    The first line is the run plan (settings and every prompt); each finished image
+    appends ``{"index", "prompt", "file", "bytes", "sha256"}`` plus its timings
+    (see ``RequestTrace.finish``). A line is written
+    with one O_APPEND write and fsynced, so an interrupted run leaves at most a torn
+    last line, which ``load`` ignores.
+    """
+
+    NAME = "manifest.jsonl"
+
+    def __init__(self, out_dir: Path, plan: Optional[dict] = None) -> None:
+        self.path = out_dir / self.NAME
+        self._lock = threading.Lock()
+        flags = os.O_WRONLY | os.O_CREAT | os.O_APPEND
+        if plan is not None:
+            flags |= os.O_TRUNC
+        self._fd = os.open(self.path, flags, 0o644)
+        if plan is not None:
+            self._write({"type": "run", **plan})
+        elif self._torn():
+            # Terminate a torn last line so the next record starts on its own line.
+            os.write(self._fd, b"\n")
+
+    def _torn(self) -> bool:
+        with open(self.path, "rb") as handle:
+            handle.seek(0, os.SEEK_END)
+            if handle.tell() == 0:
+                return False
+            handle.seek(-1, os.SEEK_END)
+            return handle.read(1) != b"\n"
+
+    @classmethod
+    def load(cls, out_dir: Path) -> tuple[dict, dict[int, dict]]:
+        """The run plan and the latest entry per image index."""
+        plan: Optional[dict] = None
+        entries: dict[int, dict] = {}
+        with open(out_dir / cls.NAME, encoding="utf-8") as handle:
+            for line in handle:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if record.get("type") == "run":
+                    plan = record
+                elif record.get("type") == "image":
+                    entries[record["index"]] = record
+        if plan is None:
+            raise RuntimeError(f"No run plan in {out_dir / cls.NAME}")
+        return plan, entries
+
+    def add(self, index: int, prompt: str, filename: str, path: Path, **extra: Any) -> None:
+        size, sha256 = file_digest(path)
+        record = {"type": "image", "index": index, "prompt": prompt, "file": filename, "bytes": size, "sha256": sha256}
+        self._write({**record, **extra})
+
+    def _write(self, record: dict) -> None:
+        line = (json.dumps(record) + "\n").encode("utf-8")
+        with self._lock:
+            os.write(self._fd, line)
+            os.fsync(self._fd)
+
+    def close(self) -> None:
+        os.close(self._fd)
+
+
+FICLONE = 0x40049409  # linux/fs.h: _IOW(0x94, 9, int)
+
+
+def place_file(src: Path, dst: Path) -> None:
+    """Put ``src`` at ``dst`` without copying bytes when the filesystem allows it.
+
+    Tries a reflink (copy-on-write clone, Linux btrfs/xfs), then a hard link, then a
+    plain copy. ``dst`` is replaced atomically.
+    """
+    tmp = dst.with_name(f".{dst.name}.part")
+    tmp.unlink(missing_ok=True)
+    try:
+        if not sys.platform.startswith("linux"):
+            raise OSError("reflink is only tried on Linux")
+        import fcntl
+
+        with open(src, "rb") as source, open(tmp, "wb") as target:
+            fcntl.ioctl(target.fileno(), FICLONE, source.fileno())
+    except OSError:
+        tmp.unlink(missing_ok=True)
+        try:
+            os.link(src, tmp)
+        except OSError:
+            shutil.copyfile(src, tmp)
+    os.replace(tmp, dst)
+
+
+class ImageCache:
+    """Content cache of generated images, keyed by the request body, evicted LRU by bytes.
+
+    Entries are files named by key; their mtime is the last use, so the LRU order
+    survives across runs.
+    """
+
+    def __init__(self, root: Path, max_bytes: int) -> None:
+        self.root = root
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        root.mkdir(parents=True, exist_ok=True)
+        found = []
+        for path in root.iterdir():
+            if path.name.startswith("."):
+                continue
+            stat = path.stat()
+            found.append((stat.st_mtime, path.name, stat.st_size))
+        self._entries: OrderedDict[str, int] = OrderedDict((name, size) for _, name, size in sorted(found))
+        self.total = sum(self._entries.values())
+
+    @staticmethod
+    def key(request_args: dict, variant: int = 0) -> str:
+        """Hash of the request body; ``variant`` tells apart repeats of one request in a batch."""
+        canonical = json.dumps(request_args, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(f"{canonical}#{variant}".encode("utf-8")).hexdigest()
+
+    def fetch(self, key: str, dest: Path) -> bool:
+        """Place the cached image for ``key`` at ``dest``; False on a miss."""
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return False
+            self._entries.move_to_end(key)
+        path = self.root / key
+        try:
+            os.utime(path)
+            place_file(path, dest)
+        except OSError:
+            with self._lock:
+                self.total -= self._entries.pop(key, 0)
+                self.misses += 1
+            return False
+        with self._lock:
+            self.hits += 1
+        return True
+
+    def store(self, key: str, src: Path) -> None:
+        place_file(src, self.root / key)
+        size = src.stat().st_size
+        with self._lock:
+            self.total += size - self._entries.pop(key, 0)
+            self._entries[key] = size
+            while self.total > self.max_bytes and self._entries:
+                name, old_size = self._entries.popitem(last=False)
+                self.total -= old_size
+                (self.root / name).unlink(missing_ok=True)
+
+
+def parse_size(text: str) -> int:
+    """Byte count with an optional K/M/G suffix (powers of 1024)."""
+    match = re.fullmatch(r"\s*(\d+)\s*([kmg]?)i?b?\s*", text.lower())
+    if not match:
+        raise argparse.ArgumentTypeError(f"invalid size: {text!r}")
+    return int(match.group(1)) * 1024 ** " kmg".index(match.group(2) or " ")
+
+
+def percentile(ordered: list[float], q: float) -> float:
+    """Nearest-rank percentile of already sorted values."""
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+class RunStats:
+    """Span samples and byte totals across a batch, for the end-of-run summary."""
+
+    SPANS = ("queue", "wait", "api", "write", "download", "cache", "total")
+
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        self.samples: dict[str, array] = {}
+        self.bytes: dict[str, int] = {}
+        self.generated = 0
+        self.cached = 0
+        self.resumed = 0
+        self.failed = 0
+
+    def add(self, record: dict) -> None:
+        if record.get("resumed"):
+            self.resumed += 1
+            return
+        if record.get("cached"):
+            self.cached += 1
+        else:
+            self.generated += 1
+        for name, ms in record["ms"].items():
+            self.samples.setdefault(name, array("d")).append(ms)
+        for key, value in record.items():
+            if key.endswith("_bytes"):
+                self.bytes[key[: -len("_bytes")]] = self.bytes.get(key[: -len("_bytes")], 0) + value
+
+    def summary(self, retries: int) -> dict:
+        seconds = time.perf_counter() - self.started
+        images = self.generated + self.cached
+        spans = {}
+        for name in self.SPANS:
+            if name in self.samples:
+                ordered = sorted(self.samples[name])
+                spans[name] = {f"p{q}": round(percentile(ordered, q), 1) for q in (50, 95, 99)}
+        return {
+            "images": images,
+            "generated": self.generated,
+            "cached": self.cached,
+            "resumed": self.resumed,
+            "failed": self.failed,
+            "retries": retries,
+            "seconds": round(seconds, 3),
+            "images_per_minute": round(images / seconds * 60, 1) if seconds > 0 else 0.0,
+            "ms": spans,
+            "bytes": self.bytes,
+        }
+
+
+def format_bytes(size: float) -> str:
+    for unit in ("B", "KiB", "MiB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.2f} GiB"
+
+
+def render_summary(summary: dict) -> str:
+    lines = [
+        f"Summary: {summary['images']} image(s) in {summary['seconds']:.2f} s ({summary['images_per_minute']:.1f}/min);"
+        f" {summary['generated']} generated, {summary['cached']} cached, {summary['resumed']} resumed,"
+        f" {summary['failed']} failed, {summary['retries']} retries"
+    ]
+    if summary["ms"]:
+        lines.append(f"  {'span':<10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+        for name, entry in summary["ms"].items():
+            lines.append(f"  {name:<10}{entry['p50']:10.1f}{entry['p95']:10.1f}{entry['p99']:10.1f}")
+    if summary["bytes"]:
+        sizes = ", ".join(f"{name} {format_bytes(size)}" for name, size in summary["bytes"].items())
+        lines.append(f"  bytes: {sizes}")
+    return "\n".join(lines)
+
+
+class PromptsWriter:
+    """prompts.json, written item by item and renamed into place on close.
+
+    Only the open file is held, not the items, so a batch of any size writes it in
+    constant memory.
+    """
+
+    def __init__(self, out_dir: Path) -> None:
+        self.path = out_dir / "prompts.json"
+        self.count = 0
+        self._handle = open(out_dir / ".prompts.json.part", "w", encoding="utf-8")
+
+    def add(self, item: dict) -> None:
+        # Same bytes as json.dumps(items, indent=2) over the whole list.
+        self._handle.write(",\n" if self.count else "[\n")
+        self._handle.write(textwrap.indent(json.dumps(item, indent=2), "  "))
+        self.count += 1
+
+    def close(self) -> None:
+        self._handle.write("\n]" if self.count else "[]")
+        self._handle.close()
+        os.replace(self._handle.name, self.path)
+
+
+_UNSET = object()
+_pillow: Any = _UNSET
+
+
+def optional_pillow() -> Any:
+    """PIL.Image when Pillow is installed, else None; imported on first use."""
+    global _pillow
+    if _pillow is _UNSET:
+        try:
+            from PIL import Image
+        except ImportError:  # optional dependency
+            Image = None
+        _pillow = Image
+    return _pillow
+
+
+class Thumbnailer:
+    """Makes fixed-width gallery thumbnails in a worker pool.
+
+    Uses Pillow (WebP or JPEG) when installed, else macOS ``sips`` (JPEG only). With
+    neither, ``format`` is None and the gallery shows the originals.
+    """
+
+    def __init__(self, out_dir: Path, width: int, image_format: str, workers: int) -> None:
+        self.width = width
+        self.dir = out_dir / "thumbs"
+        self.format: Optional[str] = None
+        Image = optional_pillow()
+        if Image is not None:
+            from PIL import features
+
+            self.format = image_format if image_format == "jpeg" or features.check("webp") else "jpeg"
+        elif shutil.which("sips"):
+            self.format = "jpeg"
+        if self.format:
+            self.dir.mkdir(exist_ok=True)
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="thumb")
+
+    def submit(self, item: dict) -> "Future[dict]":
+        """A future for ``item`` plus a ``thumb`` path relative to the output directory."""
+        return self._pool.submit(self._thumbnail, item)
+
+    def _thumbnail(self, item: dict) -> dict:
+        if not self.format:
+            return item
+        src = self.dir.parent / item["file"]
+        dst = self.dir / f"{Path(item['file']).stem}.{'jpg' if self.format == 'jpeg' else self.format}"
+        try:
+            # A thumbnail newer than its image is current (e.g. on --resume).
+            if not dst.exists() or dst.stat().st_mtime < src.stat().st_mtime:
+                self._make(src, dst)
+        except Exception as e:  # a bad image should not take the gallery down
+            print(f"Thumbnail failed for {item['file']}: {e}", file=sys.stderr)
+            return item
+        return {**item, "thumb": dst.relative_to(self.dir.parent).as_posix()}
+
+    def _make(self, src: Path, dst: Path) -> None:
+        tmp = dst.with_name(f".{dst.name}.part")
+        Image = optional_pillow()
+        if Image is None:
+            cmd = ["sips", "--resampleWidth", str(self.width), "-s", "format", "jpeg", str(src), "--out", str(tmp)]
+            subprocess.run(cmd, check=True, capture_output=True)
+        else:
+            with Image.open(src) as image:
+                if image.width > self.width:
+                    height = max(1, round(image.height * self.width / image.width))
+                    image.draft("RGB", (self.width, height))
+                    thumb = image.resize((self.width, height), Image.LANCZOS, reducing_gap=3.0)
+                else:
+                    thumb = image.copy()
+            keep_alpha = self.format == "webp" and ("A" in thumb.mode or "transparency" in thumb.info)
+            if thumb.mode not in (("RGBA",) if keep_alpha else ("RGB", "L")):
+                thumb = thumb.convert("RGBA" if keep_alpha else "RGB")
+            thumb.save(tmp, format=self.format.upper(), quality=80)
+        os.replace(tmp, dst)
+
+    def close(self) -> None:
+        self._pool.shutdown(wait=True, cancel_futures=True)
+
+
+GALLERY_PAGE = """<!doctype html>
 <meta charset="utf-8" />
-<title>openai-image-gen</title>
+{refresh}<title>openai-image-gen{title_page}</title>
 <style>
   :root {{ color-scheme: dark; }}
   body {{ margin: 24px; font: 14px/1.4 ui-sans-serif, system-ui; background: #0b0f14; color: #e8edf2; }}
   h1 {{ font-size: 18px; margin: 0 0 16px; }}
+  nav {{ margin: 16px 0; display: flex; gap: 16px; color: #b7c2cc; }}
+  nav a {{ color: #9cd1ff; }}
   .grid {{ display: grid; grid-template-columns: repeat(auto-fill, minmax(240px, 1fr)); gap: 16px; }}
   figure {{ margin: 0; padding: 12px; border: 1px solid #1e2a36; border-radius: 14px; background: #0f1620; }}
   img {{ width: 100%; height: auto; border-radius: 10px; display: block; }}
@@ -152,17 +994,481 @@ def write_gallery(out_dir: Path, items: list[dict]) -> None:
   code {{ color: #9cd1ff; }}
 </style>
 <h1>openai-image-gen</h1>
-<p>Output: <code>{out_dir.as_posix()}</code></p>
+<p>Output: <code>{out_dir}</code></p>
+{nav}
 <div class="grid">
-{thumbs}
+{figures}
 </div>
+{nav}
 """
-    (out_dir / "index.html").write_text(html, encoding="utf-8")
+
+
+def gallery_figure(item: dict) -> str:
+    file = html.escape(item["file"])
+    thumb = html.escape(item.get("thumb") or item["file"])
+    return f"""
+<figure>
+  <a href="{file}"><img src="{thumb}" loading="lazy" /></a>
+  <figcaption>{html.escape(item["prompt"])}</figcaption>
+</figure>
+""".strip()
+
+
+class Gallery:
+    """Paged HTML gallery, updated as results arrive.
+
+    ``index.html`` is page 1, then ``page-2.html`` and so on, ``page_size`` items
+    each. Only the page being filled is held in memory and rewritten (atomically) on
+    every add; while the run lasts it reloads itself every few seconds.
+    """
+
+    REFRESH_SECONDS = 10
+
+    def __init__(self, out_dir: Path, page_size: int) -> None:
+        self.out_dir = out_dir
+        self.page_size = page_size
+        self.page = 1
+        self._items: list[dict] = []
+        self._write(has_next=False, running=True)
+
+    @staticmethod
+    def page_name(page: int) -> str:
+        return "index.html" if page == 1 else f"page-{page}.html"
+
+    def add(self, item: dict) -> None:
+        if len(self._items) == self.page_size:
+            self._write(has_next=True, running=False)
+            self.page += 1
+            self._items = []
+        self._items.append(item)
+        self._write(has_next=False, running=True)
+
+    def close(self) -> None:
+        self._write(has_next=False, running=False)
+
+    def _write(self, has_next: bool, running: bool) -> None:
+        links = []
+        if self.page > 1:
+            links.append(f'<a href="{self.page_name(self.page - 1)}">&larr; Previous</a>')
+        links.append(f"<span>Page {self.page}</span>")
+        if has_next:
+            links.append(f'<a href="{self.page_name(self.page + 1)}">Next &rarr;</a>')
+        text = GALLERY_PAGE.format(
+            refresh=f'<meta http-equiv="refresh" content="{self.REFRESH_SECONDS}" />\n' if running else "",
+            title_page=f" (page {self.page})" if self.page > 1 else "",
+            out_dir=html.escape(self.out_dir.as_posix()),
+            nav=f"<nav>{' '.join(links)}</nav>",
+            figures="\n".join(gallery_figure(item) for item in self._items),
+        )
+        path = self.out_dir / self.page_name(self.page)
+        tmp = path.with_name(f".{path.name}.part")
+        tmp.write_text(text, encoding="utf-8")
+        os.replace(tmp, path)
+
+
+JOB_FIELDS = ("model", "size", "quality", "background", "output_format", "style")
+
+
+def check_job_row(source: str, row: dict) -> dict:
+    """A prompts-file row with empty cells dropped; raises RuntimeError naming ``source``."""
+    if None in row:
+        raise RuntimeError(f"{source}: more cells than header columns")
+    unknown = sorted(set(row) - {"prompt", *JOB_FIELDS})
+    if unknown:
+        raise RuntimeError(f"{source}: unknown field(s): {', '.join(unknown)}")
+    row = {key: value for key, value in row.items() if value not in (None, "")}
+    if any(not isinstance(value, str) for value in row.values()):
+        raise RuntimeError(f"{source}: values must be strings")
+    if not row.get("prompt", "").strip():
+        raise RuntimeError(f"{source}: missing prompt")
+    return row
+
+
+def read_prompts_file(path: Path) -> Iterator[dict]:
+    """Rows of a JSONL (object or string per line) or CSV (header row) jobs file, read lazily."""
+    with open(path, encoding="utf-8", newline="") as handle:
+        if path.suffix.lower() == ".csv":
+            reader = csv.DictReader(handle)
+            for row in reader:
+                yield check_job_row(f"{path}:{reader.line_num}", row)
+            return
+        for line_no, line in enumerate(handle, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                raise RuntimeError(f"{path}:{line_no}: invalid JSON: {e}") from e
+            if isinstance(row, str):
+                row = {"prompt": row}
+            if not isinstance(row, dict):
+                raise RuntimeError(f"{path}:{line_no}: expected an object or a string")
+            yield check_job_row(f"{path}:{line_no}", row)
+
+
+DEFAULT_JOB = {"model": "gpt-image-1", "size": "", "quality": "", "background": "", "output_format": "", "style": ""}
+
+
+def resolve_job(row: dict, index: int, defaults: Optional[dict] = None) -> dict:
+    """A complete job: row values over ``defaults`` over DEFAULT_JOB, then model defaults.
+
+    Empty values count as unset. Resolving a resolved job changes nothing.
+    """
+    job = {**DEFAULT_JOB, **(defaults or {})}
+    job.update((key, value) for key, value in row.items() if value not in (None, ""))
+    job.setdefault("index", index)
+    # Apply model-specific defaults if not specified
+    default_size, default_quality = get_model_defaults(job["model"])
+    job["size"] = job["size"] or default_size
+    job["quality"] = job["quality"] or default_quality
+    # Determine file extension based on output format
+    if job["model"].startswith("gpt-image") and job["output_format"]:
+        job["file_ext"] = job["output_format"]
+    else:
+        job["file_ext"] = "png"
+    return job
+
+
+def iter_jobs(plan: dict) -> Iterator[dict]:
+    """Numbered jobs for a run plan: row overrides on top of the plan's settings, model defaults last."""
+    defaults = {field: plan[field] for field in JOB_FIELDS}
+    if plan.get("prompts_file"):
+        rows = read_prompts_file(Path(plan["prompts_file"]))
+    else:
+        rows = ({"prompt": prompt} for prompt in plan["prompts"])
+    for idx, row in enumerate(rows, start=1):
+        yield resolve_job(row, idx, defaults)
+
+
+class JobResult(NamedTuple):
+    """Outcome of one job: ``item`` is the prompts.json entry, or None when ``error`` is set."""
+
+    index: int
+    prompt: str
+    item: Optional[dict]
+    record: dict
+    error: Optional[str] = None
+
+
+class PendingDownload(NamedTuple):
+    """A job whose API call answered with a ``url``; ``ImageGenerator.download`` fetches it."""
+
+    job: dict
+    trace: RequestTrace
+    url: str
+    filename: str
+    queued: float
+
+
+class ImageGenerator:
+    """Requests, decodes and writes single jobs into ``out_dir``; shared by a batch's workers.
+
+    Optional parts: a ``cache`` (ImageCache), a ``manifest`` to record each image,
+    ``done`` manifest entries to skip on resume and an ``events`` log. URL images are
+    fetched in a separate stage; ``downloads`` runs up to ``download_concurrency`` of them.
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        out_dir: Path,
+        pool: Optional[ConnectionPool] = None,
+        scheduler: Optional[RequestScheduler] = None,
+        cache: Optional[ImageCache] = None,
+        manifest: Optional[Manifest] = None,
+        events: Optional[EventLog] = None,
+        done: Optional[dict[int, dict]] = None,
+        download_concurrency: int = 4,
+    ) -> None:
+        self.api_key = api_key
+        self.out_dir = out_dir
+        self.pool = pool or ConnectionPool()
+        self.scheduler = scheduler or RequestScheduler()
+        self.cache = cache
+        self.manifest = manifest
+        self.events = events
+        self.done = done or {}
+        self.total = 0
+        self.download_concurrency = download_concurrency
+        self.downloads = ThreadPoolExecutor(max_workers=download_concurrency, thread_name_prefix="download")
+        self._repeats: dict[bytes, int] = {}
+
+    def prepare(self, job: dict) -> None:
+        """Call once per job, in job order, before ``run``."""
+        if self.cache and "cache_key" not in job:
+            # Repeats of one request in a batch are separate images, so each repeat
+            # gets its own cache key.
+            request_args = image_request_args(*(job[field] for field in ("prompt", *JOB_FIELDS)))
+            digest = hashlib.sha256(json.dumps(request_args, sort_keys=True).encode("utf-8")).digest()
+            variant = self._repeats.get(digest, 0)
+            self._repeats[digest] = variant + 1
+            job["cache_key"] = ImageCache.key(request_args, variant)
+
+    def run(self, job: dict, submitted: Optional[float] = None) -> JobResult:
+        """Produce one image (blocking); failures come back as ``JobResult.error``."""
+        step = self.start(job, submitted)
+        return self.download(step) if isinstance(step, PendingDownload) else step
+
+    def start(self, job: dict, submitted: Optional[float] = None) -> Union[JobResult, PendingDownload]:
+        """Resume check, cache lookup and the API call; a ``url`` answer is left for ``download``."""
+        idx, prompt = job["index"], job["prompt"]
+        trace = RequestTrace(idx, self.events, submitted)
+        trace.add("queue", time.perf_counter() - trace.started)
+        item = self.finished(job)
+        if item:
+            self.emit("done", index=idx, prompt=prompt, file=item["file"], resumed=True)
+            return JobResult(idx, prompt, item, {"resumed": True})
+        try:
+            return self.generate(job, trace)
+        except Exception as e:
+            # Any per-job failure (bad response, full disk, unwritable cache) fails
+            # this job only; the batch goes on.
+            return self.failed(job, trace, e)
+
+    def download(self, pending: PendingDownload) -> JobResult:
+        """Fetch and check a URL image (blocking), then write it like any other."""
+        job, trace, filename = pending.job, pending.trace, pending.filename
+        trace.add("queue", time.perf_counter() - pending.queued)
+        partial = self.partial_path(filename)
+        try:
+            self.scheduler.run(lambda: self.fetch(pending.url, partial, trace), self.label(job), trace, rate_limited=False)
+            return self.complete(job, trace, filename, partial)
+        except Exception as e:
+            partial.unlink(missing_ok=True)
+            return self.failed(job, trace, RuntimeError(f"Failed to download image from {pending.url}: {e}"))
+
+    def fetch(self, url: str, partial: Path, trace: RequestTrace) -> dict:
+        """One download attempt into ``partial``; a dropped transfer resumes from its end next time.
+
+        The file must reach the size the server announced and start with PNG, JPEG or
+        WebP magic bytes, so an error page or a cut-off body never becomes an image.
+        """
+        before = partial.stat().st_size if partial.exists() else 0
+        try:
+            with trace.span("download"):
+                _, total = self.pool.download(url, partial)
+        except (OSError, http.client.HTTPException) as e:
+            raise APIError(f"{type(e).__name__}: {e}") from e
+        finally:
+            # Count what arrived, including the part of a transfer that broke off.
+            after = partial.stat().st_size if partial.exists() else 0
+            trace.count("download", max(0, after - before))
+        size = partial.stat().st_size
+        if total is not None and size != total:
+            raise APIError(f"got {size} of {total} bytes")
+        with open(partial, "rb") as handle:
+            kind = sniff_image(handle.read(16))
+        if kind is None:
+            raise RuntimeError(f"not a PNG, JPEG or WebP image ({size} bytes)")
+        return {"bytes": size, "format": kind}
+
+    def emit(self, event: str, **fields: Any) -> None:
+        if self.events:
+            self.events.emit(event, **fields)
+
+    def label(self, job: dict) -> str:
+        return f" [{job['index']}/{self.total}]" if self.total else f" [{job['index']}]"
+
+    def partial_path(self, filename: str) -> Path:
+        # Write to a temp name and rename: the old file may be a link into the cache.
+        return self.out_dir / f".{filename}.part"
+
+    def failed(self, job: dict, trace: RequestTrace, error: Exception) -> JobResult:
+        message = str(error) if isinstance(error, RuntimeError) else f"{type(error).__name__}: {error}"
+        self.emit("failed", index=job["index"], prompt=job["prompt"], error=message)
+        return JobResult(job["index"], job["prompt"], None, trace.finish(), message)
+
+    def finished(self, job: dict) -> Optional[dict]:
+        """The manifest entry for an image already on disk with the recorded size and hash."""
+        entry = self.done.get(job["index"])
+        if entry is None or entry["prompt"] != job["prompt"]:
+            return None
+        path = self.out_dir / entry["file"]
+        try:
+            if path.stat().st_size != entry["bytes"] or file_digest(path)[1] != entry["sha256"]:
+                return None
+        except OSError:
+            return None
+        return {"prompt": job["prompt"], "file": entry["file"]}
+
+    def record(self, job: dict, filename: str, filepath: Path, record: dict) -> JobResult:
+        if self.manifest:
+            self.manifest.add(job["index"], job["prompt"], filename, filepath, **record)
+        self.emit("done", index=job["index"], prompt=job["prompt"], file=filename, **record)
+        return JobResult(job["index"], job["prompt"], {"prompt": job["prompt"], "file": filename}, record)
+
+    def generate(self, job: dict, trace: RequestTrace) -> Union[JobResult, PendingDownload]:
+        idx, prompt = job["index"], job["prompt"]
+        filename = f"{idx:03d}-{slugify(prompt)[:40]}.{job['file_ext']}"
+        filepath = self.out_dir / filename
+        start = time.perf_counter()
+        if self.cache and self.cache.fetch(job["cache_key"], filepath):
+            trace.add("cache", time.perf_counter() - start)
+            return self.record(job, filename, filepath, {**trace.finish(), "cached": True})
+
+        # b64_json images are decoded into the partial file as the response streams in.
+        partial = self.partial_path(filename)
+        try:
+            res = request_images(
+                self.api_key,
+                prompt,
+                job["model"],
+                job["size"],
+                job["quality"],
+                job["background"],
+                job["output_format"],
+                job["style"],
+                pool=self.pool,
+                scheduler=self.scheduler,
+                label=self.label(job),
+                image_path=partial,
+                trace=trace,
+            )
+            items = res.get("data") if isinstance(res, dict) else None
+            if not isinstance(items, list) or not items or not isinstance(items[0], dict):
+                raise RuntimeError(f"Unexpected response: {json.dumps(res)[:400]}")
+            data = items[0]
+            image_url = data.get("url")
+            if not data.get("b64_bytes") and not image_url:
+                raise RuntimeError(f"Unexpected response: {json.dumps(res)[:400]}")
+        except BaseException:
+            partial.unlink(missing_ok=True)
+            raise
+        if not data.get("b64_bytes"):
+            # The streamed response left an empty partial; the download starts afresh.
+            partial.unlink(missing_ok=True)
+            return PendingDownload(job, trace, image_url, filename, time.perf_counter())
+        return self.complete(job, trace, filename, partial)
+
+    def complete(self, job: dict, trace: RequestTrace, filename: str, partial: Path) -> JobResult:
+        filepath = self.out_dir / filename
+        try:
+            with trace.span("write"):
+                os.replace(partial, filepath)
+                if self.cache:
+                    self.cache.store(job["cache_key"], filepath)
+            return self.record(job, filename, filepath, trace.finish())
+        except BaseException:
+            partial.unlink(missing_ok=True)
+            raise
+
+    def close(self) -> None:
+        self.downloads.shutdown(wait=True, cancel_futures=True)
+        self.pool.close()
+
+
+async def generate_many(
+    jobs: Iterable[dict],
+    generator: ImageGenerator,
+    concurrency: int = 4,
+    queue_depth: int = 0,
+    ordered: bool = False,
+) -> AsyncIterator[JobResult]:
+    """Run jobs on ``concurrency`` worker threads and yield a JobResult per job.
+
+    Jobs are dicts with a ``prompt`` and optional JOB_FIELDS overrides; ``jobs`` is
+    read lazily and at most ``queue_depth`` (default 2x concurrency plus the
+    generator's download_concurrency) are in flight. URL images are fetched on the
+    generator's download pool, so the next API call does not wait for them.
+    Results come as they finish, or in job order with ``ordered=True``. The event
+    loop stays free while images are requested, decoded and written.
+
+        async for result in generate_many([{"prompt": "a red fox"}], ImageGenerator(key, out)):
+            print(result.item or result.error)
+    """
+    loop = asyncio.get_running_loop()
+    depth = queue_depth or 2 * concurrency + generator.download_concurrency
+    executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="generate")
+
+    async def one(job: dict, submitted: float) -> JobResult:
+        step = await loop.run_in_executor(executor, generator.start, job, submitted)
+        if isinstance(step, PendingDownload):
+            return await loop.run_in_executor(generator.downloads, generator.download, step)
+        return step
+
+    in_flight: deque = deque()
+    rows = enumerate(jobs, start=1)
+    try:
+        while True:
+            for idx, row in rows:
+                job = resolve_job(row, idx)
+                generator.prepare(job)
+                in_flight.append(asyncio.ensure_future(one(job, time.perf_counter())))
+                if len(in_flight) >= depth:
+                    break
+            if not in_flight:
+                return
+            if ordered:
+                yield await in_flight.popleft()
+                continue
+            finished, _ = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+            for future in [future for future in in_flight if future in finished]:
+                in_flight.remove(future)
+                yield future.result()
+    finally:
+        # On an early close or cancel, drop queued jobs and let running ones finish in
+        # the background: waiting here would block the event loop for their HTTP calls.
+        for future in in_flight:
+            future.cancel()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+async def run_batch(args: argparse.Namespace, generator: ImageGenerator, jobs: Iterable[dict]) -> RunStats:
+    """The CLI batch: generate_many in job order, feeding the log, prompts.json and the gallery.
+
+    Results are taken in job order, so file names, prompts.json and the log are the
+    same for any --concurrency. A job that still fails after its retries is reported
+    and skipped; the rest of the batch is kept.
+    """
+    out_dir = generator.out_dir
+    prompts_out = PromptsWriter(out_dir)
+    gallery = Gallery(out_dir, args.gallery_page_size)
+    thumbnailer = Thumbnailer(out_dir, args.thumb_width, args.thumb_format, os.cpu_count() or 1)
+    depth = args.queue_depth or 2 * args.concurrency + generator.download_concurrency
+    thumbs: deque = deque()
+    stats = RunStats()
+    if generator.events:
+        generator.events.emit(
+            "start", out_dir=out_dir.as_posix(), total=generator.total, concurrency=args.concurrency, resume=bool(args.resume)
+        )
+
+    async def publish(block: bool) -> None:
+        """Add finished thumbnails to the gallery in job order."""
+        while thumbs and (block or thumbs[0].done() or len(thumbs) > depth):
+            # Awaited, so a thumbnail still rendering does not stall the event loop.
+            gallery.add(await asyncio.wrap_future(thumbs.popleft()))
+
+    try:
+        results = generate_many(jobs, generator, args.concurrency, depth, ordered=True)
+        async for result in results:
+            label = f"[{result.index}/{generator.total}]"
+            if result.error:
+                stats.failed += 1
+                print(f"{label} {result.prompt}")
+                print(f"Failed {label}: {result.error}", file=sys.stderr)
+                continue
+            stats.add(result.record)
+            print(f"{label} {result.prompt}" + (" (already done)" if result.record.get("resumed") else ""))
+            prompts_out.add(result.item)
+            thumbs.append(thumbnailer.submit(result.item))
+            await publish(block=False)
+        await publish(block=True)
+    finally:
+        # Also on an error: prompts.json gets what finished and the gallery stops reloading.
+        thumbnailer.close()
+        prompts_out.close()
+        gallery.close()
+    return stats
 
 
 def main() -> int:
     ap = argparse.ArgumentParser(description="Generate images via OpenAI Images API.")
     ap.add_argument("--prompt", help="Single prompt. If omitted, random prompts are generated.")
+    ap.add_argument(
+        "--prompts-file",
+        default="",
+        help="JSONL or CSV of jobs: a prompt plus optional model/size/quality/background/output_format/style overrides.",
+    )
     ap.add_argument("--count", type=int, default=8, help="How many images to generate.")
     ap.add_argument("--model", default="gpt-image-1", help="Image model id.")
     ap.add_argument("--size", default="", help="Image size (e.g. 1024x1024, 1536x1024). Defaults based on model if not specified.")
@@ -171,68 +1477,131 @@ def main() -> int:
     ap.add_argument("--output-format", default="", help="Output format (GPT models only): png, jpeg, or webp.")
     ap.add_argument("--style", default="", help="Image style (dall-e-3 only): vivid or natural.")
     ap.add_argument("--out-dir", default="", help="Output directory (default: ./tmp/openai-image-gen-<ts>).")
+    ap.add_argument("--concurrency", type=int, default=1, help="Requests in flight at once (default: 1).")
+    ap.add_argument(
+        "--connections-per-host",
+        type=int,
+        default=0,
+        help="Keep-alive connections per host shared by API calls and downloads (default: --concurrency plus --download-concurrency).",
+    )
+    ap.add_argument(
+        "--download-concurrency",
+        type=int,
+        default=4,
+        help="URL images (dall-e models) downloaded at once, apart from API calls (default: 4).",
+    )
+    ap.add_argument(
+        "--queue-depth",
+        type=int,
+        default=0,
+        help="Jobs read ahead of the oldest unfinished one (default: 2x --concurrency plus --download-concurrency).",
+    )
+    ap.add_argument("--rate-limit", type=float, default=0, help="Max requests per minute (default: unlimited).")
+    ap.add_argument("--max-retries", type=int, default=5, help="Retries for 429/5xx/connection errors (default: 5).")
+    ap.add_argument("--gallery-page-size", type=int, default=100, help="Images per gallery page (default: 100).")
+    ap.add_argument("--thumb-width", type=int, default=320, help="Gallery thumbnail width in pixels (default: 320).")
+    ap.add_argument(
+        "--thumb-format",
+        choices=["webp", "jpeg"],
+        default="webp",
+        help="Gallery thumbnail format (default: webp; needs Pillow, else JPEG via macOS sips).",
+    )
+    ap.add_argument("--cache-dir", default="", help="Reuse images for identical requests from this directory.")
+    ap.add_argument(
+        "--cache-max-bytes",
+        type=parse_size,
+        default=parse_size("1G"),
+        help="Evict least recently used cache entries above this size, e.g. 500M (default: 1G).",
+    )
+    ap.add_argument("--events", default="", help="Append JSON-lines progress events to this file (follow with tail -f).")
+    ap.add_argument(
+        "--resume",
+        metavar="OUT_DIR",
+        default="",
+        help="Finish an interrupted batch: reuse its manifest settings and prompts, regenerate only missing images.",
+    )
     args = ap.parse_args()
+    if args.concurrency < 1 or args.download_concurrency < 1:
+        ap.error("--concurrency and --download-concurrency must be at least 1")
+    if args.rate_limit < 0 or args.max_retries < 0:
+        ap.error("--rate-limit and --max-retries must not be negative")
+    if args.queue_depth < 0:
+        ap.error("--queue-depth must not be negative")
+    if args.gallery_page_size < 1 or args.thumb_width < 1:
+        ap.error("--gallery-page-size and --thumb-width must be at least 1")
+    if args.prompt and args.prompts_file:
+        ap.error("--prompt and --prompts-file are mutually exclusive")
 
     api_key = (os.environ.get("OPENAI_API_KEY") or "").strip()
     if not api_key:
         print("Missing OPENAI_API_KEY", file=sys.stderr)
         return 2
 
-    # Apply model-specific defaults if not specified
-    default_size, default_quality = get_model_defaults(args.model)
-    size = args.size or default_size
-    quality = args.quality or default_quality
-
-    count = args.count
-    if args.model == "dall-e-3" and count > 1:
-        print(f"Warning: dall-e-3 only supports generating 1 image at a time. Reducing count from {count} to 1.", file=sys.stderr)
-        count = 1
-
-    out_dir = Path(args.out_dir).expanduser() if args.out_dir else default_out_dir()
-    out_dir.mkdir(parents=True, exist_ok=True)
+    if args.resume:
+        out_dir = Path(args.resume).expanduser()
+        try:
+            plan, done = Manifest.load(out_dir)
+        except (OSError, RuntimeError) as e:
+            print(f"Cannot resume {out_dir}: {e}", file=sys.stderr)
+            return 2
+    else:
+        plan = {field: getattr(args, field) for field in JOB_FIELDS}
+        if args.prompts_file:
+            plan["prompts_file"] = str(Path(args.prompts_file).expanduser().resolve())
+        else:
+            count = args.count
+            if args.model == "dall-e-3" and count > 1:
+                print(f"Warning: dall-e-3 only supports generating 1 image at a time. Reducing count from {count} to 1.", file=sys.stderr)
+                count = 1
+            plan["prompts"] = [args.prompt] * count if args.prompt else pick_prompts(count)
+        done = {}
 
-    prompts = [args.prompt] * count if args.prompt else pick_prompts(count)
+    # One validating pass up front: bad rows fail before any request is paid for,
+    # and the progress lines get a total. Rows are read again lazily below.
+    try:
+        total = sum(1 for _ in iter_jobs(plan))
+    except (OSError, RuntimeError) as e:
+        print(f"Invalid prompts file: {e}", file=sys.stderr)
+        return 2
 
-    # Determine file extension based on output format
-    if args.model.startswith("gpt-image") and args.output_format:
-        file_ext = args.output_format
+    if args.resume:
+        manifest = Manifest(out_dir)
     else:
-        file_ext = "png"
-
-    items: list[dict] = []
-    for idx, prompt in enumerate(prompts, start=1):
-        print(f"[{idx}/{len(prompts)}] {prompt}")
-        res = request_images(
-            api_key,
-            prompt,
-            args.model,
-            size,
-            quality,
-            args.background,
-            args.output_format,
-            args.style,
-        )
-        data = res.get("data", [{}])[0]
-        image_b64 = data.get("b64_json")
-        image_url = data.get("url")
-        if not image_b64 and not image_url:
-            raise RuntimeError(f"Unexpected response: {json.dumps(res)[:400]}")
-
-        filename = f"{idx:03d}-{slugify(prompt)[:40]}.{file_ext}"
-        filepath = out_dir / filename
-        if image_b64:
-            filepath.write_bytes(base64.b64decode(image_b64))
-        else:
-            try:
-                urllib.request.urlretrieve(image_url, filepath)
-            except urllib.error.URLError as e:
-                raise RuntimeError(f"Failed to download image from {image_url}: {e}") from e
+        out_dir = Path(args.out_dir).expanduser() if args.out_dir else default_out_dir()
+        out_dir.mkdir(parents=True, exist_ok=True)
+        manifest = Manifest(out_dir, plan)
 
-        items.append({"prompt": prompt, "file": filename})
+    events = EventLog(Path(args.events).expanduser()) if args.events else None
+    generator = ImageGenerator(
+        api_key,
+        out_dir,
+        pool=ConnectionPool(per_host=args.connections_per_host or args.concurrency + args.download_concurrency),
+        scheduler=RequestScheduler(rate=args.rate_limit / 60, burst=args.concurrency, max_retries=args.max_retries),
+        cache=ImageCache(Path(args.cache_dir).expanduser(), args.cache_max_bytes) if args.cache_dir else None,
+        manifest=manifest,
+        events=events,
+        done=done,
+        download_concurrency=args.download_concurrency,
+    )
+    generator.total = total
+    try:
+        stats = asyncio.run(run_batch(args, generator, iter_jobs(plan)))
+    finally:
+        generator.close()
+        manifest.close()
 
-    (out_dir / "prompts.json").write_text(json.dumps(items, indent=2), encoding="utf-8")
-    write_gallery(out_dir, items)
+    summary = stats.summary(generator.scheduler.retries)
+    if events:
+        events.emit("end", **summary)
+        events.close()
     print(f"\nWrote: {(out_dir / 'index.html').as_posix()}")
+    print(render_summary(summary), file=sys.stderr)
+    if generator.cache:
+        cache = generator.cache
+        print(f"Cache: {cache.hits} hit(s), {cache.misses} miss(es), {cache.total} bytes.", file=sys.stderr)
+    if stats.failed:
+        print(f"{stats.failed} of {total} image(s) failed; rerun with --resume {out_dir.as_posix()}", file=sys.stderr)
+        return 1
     return 0
 
 
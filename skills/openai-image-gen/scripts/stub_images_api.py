@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the OpenAI Images API, for exercising gen.py without a key.
+
+Usage:
+    python3 stub_images_api.py --port 8089 --latency 0.5
+    python3 stub_images_api.py --certfile cert.pem --keyfile key.pem   # HTTPS
+    OPENAI_BASE_URL=http://127.0.0.1:8089/v1 OPENAI_API_KEY=stub python3 gen.py --count 8
+
+gpt-image models get `b64_json`; dall-e models get a `url` served by the stub.
+`--script 429,500,200` answers the first generation requests with those statuses
+(429s carry `Retry-After: --retry-after`); later requests succeed. Image URLs honour
+`Range: bytes=N-`; `--truncate 2` cuts the first two downloads off halfway.
+"""
+
+import argparse
+import base64
+import json
+import random
+import re
+import socket
+import ssl
+import struct
+import sys
+import threading
+import time
+import zlib
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+
+def make_png(width: int, height: int, seed: int = 0) -> bytes:
+    """An RGB noise PNG; stored (level 0) deflate keeps it large and fast to build."""
+    rng = random.Random(seed)
+    row_bytes = width * 3
+    raw = b"".join(b"\x00" + rng.randbytes(row_bytes) for _ in range(height))
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(raw, 0)) + chunk(b"IEND", b"")
+
+
+class StubImagesAPI:
+    """Threaded HTTP server; ``start()`` returns the base URL to use as OPENAI_BASE_URL."""
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0.0,
+        image_size: str = "64x64",
+        certfile: Optional[str] = None,
+        keyfile: Optional[str] = None,
+        script: Optional[list[int]] = None,
+        retry_after: Optional[float] = None,
+        jitter: float = 0.0,
+        download_latency: float = 0.0,
+        truncate: int = 0,
+    ) -> None:
+        width, height = (int(part) for part in image_size.lower().split("x"))
+        self.latency = latency
+        self.jitter = jitter
+        self.download_latency = download_latency
+        self.truncate = truncate
+        self.image = make_png(width, height)
+        self.image_b64 = base64.b64encode(self.image).decode("ascii")
+        self.script = deque(script or [])
+        self.retry_after = retry_after
+        self.requests = 0
+        self.failures = 0
+        self.downloads = 0
+        self.ranges = 0
+        self.connections = 0
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self.scheme = "http"
+        if certfile:
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(certfile, keyfile)
+            self.server.socket = context.wrap_socket(self.server.socket, server_side=True)
+            self.scheme = "https"
+        self._thread: threading.Thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"{self.scheme}://{host}:{port}/v1"
+
+    def start(self) -> str:
+        self._thread.start()
+        return self.base_url
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self) -> "StubImagesAPI":
+        self.start()
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.stop()
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "failures": self.failures,
+            "downloads": self.downloads,
+            "ranges": self.ranges,
+            "connections": self.connections,
+        }
+
+    def next_status(self) -> int:
+        with self._lock:
+            return self.script.popleft() if self.script else 200
+
+    def cut_short(self) -> bool:
+        with self._lock:
+            if self.truncate <= 0:
+                return False
+            self.truncate -= 1
+            return True
+
+    def count(self, field: str) -> None:
+        with self._lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    def _handler(self) -> type:
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self) -> None:
+                super().setup()
+                # Headers and body go out in separate writes; without this, Nagle plus
+                # delayed ACKs add ~40 ms to every keep-alive response.
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                stub.count("connections")
+
+            def do_POST(self) -> None:
+                length = int(self.headers.get("Content-Length") or 0)
+                try:
+                    args = json.loads(self.rfile.read(length) or b"{}")
+                except ValueError:
+                    self._send_json(400, {"error": {"message": "invalid JSON body"}})
+                    return
+                if self.path.rstrip("/") != "/v1/images/generations":
+                    self._send_json(404, {"error": {"message": f"unknown endpoint {self.path}"}})
+                    return
+                if not self.headers.get("Authorization", "").startswith("Bearer "):
+                    self._send_json(401, {"error": {"message": "missing bearer token"}})
+                    return
+                status = stub.next_status()
+                if status != 200:
+                    stub.count("failures")
+                    headers = {}
+                    if status == 429 and stub.retry_after is not None:
+                        headers["Retry-After"] = f"{stub.retry_after:g}"
+                    self._send_json(status, {"error": {"message": f"scripted {status}"}}, headers)
+                    return
+                stub.count("requests")
+                if stub.latency or stub.jitter:
+                    time.sleep(stub.latency + random.uniform(0, stub.jitter))
+                if str(args.get("model", "")).startswith("dall-e"):
+                    host = self.headers.get("Host") or "%s:%d" % self.server.server_address[:2]
+                    item = {"url": f"{stub.scheme}://{host}/files/{stub.requests}.png"}
+                else:
+                    item = {"b64_json": stub.image_b64}
+                self._send_json(200, {"created": int(time.time()), "data": [item]})
+
+            def do_GET(self) -> None:
+                if self.path.startswith("/files/"):
+                    stub.count("downloads")
+                    if stub.download_latency:
+                        time.sleep(stub.download_latency)
+                    self._send_file(stub.image)
+                elif self.path == "/stats":
+                    self._send_json(200, stub.stats())
+                else:
+                    self._send_json(404, {"error": {"message": f"unknown path {self.path}"}})
+
+            def _send_file(self, body: bytes) -> None:
+                status, headers, start = 200, {"Accept-Ranges": "bytes"}, 0
+                match = re.match(r"bytes=(\d+)-$", self.headers.get("Range", ""))
+                if match:
+                    start = int(match.group(1))
+                    if start >= len(body):
+                        self._send(416, b"", "image/png", {"Content-Range": f"bytes */{len(body)}"})
+                        return
+                    stub.count("ranges")
+                    status = 206
+                    headers["Content-Range"] = f"bytes {start}-{len(body) - 1}/{len(body)}"
+                part = body[start:]
+                if stub.cut_short():
+                    # Announce the full length, send half and hang up.
+                    self.close_connection = True
+                    self._send(status, part, "image/png", headers, limit=len(part) // 2)
+                else:
+                    self._send(status, part, "image/png", headers)
+
+            def _send_json(self, status: int, payload: dict, headers: Optional[dict] = None) -> None:
+                self._send(status, json.dumps(payload).encode("utf-8"), "application/json", headers)
+
+            def _send(
+                self, status: int, body: bytes, content_type: str, headers: Optional[dict] = None, limit: Optional[int] = None
+            ) -> None:
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body if limit is None else body[:limit])
+
+            def log_message(self, format: str, *args: object) -> None:
+                pass
+
+        return Handler
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Serve a local stand-in for the OpenAI Images API.")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8089, help="Port (0 picks a free one).")
+    ap.add_argument("--latency", type=float, default=0.5, help="Seconds each generation request takes.")
+    ap.add_argument("--jitter", type=float, default=0.0, help="Up to this many extra random seconds per request.")
+    ap.add_argument("--download-latency", type=float, default=0.0, help="Seconds before each image download starts.")
+    ap.add_argument("--truncate", type=int, default=0, help="Cut this many image downloads off halfway.")
+    ap.add_argument("--image-size", default="64x64", help="WIDTHxHEIGHT of the returned noise PNG.")
+    ap.add_argument("--certfile", help="PEM certificate; serves HTTPS when set.")
+    ap.add_argument("--keyfile", help="PEM private key (if not bundled in --certfile).")
+    ap.add_argument("--script", default="", help="Comma-separated statuses for the first generation requests.")
+    ap.add_argument("--retry-after", type=float, help="Retry-After seconds sent with scripted 429s.")
+    args = ap.parse_args()
+
+    script = [int(status) for status in args.script.split(",") if status.strip()]
+    stub = StubImagesAPI(
+        args.host,
+        args.port,
+        args.latency,
+        args.image_size,
+        args.certfile,
+        args.keyfile,
+        script=script,
+        retry_after=args.retry_after,
+        jitter=args.jitter,
+        download_latency=args.download_latency,
+        truncate=args.truncate,
+    )
+    print(f"OPENAI_BASE_URL={stub.base_url}", file=sys.stderr, flush=True)
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stub.server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())